@@ -1,11 +1,44 @@
+import importlib
 import os
 from flask import Flask
 from . import (  # `.` means you are importing from the same directory i.e. same package
+    api,
     db,
     auth,
-    blog
+    blog,
+    cache,
+    feeds,
+    hashing,
+    jobs,
+    listing,
+    queryplan,
+    ratelimit,
+    rendering,
+    search,
+    sessions,
+    templating
 )
-from flask_session.__init__ import Session
+
+_LAZY_COMMANDS = (  # `(name, module)` of the commands whose module only the command line needs [see `LazyCommand`]
+    ('export-posts', 'awokogbon.transfer'),
+    ('import-posts', 'awokogbon.transfer'),
+    ('export-users', 'awokogbon.transfer'),
+    ('import-users', 'awokogbon.transfer'),
+    ('profile-startup', 'awokogbon.profiling'),
+)
+
+
+# LazyCommand:
+#   - stands in for a `flask` command, importing its module when the command is first used [not by `create_app()`]
+#   - every attribute is read from the module's `<name>_command`, like `sessions.LazySessionInterface` reads its backend's
+class LazyCommand(object):
+    def __init__(self, name, module):
+        self.name = name
+        self._module = module
+
+    def __getattr__(self, name):
+        command = getattr(importlib.import_module(self._module), self.name.replace('-', '_') + '_command')
+        return getattr(command, name)
 
 
 def create_app(test_config=None):  # application factory
@@ -17,14 +50,72 @@ def create_app(test_config=None):  # application factory
     # initialize default configurations for the newly instantiated app
     app.config.from_mapping(
         SECRET_KEY=os.getenv("SECRET_KEY"),  # secure random phrase used to sign session cookies et al.
-        DATABASE=os.path.join(app.instance_path, 'blogdatabase.sqlite')  # define path for database upon autogeneration of the db
+        DATABASE=os.path.join(app.instance_path, 'blogdatabase.sqlite'),  # define path for database upon autogeneration of the db
+        POSTS_PER_PAGE=10,  # number of posts shown per index page
+        EXCERPT_LENGTH=280,  # characters of plain text kept as each post's listing excerpt
+        DB_POOL_SIZE=5,  # maximum number of database connections held open per process
+        DB_POOL_TIMEOUT=30.0,  # seconds a request waits for a free pooled connection before `PoolTimeout` is raised
+        DB_JOURNAL_MODE='WAL',  # lets readers run concurrently with the (single) writer
+        DB_SYNCHRONOUS='NORMAL',  # durable across application crashes under WAL, without an fsync per commit
+        DB_MMAP_SIZE=256 * 1024 * 1024,  # bytes of the database file read through memory mapping
+        DB_CACHE_SIZE=-16000,  # page cache per connection; negative values are KiB rather than pages
+        DB_BUSY_TIMEOUT=5000,  # milliseconds to wait on a locked database (and in the write queue) before failing
+        DB_SERIALIZE_WRITES=False,  # queue writers in-process, one at a time, instead of contending for SQLite's lock
+        DB_SLOW_QUERY_THRESHOLD=250,  # milliseconds after which a statement is logged with its query plan [None disables the log]
+        DB_REPLICAS=(),  # sqlite files replicated from `DATABASE`, serving the reads that may lag [see `db.read_db`]
+        DB_REPLICA_STICKY_WINDOW=5,  # seconds a user's reads stay on the primary after their own write
+        PAGE_CACHE_TYPE='memory',  # page cache for anonymous index hits: 'memory', 'filesystem' or None to disable it
+        PAGE_CACHE_TTL=60,  # seconds a cached page is served before it is re-rendered
+        PAGE_CACHE_MAX_ENTRIES=256,  # number of cached pages kept before the oldest are evicted
+        PAGE_CACHE_DIR=None,  # directory of the 'filesystem' page cache [defaults to `page_cache` in the instance folder]
+        PAGE_CACHE_GENERATION_TTL=1.0,  # seconds a process reuses the posts' generation it read, so cache hits skip the database [0 reads it every hit]
+        USER_CACHE_TTL=300,  # seconds a logged in user's record is served from memory [0 disables the user cache]
+        USER_CACHE_MAX_ENTRIES=1024,  # number of user records kept in memory per process
+        SESSION_TYPE='filesystem',  # session backend: 'filesystem', 'sqlite' (a table in DATABASE) or 'cookie' (signed, needs SECRET_KEY)
+        SESSION_FILE_DIR=None,  # directory of the 'filesystem' sessions [defaults to `flask_session` in the instance folder]
+        SESSION_SWEEP_INTERVAL=300,  # seconds between sweeps of expired server-side sessions [by a background thread per process]
+        SESSION_MAX_ENTRIES=100000,  # server-side sessions kept before the oldest are evicted
+        PASSWORD_HASH_METHOD='pbkdf2:sha256:150000',  # werkzeug hash method, including its cost; stored hashes are upgraded at login when it changes
+        PASSWORD_SALT_LENGTH=16,  # characters of random salt per password hash
+        PASSWORD_HASH_WORKERS=2,  # password hashes computed in parallel per process
+        PASSWORD_HASH_QUEUE=16,  # password hashes allowed to wait for a worker before new ones get a 503
+        PASSWORD_HASH_EXECUTOR='thread',  # 'thread' or 'process' workers for the password hashing pool
+        RATELIMIT_RULES={  # `(requests, per_seconds)` allowed per client ip and per submitted username [empty disables the limiter]
+            'login': {'ip': (30, 60), 'username': (10, 60)},
+            'register': {'ip': (10, 600)},
+        },
+        RATELIMIT_STORAGE='memory',  # where the token buckets live: 'memory' (per process) or 'sqlite' (shared by the workers)
+        RATELIMIT_MAX_ENTRIES=100000,  # number of buckets kept in memory per process
+        SEARCH_MAX_RESULTS=1000,  # search results paged through at most, the pages past them are a 404 [deep OFFSETs only get slower]
+        API_MAX_PAGE_SIZE=1000,  # largest `?limit=` accepted by the json api's post listing
+        FEED_SIZE=20,  # number of latest posts in `/feed.atom` and `/feed.rss`
+        FEED_CACHE_TTL=3600,  # seconds a generated feed is kept in memory [writes to the posts it lists replace it sooner]
+        FEED_CACHE_MAX_ENTRIES=16,  # generated feeds kept per process, one per format and host [set `SERVER_NAME` to build every feed for one host]
+        PROFILING_ENABLED=False,  # opt-in request instrumentation: `Server-Timing` headers, `/_profiling/stats` and sampled cProfile dumps
+        PROFILING_WINDOW=300,  # seconds per window of the rolling route stats
+        PROFILING_STATS_TOKEN=None,  # when set, `/_profiling/stats` requires it as `?token=`
+        PROFILING_SAMPLE_RATE=0.0,  # share of requests run under cProfile [0 disables profiling]
+        PROFILING_SLOW_THRESHOLD=0.5,  # seconds after which a profiled request's profile is dumped
+        PROFILING_DIR=None,  # directory of the dumped profiles [defaults to `profiles` in the instance folder]
+        TEMPLATE_PRECOMPILE=True,  # compile every template while creating the app, instead of on first use
+        TEMPLATE_BYTECODE_DIR=None,  # directory of the compiled templates [defaults to `jinja_cache` in the instance folder]
+        FRAGMENT_CACHE_TTL=3600,  # seconds a `{% cache %}` fragment (e.g. a post's article) is reused [0 disables the fragment cache]
+        FRAGMENT_CACHE_MAX_ENTRIES=4096,  # number of rendered fragments kept per process
+        JOB_WORKERS=2,  # threads per process running the side effects of writes [0 runs them in the writing request, once it commits]
+        JOB_MAX_ATTEMPTS=5,  # times a job is tried before it is moved to the dead jobs
+        JOB_RETRY_DELAY=1.0,  # seconds before a failed job's first retry, doubling after each further failure
+        JOB_TIMEOUT=60,  # seconds a claimed job may run before it is assumed lost [e.g. its worker crashed] and run again
+        JOB_POLL_INTERVAL=5.0,  # seconds an idle job worker waits before checking the outbox for jobs it was not notified of
+        ASGI_WORKERS=32,  # threads handling requests at once when served via `awokogbon.asgi` [idle connections need none]
+        SERVER_WORKERS=4,  # worker processes forked by `awokogbon serve`, each handling one request at a time
+        SERVER_MAX_REQUESTS=10000,  # requests a `serve` worker handles before it is replaced, capping its memory growth [0 never recycles]
+        SERVER_MAX_REQUESTS_JITTER=1000,  # up to this many requests added to each worker's limit, so workers are not all replaced at once
+        SERVER_GRACEFUL_TIMEOUT=30,  # seconds stopping workers may spend finishing their current request before they are killed
+        STORAGE_ENGINE='sqlite',  # storage behind the posts and users repositories: 'sqlite' (the app's pool) or 'sqlalchemy'
+        DATABASE_URL=None,  # database of the 'sqlalchemy' engine e.g. `postgresql://...` [defaults to the sqlite `DATABASE`]
+        DATABASE_REPLICA_URLS=()  # read replicas of `DATABASE_URL`, for the 'sqlalchemy' engine
     )
 
-    # Set the session
-    app.config['SESSION_TYPE'] = 'filesystem'
-    sess = Session()
-    sess.init_app(app)
-
     # allows for alternative source of default configuration e.g. loading configuration from `config.py` [in the instance folder]
     if test_config is None:
         # load the instance config, if it exists when not testing
@@ -33,12 +124,18 @@ def create_app(test_config=None):  # application factory
         # load the test config if passed in
         app.config.from_mapping(test_config)
 
+    # Set the session backend, by calling `init_app()` from `sessions.py` : after loading the app configs
+    sessions.init_app(app)
+
     # ensure the instance folder exists i.e. creates the instance folder [in case it does not exist]
     try:
         os.makedirs(app.instance_path)
     except OSError:
         pass
 
+    # initialize the templates, by calling `init_app()` from `templating.py` : after creating the instance folder, before anything uses the templates
+    templating.init_app(app)
+
     # a simple page that says hello (to show the app works) based on the url path `/hello`
     @app.route('/hello')
     def hello():
@@ -47,10 +144,53 @@ def create_app(test_config=None):  # application factory
     # initialize the database, by calling `init_app()` from `db.py` : after initiliazing the app configs
     db.init_app(app)
 
+    # initialize the slow query log, by calling `init_app()` from `queryplan.py` : after initializing the app database
+    queryplan.init_app(app)
+
+    # initialize the job queue, by calling `init_app()` from `jobs.py` : after initializing the app database
+    jobs.init_app(app)
+
+    # initialize the page cache, by calling `init_app()` from `cache.py` : after initializing the app configs
+    cache.init_app(app)
+
+    # initialize the password hashing pool, by calling `init_app()` from `hashing.py` : after initializing the app configs
+    hashing.init_app(app)
+
+    # initialize the rate limiter, by calling `init_app()` from `ratelimit.py` : before the views it throttles
+    ratelimit.init_app(app)
+
+    # initialize the markdown rendering, by calling `init_app()` from `rendering.py` : after initializing the app database
+    rendering.init_app(app)
+
+    # initialize the post listing projection, by calling `init_app()` from `listing.py`
+    listing.init_app(app)
+
     # initialize the registered auth blueprints, by calling `init_blueprint` from `auth.py` : after initializing the app database
     auth.init_blueprint(app)
 
     # initialize the registered blog blueprints, by calling `init_blueprint` from `blog.py` : after initializing the app database
     blog.init_blueprint(app)
 
+    # register the feeds, by calling `init_blueprint()` from `feeds.py`
+    feeds.init_blueprint(app)
+
+    # initialize the registered search blueprints, by calling `init_blueprint` from `search.py` : after initializing the app database
+    search.init_blueprint(app)
+
+    # initialize the registered api blueprints, by calling `init_blueprint` from `api.py` : after initializing the app database
+    api.init_blueprint(app)
+
+    # initialize the (opt-in) instrumentation, by calling `init_app()` from `profiling.py` : after everything it instruments
+    #   - only imported when enabled, like the modules of the commands below
+    if app.config['PROFILING_ENABLED']:
+        from . import profiling
+        profiling.init_app(app)
+
+    # register the commands of the modules only the command line uses [e.g. `transfer.py`], without importing them
+    for name, module in _LAZY_COMMANDS:
+        app.cli.add_command(LazyCommand(name, module))
+
+    # compile the templates, by calling `precompile()` from `templating.py` : after every template filter is registered
+    templating.precompile(app)
+
     return app  # return a properly configured instance of the app
@@ -0,0 +1,107 @@
+import collections
+import contextlib
+import hashlib
+import json
+from datetime import datetime
+from werkzeug.exceptions import abort, HTTPException
+from flask import (
+  Blueprint,
+  current_app,
+  jsonify,
+  request,
+  Response,
+  stream_with_context
+)
+from awokogbon.blog import decode_cursor, encode_cursor
+from awokogbon.db import MAX_INTEGER
+from awokogbon.repositories import get_posts, POST_FIELDS as FIELDS  # the post fields the api can return
+
+blueprint = Blueprint('api', __name__, url_prefix='/api')  # initialize a Blueprint instance
+
+DEFAULT_FIELDS = ('id', 'title', 'body', 'created', 'updated', 'author_id', 'username')
+
+
+def init_blueprint(app):  # registers `blueprint_instance` and then added to application factory __init__.py
+    app.register_blueprint(blueprint)  # tells flask to register `bp` after creating `app` instance
+
+
+@blueprint.errorhandler(HTTPException)
+def handle_error(e):  # api errors are json too, not the html error pages
+    return jsonify(error=e.description), e.code
+
+
+def _selected_fields():  # the fields listed in `?fields=`, or the default ones
+    fields = request.args.get('fields')
+    if not fields:
+        return DEFAULT_FIELDS
+    fields = tuple(field.strip() for field in fields.split(','))
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        abort(400, 'Unknown fields: {0}.'.format(', '.join(unknown)))
+    return fields
+
+
+def _to_json(row, fields):
+    return json.dumps(collections.OrderedDict(
+        (field, row[field].isoformat() if isinstance(row[field], datetime) else row[field]) for field in fields
+    ))
+
+
+def _etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf8')).hexdigest()
+
+
+# List Posts Api View:
+#   - one page of posts as json, with the same keyset pagination as the index [`?cursor=`, `?limit=`] and `?fields=` selection
+#   - the `ETag` is derived from the `(id, updated)` of the page's posts, so a matching `If-None-Match` is answered without reading any post body
+#   - the body is streamed from the repository one post at a time, so memory stays flat however large `limit` is
+@blueprint.route('/posts')
+def list_posts():
+    fields = _selected_fields()
+    token = request.args.get('cursor')
+    cursor = decode_cursor(token) if token else None
+    limit = min(
+        max(request.args.get('limit', current_app.config['POSTS_PER_PAGE'], type=int), 1),
+        current_app.config['API_MAX_PAGE_SIZE']
+    )
+
+    digest = hashlib.sha1('{0}|{1}|{2}'.format(token, limit, ','.join(fields)).encode('utf8'))
+    for row in get_posts().versions(cursor, limit):
+        digest.update('|{0}:{1}'.format(row['id'], row['updated']).encode('utf8'))
+    etag = digest.hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        return response
+
+    rows = get_posts().stream(fields, cursor, limit)
+
+    def generate():
+        with contextlib.closing(rows):  # gives the rows' connection back, even when the extra row is left unread
+            yield '{"posts": ['
+            last = None
+            for count, row in enumerate(rows):
+                if count == limit:  # the extra row only signals that there is more, it is not returned
+                    yield '], "next_cursor": {0}}}'.format(json.dumps(encode_cursor(last['_created'], last['_id'])))
+                    return
+                yield (',' if count else '') + _to_json(row, fields)
+                last = row
+            yield '], "next_cursor": null}'
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+# Get Post Api View:
+#   - a single post as json, with `?fields=` selection and an `ETag` honoured by `If-None-Match`
+@blueprint.route('/posts/<int:id>')
+def get_post(id):
+    fields = _selected_fields()
+    row = get_posts().get(id) if id <= MAX_INTEGER else None  # a larger id is no post's [and could not be bound]
+    if row is None:
+        abort(404, "Post id {0} doesn't exist".format(id))
+
+    response = Response(_to_json(row, fields), mimetype='application/json')
+    response.set_etag(_etag(id, row['updated'], ','.join(fields)))
+    return response.make_conditional(request)
@@ -0,0 +1,163 @@
+import asyncio
+import concurrent.futures
+import functools
+import io
+import sys
+from awokogbon import create_app
+from awokogbon.db import close_pools, open_db, write_transaction
+from awokogbon.repositories import dispose_engines
+
+
+# AsyncDatabase:
+#   - an awaitable wrapper around `open_db()`: each call runs on the executor, inside its own application context
+#   - the connection is checked out of (and returned to) the pool exactly as a request would, so statement listeners still apply
+#   - `sqlite3.Row` results are plain values, so they remain usable on the event loop once the connection is released
+class AsyncDatabase(object):
+    def __init__(self, app, executor):
+        self.app = app
+        self._executor = executor
+
+    def _call(self, fn, args):
+        with self.app.app_context():
+            return fn(open_db(), *args)
+
+    def _call_in_transaction(self, fn, args):
+        with self.app.app_context():
+            with write_transaction() as db:
+                return fn(db, *args)
+
+    async def run(self, fn, *args):  # awaits `fn(db, *args)`
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call, fn, args))
+
+    async def write(self, fn, *args):  # awaits `fn(db, *args)` inside a `write_transaction()`
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(self._call_in_transaction, fn, args))
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda db: db.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda db: db.execute(sql, params).fetchall())
+
+
+# ASGIApp:
+#   - serves the flask app over ASGI: connections, keep-alives and request bodies are handled on the event loop
+#   - a worker thread is only borrowed while a request is actually being handled, so idle connections cost no threads
+#   - response chunks are sent as they are produced, so streamed responses [e.g. `/api/posts`] stay streamed
+class ASGIApp(object):
+    def __init__(self, app, max_workers=32):
+        self.app = app
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='asgi')
+        self.db = AsyncDatabase(app, self.executor)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            body = await self._read_body(receive)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, self._handle, self._environ(scope, body), loop, send)
+        else:
+            raise ValueError('Unsupported ASGI scope type: {}'.format(scope['type']))
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.db.fetchone('SELECT 1')  # opens the first pooled connection before the first request
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                self.app.extensions['job_queue'].stop()
+                close_pools(self.app)  # the primary and replica pools
+                dispose_engines(self.app)  # and the 'sqlalchemy' engine's [if it was used]
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        body = io.BytesIO()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            body.write(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+        body.seek(0)
+        return body
+
+    def _environ(self, scope, body):  # maps the ASGI http scope onto a WSGI environ [PEP 3333]
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': 'HTTP/{}'.format(scope.get('http_version', '1.1')),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+        for name, value in scope.get('headers', ()):
+            name, value = name.decode('latin1').upper().replace('-', '_'), value.decode('latin1')
+            if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                name = 'HTTP_' + name
+            if name in environ:  # repeated headers are folded into one [cookies use their own separator]
+                value = environ[name] + ('; ' if name == 'HTTP_COOKIE' else ',') + value
+            environ[name] = value
+        return environ
+
+    def _handle(self, environ, loop, send):  # runs on a worker thread, handing each message back to the event loop
+        def emit(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('started'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['start'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            }
+            return write
+
+        def write(data):
+            if not response.get('started'):
+                emit(response['start'])
+                response['started'] = True
+            if data:
+                emit({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        iterable = self.app(environ, start_response)
+        try:
+            for data in iterable:
+                write(data)
+            write(b'')  # starts the response, if the body was empty
+            emit({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
+
+
+# create_asgi_app():
+#   - the ASGI counterpart of `create_app()` e.g. `uvicorn --factory awokogbon.asgi:create_asgi_app`
+#   - `ASGI_WORKERS` bounds the requests handled at once, not the connections held open
+def create_asgi_app(test_config=None):
+    app = create_app(test_config)
+    return ASGIApp(app, max_workers=app.config['ASGI_WORKERS'])
@@ -1,13 +1,17 @@
 import functools
-from awokogbon.db import open_db
-from werkzeug.security import (
-    check_password_hash,
-    generate_password_hash
-)
+from awokogbon.db import replica_reads, stick_to_primary
+from awokogbon.repositories import get_users
+from awokogbon.hashing import hash_password, needs_rehash, verify_password
+from awokogbon.cache import MemoryCache
+from awokogbon.ratelimit import rate_limited
+from awokogbon.sessions import regenerate_session
 from flask import (
   Blueprint,
+  current_app,
+  Flask,
   flash,
   g,
+  has_request_context,
   redirect,
   render_template,
   request,
@@ -20,6 +24,12 @@ blueprint = Blueprint('auth', __name__, url_prefix='/auth')  # initialize a Blue
 
 def init_blueprint(app):  # registers `blueprint_instance`
     app.register_blueprint(blueprint)  # tells flask to register `bp` after creating the `app` instance
+    app.app_ctx_globals_class = UserGlobals  # tells flask to load `g.user` lazily
+    if app.config['USER_CACHE_TTL']:  # a TTL of 0 (or None) disables the user cache
+        app.extensions['user_cache'] = MemoryCache(
+            max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+            ttl=app.config['USER_CACHE_TTL']
+        )
 
 
 # Registeration Page View:
@@ -30,23 +40,24 @@ def init_blueprint(app):  # registers `blueprint_instance`
 #   - return a new `submitted` form (i.e. register page) if `submitted data` is invalid
 #   - else redirect to login page view
 @blueprint.route('/register', methods=('GET', 'POST'))
+@rate_limited('register')  # throttled per client ip, before the lookup and hashing below
 def register():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = open_db()
+        users = get_users()
         error = None
 
         if not username:  # if username is `None`, just throw an error
             error = 'Username is required.'
         elif not password:  # if password is `None`, also throw an error
             error = 'Password is required.'
-        elif db.execute('SELECT id FROM user WHERE username = ?', (username,)).fetchone() is not None:  # use initialized db to check if user already exists
+        elif users.get_by_username(username) is not None:  # check if user already exists
             error = 'User {} is already registered.'.format(username)
 
         if error is None:  # if there are no errors with username and password input, then hash and store the data in the database
-            db.execute('INSERT INTO user (username, password) VALUES (?, ?)', (username, generate_password_hash(password)))
-            db.commit()  # make sure the db changes are concreted i.e. save the changes
+            password_hash = hash_password(password)  # hash (on the hashing pool) before taking the write lock, it is the slow part
+            users.create(username, password_hash)  # save the new user
             return redirect(url_for('auth.login'))   # redirect the user to `login` for them to now login
 
         flash(error)  # shows the user the error and also stores the error for subsequent usage in the template
@@ -61,25 +72,34 @@ def register():
 #   - return a new form (i.e. same login page template), if `submitted data` is invalid
 #   - else redirect to `index page` view
 @blueprint.route('/login', methods=('GET', 'POST'))
+@rate_limited('login')  # throttled per client ip and per username, before the lookup and password check below
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = open_db()
+        users = get_users()
         error = None
 
         # validate the user whether it exists or correct
-        user = db.execute('SELECT * FROM user WHERE username = ?', (username,)).fetchone()  # get the user record from database
+        with replica_reads():  # a read-only lookup, so a replica may serve it
+            user = users.get_by_username(username)  # get the user record from database
 
         if user is None:  # if username is `None`, just throw an error
             error = 'Incorrect username.'
 
-        elif not check_password_hash(user['password'], password):  # validate by hashing new password and comparing with db version
+        elif not verify_password(user['password'], password):  # validate by hashing new password and comparing with db version
             error = 'Incorrect password.'
 
+        elif needs_rehash(user['password']):  # the configured hash method or cost changed, so upgrade the stored hash while we have the password
+            password_hash = hash_password(password)
+            users.set_password(user['id'], password_hash)
+            invalidate_user(user['id'])
+
         if error is None:  # username and password have been validated
             session.clear()  # clear the current session cookies
+            regenerate_session()  # under a new session id, so an id planted before the login is never logged in
             session['user_id'] = user['id']  # add user to session dict - `id` is the unique identifier obtained from the database
+            stick_to_primary()  # the user record may only just have been written [e.g. registered], so read it from the primary for a while
             return redirect(url_for('index'))   # redirect the user to `index page`, after having logged in
 
         flash(error)  # shows the user the error and store the error
@@ -87,17 +107,42 @@ def login():
     return render_template('auth/login.html')  # otherwise return the login page again 
 
 
-# Logged In User Page View:
+# Logged In User:
 #   - validate if user (with currently session cookie) is already logged in
-#   - before even running other page views
-@blueprint.before_app_request
+#   - only runs the first time a view (or template) reads `g.user`, so routes like `/hello` never look the user up [see `UserGlobals`]
+#   - the user record is served from the in-process user cache, and only read from the database on a miss
 def load_logged_in_user():
     user_id = session.get('user_id')  # extract the user_id from the current session cookie
     if user_id is None:  # if there current session cookie is not valid [due to not even having a user_id]
-        g.user = None
-    else:  # use the user_id to select the user details from the database
-        db = open_db()
-        g.user = db.execute('SELECT * FROM user WHERE id = ?', (user_id,)).fetchone()
+        return None
+
+    cache = current_app.extensions.get('user_cache')
+    user = cache.get(user_id) if cache is not None else None
+    if user is None:  # use the user_id to select the user details from the database
+        with replica_reads():
+            row = get_users().get(user_id)
+        if row is None:
+            return None
+        user = dict(row)  # a plain dict, so the cached record does not hold on to the connection's row objects
+        if cache is not None:
+            cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id):  # must be called whenever a user record changes, so the next request re-reads it
+    cache = current_app.extensions.get('user_cache')
+    if cache is not None:
+        cache.delete(user_id)
+
+
+# UserGlobals:
+#   - the app's `g` object, extended so that `g.user` is loaded lazily on first access and then kept for the rest of the request
+class UserGlobals(Flask.app_ctx_globals_class):
+    def __getattr__(self, name):  # only called for attributes that have not been set yet
+        if name != 'user':
+            raise AttributeError(name)
+        self.user = load_logged_in_user() if has_request_context() else None
+        return self.user
 
 
 # Logged Out User Page View
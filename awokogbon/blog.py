@@ -1,8 +1,14 @@
-from awokogbon.db import open_db
+import base64
+import binascii
+from datetime import datetime
+from awokogbon.repositories import get_posts
 from awokogbon.auth import login_required
+from awokogbon.cache import cached_page
+from awokogbon.db import MAX_INTEGER
 from werkzeug.exceptions import abort
 from flask import (
   Blueprint,
+  current_app,
   flash,
   g,
   redirect,
@@ -19,16 +25,59 @@ def init_blueprint(app):  # registers `blueprint_instance` and then added to app
     app.add_url_rule('/', endpoint='index')  # specifies the endpoint to point to e.g. `blog.index` and `/` would be the same
 
 
+# Cursor helpers: a cursor is the `(created, id)` of the last post on a page, encoded into an opaque url-safe token
+def encode_cursor(created, id):
+    raw = '{0}|{1}'.format(created.isoformat(' '), id)  # `created` is parsed into a datetime by PARSE_DECLTYPES
+    return base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii')
+
+
+def decode_cursor(token):
+    try:
+        created, id = base64.urlsafe_b64decode(token.encode('ascii')).decode('utf8').rsplit('|', 1)
+        created = datetime.fromisoformat(created)  # validated here, so no storage engine is handed a malformed timestamp
+        if created.tzinfo is not None:  # the timestamps are stored in UTC, without a zone
+            raise ValueError(created)
+        id = int(id)
+        if not 0 <= id <= MAX_INTEGER:  # no post has it, and a larger id could not even be bound
+            raise ValueError(id)
+        return created.isoformat(' '), id
+    except (binascii.Error, UnicodeError, ValueError):  # tampered or truncated tokens are treated as a bad request
+        abort(400, 'Invalid page cursor.')
+
+
+def fetch_posts_page(cursor=None, limit=None):  # fetch a single page of posts for the index [see `repositories.select_posts_page`]
+    if limit is None:
+        limit = current_app.config['POSTS_PER_PAGE']
+    posts = get_posts().page(cursor, limit)
+
+    next_cursor = None
+    if len(posts) > limit:  # the extra row only signals that there is more, it is not shown
+        posts = posts[:limit]
+        next_cursor = encode_cursor(posts[-1]['created'], posts[-1]['id'])
+    return posts, next_cursor
+
+
 # Index Page View:
-#   - just renders the exists blog posts
+#   - renders one page of the existing blog posts
+#   - `?cursor=` carries the position of the previous page's last post
+#   - anonymous hits are served from the page cache [see `cache.cached_page`]
 @blueprint.route('/')
+@cached_page
 def index():
-    db = open_db()
-    posts = db.execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON author_id = u.id'
-        ' ORDER BY created DESC').fetchall()  # query and fetch all
-    return render_template('blog/index.html', posts=posts)
+    token = request.args.get('cursor')
+    cursor = decode_cursor(token) if token else None
+    posts, next_cursor = fetch_posts_page(cursor)
+    return render_template('blog/index.html', posts=posts, next_cursor=next_cursor)
+
+
+# Post Page View:
+#   - renders a single post in full [the index only lists each post's excerpt]
+#   - anonymous hits are served from the page cache, with the same `ETag` revalidation as the index
+@blueprint.route('/<int:id>')
+@cached_page
+def show(id):
+    post = get_post(id, check_author=False)
+    return render_template('blog/post.html', post=post)
 
 
 # Create Post Page view
@@ -46,11 +95,7 @@ def create():
         if error is not None:
             flash(error)
         else:
-            db = open_db()
-            db.execute(
-                'INSERT INTO post (title, body, author_id) VALUES (?, ?, ?)', (title, body, g.user['id'])
-            )
-            db.commit()  # save the data in the database
+            get_posts().create(title, body, None, g.user['id'])  # the markdown is rendered once, by the post's `render_post` job
             return redirect(url_for('blog.index'))  # redirect back to index page after creating the new blog post
     return render_template('blog/create.html')  # redirect back to the create page if it is a `GET` request or there are issues with `title`
 
@@ -58,13 +103,8 @@ def create():
 # middleware: required by update/delete handlers to which `post` to delete [for which `author`]
 def get_post(id, check_author=True):
 
-    # connect to the database to retrieve the post [using the provided `id` parameter]
-    db = open_db()
-    post = db.execute(
-        'SELECT p.id, title, body, created, author_id, username'
-        ' FROM post p JOIN user u ON p.author_id = u.id'
-        ' WHERE p.id = ?', (id,)
-        ).fetchone()
+    # retrieve the post [using the provided `id` parameter], unless the id is larger than any a post can have [it could not be bound]
+    post = get_posts().get(id) if id <= MAX_INTEGER else None
 
     # check if the post exists i.e. in case the db returned a None value
     if post is None:
@@ -95,9 +135,7 @@ def update(id):
         if error is not None:
             flash(error)
         else:
-            db = open_db()
-            db.execute('UPDATE post SET title=?, body=? WHERE id = ?', (title, body, id))
-            db.commit()  # save the changes
+            get_posts().update(id, title, body, None)  # save the changes [rendered again by the post's `render_post` job]
             return redirect(url_for('blog.index'))  # redirect back to index page after the update
     return render_template('blog/update.html', post=post)  # redirect back to update page if it is a `GET` request or there are issues with `initial update`
 
@@ -107,7 +145,5 @@ def update(id):
 @login_required
 def delete(id):
     get_post(id)
-    db = open_db()
-    db.execute('DELETE FROM post WHERE id = ?', (id,))
-    db.commit()  # save the data in the database
+    get_posts().delete(id)
     return render_template('blog/index.html')  # redirect back to the index page
@@ -0,0 +1,214 @@
+import collections
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from flask import current_app, make_response, request, session
+
+
+# MemoryCache:
+#   - an in-process LRU cache whose entries also expire after `ttl` seconds
+#   - each worker process holds its own copy, so entries that depend on the posts also record their `current_generation()`
+class MemoryCache(object):
+    def __init__(self, max_entries=256, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)  # mark as most recently used
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)  # evict the least recently used entry
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# FileSystemCache:
+#   - stores each entry as one file under `directory`, so every worker process on the host shares the entries and their invalidation
+#   - a file holds one line of JSON metadata (expiry and headers) followed by the raw body
+class FileSystemCache(object):
+    def __init__(self, directory, max_entries=256, ttl=60):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.ttl = ttl
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                meta = json.loads(f.readline().decode('utf8'))
+                if meta['expires'] < time.time():
+                    return None
+                meta['value']['body'] = f.read()
+                return meta['value']
+        except (OSError, ValueError, KeyError):  # missing, half-written or foreign files are all cache misses
+            return None
+
+    def set(self, key, value):
+        value = dict(value)
+        body = value.pop('body')
+        meta = json.dumps({'expires': time.time() + self.ttl, 'value': value}).encode('utf8')
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(meta + b'\n' + body)
+        os.replace(tmp_path, self._path(key))  # atomic, so readers never see a partially written entry
+        self._prune()
+
+    def _prune(self):  # drop the oldest entries once there are more than `max_entries`
+        try:
+            names = [name for name in os.listdir(self.directory) if not name.startswith('.tmp')]
+        except OSError:
+            return
+        if len(names) <= self.max_entries:
+            return
+        paths = sorted((os.path.join(self.directory, name) for name in names), key=_mtime)
+        for path in paths[:len(paths) - self.max_entries]:
+            _remove(path)
+
+    def delete(self, key):
+        _remove(self._path(key))
+
+    def clear(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            _remove(os.path.join(self.directory, name))
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_cache(app):  # builds the page cache backend selected by `PAGE_CACHE_TYPE` [`None` disables the cache]
+    cache_type = app.config['PAGE_CACHE_TYPE']
+    max_entries = app.config['PAGE_CACHE_MAX_ENTRIES']
+    ttl = app.config['PAGE_CACHE_TTL']
+    if cache_type is None:
+        return None
+    if cache_type == 'memory':
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    if cache_type == 'filesystem':
+        directory = app.config['PAGE_CACHE_DIR'] or os.path.join(app.instance_path, 'page_cache')
+        return FileSystemCache(directory, max_entries=max_entries, ttl=ttl)
+    raise ValueError('Unknown PAGE_CACHE_TYPE {0!r}.'.format(cache_type))
+
+
+def get_cache():
+    return current_app.extensions.get('page_cache')
+
+
+# current_generation():
+#   - the posts' generation, bumped in the database by every change to the posts [see `post_generation` in `schema.sql`]
+#   - a cached entry rendered at an older generation is stale, whichever process made the write: so no process has to be told
+#   - read before rendering an entry, so a write racing the render leaves the entry stale rather than wrong
+#   - each process reuses the generation it read for `PAGE_CACHE_GENERATION_TTL` seconds, so cache hits (and their 304s) do not
+#     touch the database: a write by another process is seen up to that much later, one by this process at once [see `forget_generation`]
+def current_generation():
+    app = current_app._get_current_object()
+    now = time.monotonic()
+    known = app.extensions.get('post_generation')
+    if known is not None and known[1] > now:
+        return known[0]
+    from awokogbon.repositories import get_posts  # imported here, as `repositories` (through `listing`) imports modules using this one
+    generation = get_posts().generation()
+    if app.config['PAGE_CACHE_GENERATION_TTL']:
+        app.extensions['post_generation'] = (generation, now + app.config['PAGE_CACHE_GENERATION_TTL'])
+    return generation
+
+
+def forget_generation():  # called once this process changed the posts, so its next `current_generation()` reads the new one
+    current_app.extensions.pop('post_generation', None)
+
+
+def _is_cacheable():  # only anonymous GETs are shared; logged in users and pending flash messages get a personalised page
+    return (
+        request.method in ('GET', 'HEAD')
+        and session.get('user_id') is None
+        and '_flashes' not in session
+    )
+
+
+# Cached Page decorator:
+#   - serves a view's rendered page from the page cache for anonymous visitors
+#   - each entry carries an `ETag` and `Last-Modified`, so conditional requests get a 304 without the view running at all
+#   - an entry is only served while the posts' generation is the one it was rendered at [see `current_generation`]
+def cached_page(view):
+    @functools.wraps(view)
+    def wrapped_view(**kwargs):
+        cache = get_cache()
+        if cache is None or not _is_cacheable():
+            return view(**kwargs)
+
+        key = request.full_path  # the query string (e.g. `?cursor=`) selects the page
+        generation = current_generation()
+        entry = cache.get(key)
+        status = 'HIT'
+        if entry is None or entry['generation'] != generation:
+            status = 'MISS'
+            response = make_response(view(**kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'content_type': response.content_type,
+                'etag': hashlib.sha1(body).hexdigest(),
+                'last_modified': int(time.time()),
+                'generation': generation,
+            }
+            cache.set(key, entry)
+
+        response = current_app.response_class(entry['body'], content_type=entry['content_type'])
+        response.set_etag(entry['etag'])
+        response.last_modified = entry['last_modified']
+        response.cache_control.no_cache = True  # clients may store the page, but must revalidate it [which is a cheap 304]
+        response.vary.add('Cookie')  # a logged in visitor gets a different page from the same url
+        response.headers['X-Page-Cache'] = status
+        return response.make_conditional(request)
+    return wrapped_view
+
+
+def init_app(app):  # creates the page cache backend from the (already loaded) app config
+    app.extensions['page_cache'] = create_cache(app)
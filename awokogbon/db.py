@@ -1,21 +1,393 @@
+import collections
+import contextlib
+import random
 import sqlite3
+import threading
+import time
 import click
-from flask import current_app, g
+from flask import current_app, g, has_request_context, request, session
 from flask.cli import with_appcontext
 
 
-def open_db():  # open_db() handles connection to the Sqlite [to setup a db pool to use]
-    if 'db' not in g:  # is a flask special object used to pool db connections
-        g.db = sqlite3.connect(current_app.config['DATABASE'], detect_types=sqlite3.PARSE_DECLTYPES)  # handles connection to database specified by `current_app.config`
-        g.db.row_factory = sqlite3.Row
+MAX_INTEGER = 2 ** 63 - 1  # the largest integer sqlite stores [binding a larger python int raises `OverflowError`]
+
+
+class PoolTimeout(sqlite3.OperationalError):  # raised when every pooled connection stays checked out for longer than `DB_POOL_TIMEOUT`
+    pass
+
+
+# PooledConnection:
+#   - a thin handle around a pooled sqlite3 connection, handed out for the duration of one request
+#   - once released, the handle behaves like a closed connection, so stale references can not use a connection now owned by another request
+class PooledConnection(object):
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):  # delegate `commit`, `rollback`, `in_transaction` et al. to the underlying connection
+        if self._connection is None:
+            raise sqlite3.ProgrammingError('Cannot operate on a closed database.')
+        return getattr(self._connection, name)
+
+    # the statement methods are timed and reported to the pool's `statement_listeners` [only when there are any]
+    def execute(self, *args):
+        return self._run('execute', args)
+
+    def executemany(self, *args):
+        return self._run('executemany', args)
+
+    def executescript(self, *args):
+        return self._run('executescript', args)
+
+    def _run(self, name, args):
+        method = self.__getattr__(name)
+        listeners = self._pool.statement_listeners
+        if not listeners:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            duration = time.perf_counter() - started
+            for listener in listeners:
+                listener(self._connection, name, args[0], args[1] if len(args) > 1 else None, duration)
+
+    def __enter__(self):
+        return self.__getattr__('__enter__')()
+
+    def __exit__(self, *exc_info):
+        return self.__getattr__('__exit__')(*exc_info)
+
+    def close(self):  # returns the connection to the pool [instead of closing it]
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.release(connection)
+
+
+# WriteQueue:
+#   - a FIFO lock that lets one writer at a time into the database, in arrival order
+#   - writers queue up in-process instead of racing for SQLite's write lock and failing with `database is locked`
+#   - readers never touch the queue, so (under WAL) they keep running while a writer is active
+class WriteQueue(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._busy = False
+        self._waiters = collections.deque()
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if not self._busy:
+                self._busy = True
+                return True
+            event = threading.Event()
+            self._waiters.append(event)
+        if event.wait(timeout):
+            return True
+        with self._lock:
+            if event.is_set():  # ownership was handed over just as the wait timed out
+                return True
+            self._waiters.remove(event)
+            return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                self._waiters.popleft().set()  # hand ownership straight to the longest waiting writer
+            else:
+                self._busy = False
+
+    def __len__(self):  # number of writers currently waiting
+        return len(self._waiters)
+
+
+# ConnectionPool:
+#   - a bounded, thread-safe pool of sqlite3 connections to a single database file
+#   - connections are created on demand up to `max_size`, then reused across requests
+#   - idle connections are pinged before being handed out and replaced if they are broken
+#   - callers wait (up to `timeout` seconds) for a connection when the pool is exhausted
+#   - each `statement_listeners` callable is called with `(connection, method, sql, parameters, seconds)` after every statement run
+#     through a checked out connection [`method` is 'execute', 'executemany' or 'executescript']
+class ConnectionPool(object):
+    def __init__(self, database, max_size=5, timeout=30.0, pragmas=None, serialize_writes=False, statement_listeners=None):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = pragmas or {}  # applied to every new connection, in order
+        self.write_queue = WriteQueue() if serialize_writes else None
+        self.statement_listeners = statement_listeners if statement_listeners is not None else []
+        self._idle = collections.deque()  # most recently released connection is reused first [it is the most likely to be warm]
+        self._in_use = 0
+        self._created = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+        self._condition = threading.Condition(threading.Lock())
+
+    def _connect(self):
+        connection = sqlite3.connect(
+            self.database,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False  # a connection is used by one request at a time, but not always on the thread that created it
+        )
+        connection.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            if value is not None:  # `None` leaves the SQLite default in place
+                connection.execute('PRAGMA {0} = {1}'.format(name, value))
+        return connection
+
+    def _record_wait(self, waited):  # must be called while holding `_condition`
+        self._waits += 1
+        self._wait_time += waited
+        self._max_wait_time = max(self._max_wait_time, waited)
+
+    def _is_healthy(self, connection):
+        try:
+            connection.execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        started = time.monotonic()
+        with self._condition:
+            while not self._idle and self._created >= self.max_size:  # pool exhausted, wait for a release
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._record_wait(time.monotonic() - started)
+                    raise PoolTimeout('Timed out waiting for a database connection.')
+                self._condition.wait(remaining)
+
+            waited = time.monotonic() - started
+            if waited > 0.001:  # only count real waits, not lock acquisition
+                self._record_wait(waited)
+
+            connection = self._idle.pop() if self._idle else None
+            if connection is None:
+                self._created += 1  # reserve the slot before connecting outside the lock
+            self._in_use += 1
+
+        if connection is not None and not self._is_healthy(connection):
+            self._discard(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._condition:
+                    self._created -= 1
+                    self._in_use -= 1
+                    self._condition.notify()
+                raise
+        return connection
+
+    def _discard(self, connection):  # close a broken connection [its slot stays reserved, as the caller immediately replaces it]
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+    def release(self, connection):
+        try:
+            if connection.in_transaction:  # never hand an open transaction to the next request
+                connection.rollback()
+        except sqlite3.Error:
+            connection.close()
+            with self._condition:
+                self._created -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            return
+        with self._condition:
+            self._in_use -= 1
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def close(self):  # closes every idle connection [connections still in use are closed when they are released]
+        with self._condition:
+            while self._idle:
+                self._idle.pop().close()
+                self._created -= 1
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._created,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+                'max_wait_time': self._max_wait_time,
+                'queued_writers': len(self.write_queue) if self.write_queue is not None else 0,
+            }
+
+
+_pool_lock = threading.Lock()
+
+
+def _pragmas(config):  # maps the `DB_*` app config onto the pragmas set on each new connection
+    return collections.OrderedDict([
+        ('busy_timeout', config['DB_BUSY_TIMEOUT']),  # first, so the remaining pragmas wait on a locked database instead of failing
+        ('journal_mode', config['DB_JOURNAL_MODE']),
+        ('synchronous', config['DB_SYNCHRONOUS']),
+        ('mmap_size', config['DB_MMAP_SIZE']),
+        ('cache_size', config['DB_CACHE_SIZE']),
+    ])
+
+
+def get_pool(app=None):  # returns the app's connection pool, creating it on first use [so config loaded after `init_app()` still applies]
+    app = app or current_app._get_current_object()
+    pool = app.extensions.get('db_pool')
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = app.extensions['db_pool'] = ConnectionPool(
+                    app.config['DATABASE'],
+                    max_size=app.config['DB_POOL_SIZE'],
+                    timeout=app.config['DB_POOL_TIMEOUT'],
+                    pragmas=_pragmas(app.config),
+                    serialize_writes=app.config['DB_SERIALIZE_WRITES'],
+                    statement_listeners=app.extensions.setdefault('db_statement_listeners', [])  # shared, so listeners added before the pool exists apply
+                )
+    return pool
+
+
+def close_pools(app):  # closes and forgets the app's pools [the next `open_db()` opens new ones], e.g. before forking workers
+    with _pool_lock:
+        pools = [app.extensions.pop('db_pool', None)] + (app.extensions.pop('db_replica_pools', None) or [])
+    for pool in pools:
+        if pool is not None:
+            pool.close()
+
+
+def open_db():  # open_db() checks a connection out of the app's pool, once per application context
+    if 'db' not in g:  # is a flask special object used to store the checked out connection for the rest of the request
+        pool = get_pool()
+        g.db = PooledConnection(pool, pool.acquire())
     return g.db
 
 
-def close_db(e=None):  # close_db() checks existing db connections and subsquently closing them checks if db connection exists and then closes it
-    db = g.pop('db', None)  # pop (i.e. remove) the db connection from the exist stack (i.e. of db connections)
+# write_transaction():
+#   - wraps one unit of writes: commits when the block succeeds, rolls back when it raises
+#   - takes SQLite's write lock up front (`BEGIN IMMEDIATE`), so a transaction never fails half-way on a lock upgrade
+#   - when `DB_SERIALIZE_WRITES` is on, writers first queue in-process [see `WriteQueue`]
+#   - reentrant: a block nested in another joins its transaction as a savepoint [rolled back alone when it raises], and only
+#     the outermost block queues, begins and commits [the nesting depth is kept in `g`, next to the connection]
+@contextlib.contextmanager
+def write_transaction():
+    db = open_db()
+    depth = g.get('write_depth', 0)
+    if depth:
+        savepoint = 'write_{0}'.format(depth)
+        db.execute('SAVEPOINT ' + savepoint)
+        g.write_depth = depth + 1
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK TO ' + savepoint)
+            db.execute('RELEASE ' + savepoint)
+            raise
+        else:
+            db.execute('RELEASE ' + savepoint)
+        finally:
+            g.write_depth = depth
+        return
+
+    queue = get_pool().write_queue
+    if queue is not None and not queue.acquire(current_app.config['DB_BUSY_TIMEOUT'] / 1000.0):
+        raise sqlite3.OperationalError('Timed out waiting in the write queue.')
+    g.write_depth = 1
+    try:
+        if not db.in_transaction:
+            db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        db.commit()
+    finally:
+        g.pop('write_depth', None)
+        if queue is not None:
+            queue.release()
+
+
+# Read replicas:
+#   - `DB_REPLICAS` lists sqlite files kept in sync with `DATABASE` [by whatever ships the data], each with its own pool
+#   - reads that can tolerate a little lag go through `read_db()`, which picks a replica; writes always use `open_db()`
+#   - a user's own write pins their reads to the primary for `DB_REPLICA_STICKY_WINDOW` seconds [read-your-writes]
+STICKY_KEY = '_db_sticky_until'  # session key holding the end of the read-your-writes window
+
+
+def has_replicas(config):
+    return bool(config['DB_REPLICAS'] or config['DATABASE_REPLICA_URLS'])
+
+
+def get_replica_pools(app=None):  # returns the app's replica pools, creating them on first use [empty without `DB_REPLICAS`]
+    app = app or current_app._get_current_object()
+    pools = app.extensions.get('db_replica_pools')
+    if pools is None:
+        with _pool_lock:
+            pools = app.extensions.get('db_replica_pools')
+            if pools is None:
+                pools = app.extensions['db_replica_pools'] = [
+                    ConnectionPool(
+                        database,
+                        max_size=app.config['DB_POOL_SIZE'],
+                        timeout=app.config['DB_POOL_TIMEOUT'],
+                        pragmas=_pragmas(app.config),
+                        statement_listeners=app.extensions.setdefault('db_statement_listeners', [])
+                    )
+                    for database in app.config['DB_REPLICAS']
+                ]
+    return pools
+
+
+# use_replica(): whether the reads of the current request may be served by a (possibly lagging) replica
+#   - only outside of a write transaction and outside of the user's read-your-writes window
+#   - only for GET/HEAD requests, or within `replica_reads()` [for read-only lookups of other requests e.g. logging in]
+def use_replica():
+    if not has_request_context():
+        return False
+    if 'db' in g and g.db.in_transaction:
+        return False
+    if session.get(STICKY_KEY, 0) > time.time():
+        return False
+    return request.method in ('GET', 'HEAD') or g.get('replica_reads', False)
+
+
+@contextlib.contextmanager
+def replica_reads():  # allows the reads within the block to use a replica, whatever the request method
+    previous = g.get('replica_reads', False)
+    g.replica_reads = True
+    try:
+        yield
+    finally:
+        g.replica_reads = previous
+
+
+def stick_to_primary():  # starts the current user's read-your-writes window [called after each of their writes]
+    if has_request_context() and has_replicas(current_app.config):
+        session[STICKY_KEY] = time.time() + current_app.config['DB_REPLICA_STICKY_WINDOW']
+
+
+def read_db():  # read_db() checks a replica connection out once per application context, or falls back to `open_db()`
+    pools = get_replica_pools()
+    if not pools or not use_replica():
+        return open_db()
+    if 'replica_db' not in g:
+        pool = random.choice(pools)
+        g.replica_db = PooledConnection(pool, pool.acquire())
+    return g.replica_db
+
+
+def close_db(e=None):  # close_db() returns the checked out connections (if any) to their pools
+    for name in ('db', 'replica_db'):
+        db = g.pop(name, None)  # pop (i.e. remove) the db connection from the exist stack (i.e. of db connections)
 
-    if db is not None:
-        db.close()
+        if db is not None:
+            db.close()
 
 
 def init_db():  # init-db() initializes the SQL commands in schema.sql
@@ -29,6 +401,10 @@ def init_db():  # init-db() initializes the SQL commands in schema.sql
 def init_db_command():
     init_db()
     click.echo('Initialized the database.')
+    if current_app.config['STORAGE_ENGINE'] == 'sqlalchemy' and current_app.config['DATABASE_URL']:  # the posts and users live there
+        from awokogbon.sqlalchemy_repositories import init_storage  # imported here, as SQLAlchemy is slow to import [and only needed here]
+        init_storage()
+        click.echo('Initialized the storage database.')
 
 
 def init_app(app):  # registers `init_db_command()` and `close_db()` to ensure application context. Both would be added to the application factory __init__.py
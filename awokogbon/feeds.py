@@ -0,0 +1,80 @@
+import email.utils
+import hashlib
+from datetime import datetime, timezone
+from flask import (
+  Blueprint,
+  current_app,
+  render_template,
+  request,
+  url_for
+)
+from awokogbon.cache import current_generation, MemoryCache
+from awokogbon.repositories import get_posts
+
+blueprint = Blueprint('feeds', __name__)  # initialize a Blueprint instance
+
+# the feed formats, and the content type each one is served with
+FORMATS = {
+    'atom': 'application/atom+xml',
+    'rss': 'application/rss+xml',
+}
+
+
+def init_blueprint(app):  # registers `blueprint_instance`, the feed date filters and the feed cache
+    app.register_blueprint(blueprint)  # tells flask to register `bp` after creating `app` instance
+    app.add_template_filter(rfc3339)
+    app.add_template_filter(rfc822)
+    app.extensions['feed_cache'] = MemoryCache(max_entries=app.config['FEED_CACHE_MAX_ENTRIES'], ttl=app.config['FEED_CACHE_TTL'])
+
+
+def rfc3339(value):  # the timestamps are stored in UTC, without a zone
+    return value.replace(tzinfo=timezone.utc).isoformat()
+
+
+def rfc822(value):
+    return email.utils.format_datetime(value.replace(tzinfo=timezone.utc))
+
+
+# _refresh(): the feed entry for the posts' `generation`, from the latest `FEED_SIZE` posts [the same page query as `blog.index`]
+#   - the feed's version is the ids it lists and their latest edit, so only a write to the posts in the feed changes it
+#   - an unchanged version keeps the rendered `entry` [the write was to a post outside the feed], only a new one is rendered
+#   - the feed's links are absolute, built from `root`: so the `ETag` covers it, as feeds served for other hosts differ
+#   - an empty feed is dated when it was rendered [atom requires the feed's `<updated>`]
+def _refresh(kind, root, entry, generation):
+    size = current_app.config['FEED_SIZE']
+    posts = get_posts().page(limit=size)[:size]
+    updated = max(post['updated'] for post in posts) if posts else None
+    version = '{0}:{1}'.format(','.join(str(post['id']) for post in posts), updated)
+    if entry is not None and entry['version'] == version:
+        return dict(entry, generation=generation)
+    return {
+        'body': render_template('feeds/{0}.xml'.format(kind), posts=posts, updated=updated or datetime.utcnow()).encode('utf8'),
+        'etag': hashlib.sha1('{0}:{1}:{2}'.format(kind, root, version).encode('utf8')).hexdigest(),
+        'last_modified': updated,
+        'version': version,
+        'generation': generation,
+    }
+
+
+# Feed Views:
+#   - `/feed.atom` and `/feed.rss`, built from the latest posts and kept until a write changes the posts they list
+#   - a strong `ETag` derived from the listed posts and their latest edit, so an unchanged feed is a 304 without any render
+#   - a write from any process is seen through the posts' generation [see `cache.current_generation`]
+#   - cached per format and per host the links are built for: the request's `Host`, unless `SERVER_NAME` fixes it
+@blueprint.route('/feed.<any(atom, rss):kind>')
+def feed(kind):
+    cache = current_app.extensions['feed_cache']
+    root = url_for('index', _external=True)
+    key = '{0}:{1}'.format(kind, root)
+    generation = current_generation()
+    entry = cache.get(key)
+    if entry is None or entry['generation'] != generation:
+        entry = _refresh(kind, root, entry, generation)
+        cache.set(key, entry)
+
+    response = current_app.response_class(entry['body'], mimetype=FORMATS[kind])
+    response.set_etag(entry['etag'])
+    if entry['last_modified'] is not None:
+        response.last_modified = entry['last_modified']
+    response.cache_control.no_cache = True  # readers may store the feed, but must revalidate it [which is a cheap 304]
+    return response.make_conditional(request)
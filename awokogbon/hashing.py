@@ -0,0 +1,82 @@
+import concurrent.futures
+import threading
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import (
+    check_password_hash,
+    DEFAULT_PBKDF2_ITERATIONS,
+    generate_password_hash
+)
+
+
+class HashingPoolFull(ServiceUnavailable):  # a fast 503, raised instead of queueing yet another hash behind a full pool
+    description = 'The server is busy, please try again shortly.'
+
+    def __init__(self, retry_after=1):  # sent as the `Retry-After` header
+        super(HashingPoolFull, self).__init__(retry_after=retry_after)
+
+
+# HashingPool:
+#   - runs the CPU heavy password KDF calls on a bounded set of workers, off the request threads
+#   - threads are the default, as `hashlib`'s pbkdf2/scrypt release the GIL; processes are available for other KDFs
+#   - at most `max_workers + max_queue` hashes are admitted at once, anything beyond that is rejected with `HashingPoolFull`
+class HashingPool(object):
+    def __init__(self, max_workers=2, max_queue=16, executor='thread'):
+        executor_class = {
+            'thread': concurrent.futures.ThreadPoolExecutor,
+            'process': concurrent.futures.ProcessPoolExecutor,
+        }[executor]
+        self._executor = executor_class(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(False):
+            raise HashingPoolFull()
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda future: self._slots.release())
+        return future
+
+    def run(self, fn, *args):  # submits `fn` and blocks the calling request until it is done
+        return self.submit(fn, *args).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _pool():
+    return current_app.extensions['hashing_pool']
+
+
+def hash_password(password):  # hashes with the configured `PASSWORD_HASH_METHOD` [which includes the cost, e.g. the pbkdf2 iterations]
+    return _pool().run(
+        generate_password_hash, password, current_app.config['PASSWORD_HASH_METHOD'], current_app.config['PASSWORD_SALT_LENGTH']
+    )
+
+
+def verify_password(password_hash, password):
+    return _pool().run(check_password_hash, password_hash, password)
+
+
+def _parsed_method(method):  # a werkzeug hash method as `(kdf, digest, iterations)`, with werkzeug's defaults filled in e.g. 'pbkdf2:sha256'
+    kdf, _, options = method.partition(':')
+    if kdf != 'pbkdf2':  # a plain (or salted hmac) digest, which has no cost
+        return (method, None, None)
+    digest, _, iterations = options.partition(':')
+    return (kdf, digest, int(iterations or 0) or DEFAULT_PBKDF2_ITERATIONS)
+
+
+def needs_rehash(password_hash):  # whether a stored hash was made with a different method or cost than the configured one
+    stored = password_hash.split('$', 1)[0]
+    return _parsed_method(stored) != _parsed_method(current_app.config['PASSWORD_HASH_METHOD'])
+
+
+def init_app(app):  # creates the hashing pool from the (already loaded) app config
+    app.extensions['hashing_pool'] = HashingPool(
+        max_workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_queue=app.config['PASSWORD_HASH_QUEUE'],
+        executor=app.config['PASSWORD_HASH_EXECUTOR']
+    )
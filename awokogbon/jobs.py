@@ -0,0 +1,164 @@
+import json
+import logging
+import threading
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+logger = logging.getLogger(__name__)  # a child of the app's logger, so failed jobs go wherever the app logs
+
+_handlers = {}  # job kind -> handler
+
+
+# Jobs:
+#   - the side effects of a write that must run once, by whichever process claims them, recorded in the `job` outbox in the
+#     same transaction as the write [per-process state, like the page and feed caches, is not a job: see `cache.current_generation`]
+#   - so a job exists exactly when its write committed, and outlives a crash before it ran
+#   - each job is a `(kind, payload)` pair: the handler registered for `kind` is called with the `payload` dict as keyword arguments
+def handler(kind):  # registers the decorated function as the handler of `kind` jobs [run inside an app context]
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(db, jobs):  # records `jobs` in the caller's (still open) write transaction [on the 'sqlite' engine's connection]
+    db.executemany('INSERT INTO job (kind, payload) VALUES (?, ?)', [(kind, json.dumps(payload)) for kind, payload in jobs])
+
+
+def notify():  # called once the transaction recording jobs has committed, so they run now rather than on the next poll
+    queue = current_app.extensions.get('job_queue')
+    if queue is not None:
+        queue.notify()
+
+
+# JobQueue:
+#   - runs the due jobs of the outbox on `workers` threads, started on first use [so they are never forked, see `server.py`]
+#   - with no workers, `notify()` runs the due jobs itself, before the writing request returns
+#   - a claimed job is pushed back `timeout` seconds while it runs, so the job of a crashed worker is retried once that passes
+#   - a failed job is retried after `retry_delay` seconds, doubling each time, and moved to `dead_job` after `max_attempts`
+#   - every process runs its own queue over the same outbox, in the storage engine's database [see `repositories.get_jobs`],
+#     whose claims keep each job to one worker
+class JobQueue(object):
+    def __init__(self, app, workers=2, max_attempts=5, retry_delay=1.0, timeout=60.0, poll_interval=5.0):
+        self.app = app
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def notify(self):
+        if not self.workers:
+            self.run_pending()
+            return
+        if not self._threads:
+            with self._lock:
+                if not self._threads and not self._stopping:
+                    for number in range(self.workers):
+                        thread = threading.Thread(target=self._work, name='jobs-{0}'.format(number), daemon=True)
+                        thread.start()
+                        self._threads.append(thread)
+        self._wakeup.set()
+
+    def _work(self):
+        while not self._stopping:
+            try:
+                ran = self.run_next()
+            except Exception:  # e.g. a locked database: the job is still in the outbox, so it is only delayed
+                logger.exception('The job queue failed to claim a job.')
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def stop(self, timeout=None):  # stops the workers once their current job is done [jobs not yet run stay in the outbox]
+        self._stopping = True
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_pending(self):  # runs the due jobs until there are none left, returning how many were run
+        ran = 0
+        while self.run_next():
+            ran += 1
+        return ran
+
+    def run_next(self):  # claims and runs the next due job, returning False when no job is due
+        with self.app.app_context():
+            job = self._claim()
+            if job is None:
+                return False
+            try:
+                _handlers[job['kind']](**json.loads(job['payload']))
+            except Exception as e:
+                self._failed(job, e)
+            else:
+                _outbox().finish(job['id'])
+        return True
+
+    def _claim(self):
+        return _outbox().claim(time.time(), self.timeout, self.max_attempts)
+
+    def _failed(self, job, error):
+        attempts = job['attempts'] + 1
+        logger.warning('Job %s (%s) failed, attempt %s of %s.', job['id'], job['kind'], attempts, self.max_attempts, exc_info=True)
+        _outbox().fail(
+            job['id'], '{0}: {1}'.format(type(error).__name__, error),
+            None if attempts >= self.max_attempts else time.time() + self.retry_delay * 2 ** (attempts - 1)
+        )
+
+
+def _outbox():  # the outbox of the configured `STORAGE_ENGINE`
+    from awokogbon.repositories import get_jobs  # imported here, as `repositories` imports this module
+    return get_jobs()
+
+
+def get_queue():
+    return current_app.extensions['job_queue']
+
+
+# the `flask jobs` commands, to inspect the outbox and dead jobs, drain the outbox and retry dead jobs
+@click.group('jobs')
+def jobs_command():
+    pass
+
+
+@jobs_command.command('list')
+@click.option('--dead', is_flag=True, help='List the dead jobs, instead of the queued ones.')
+@click.option('--limit', default=20, show_default=True, help='Number of jobs listed, oldest first.')
+@with_appcontext
+def list_command(dead, limit):
+    click.echo('{0} queued ({1} due), {2} dead.'.format(*_outbox().counts(time.time())))
+    for job in _outbox().list(dead, limit):
+        click.echo('{0:>8} {1} {2} attempts={3} {4}'.format(job['id'], job['kind'], job['payload'], job['attempts'], job['last_error'] or ''))
+
+
+@jobs_command.command('run')
+@with_appcontext
+def run_command():  # drains the outbox in this process, e.g. after the workers were stopped with jobs still queued
+    click.echo('Ran {0} jobs.'.format(get_queue().run_pending()))
+
+
+@jobs_command.command('retry')
+@click.argument('ids', nargs=-1, type=int)
+@with_appcontext
+def retry_command(ids):  # puts the dead jobs `ids` [or every dead job] back in the outbox, with their attempts reset
+    click.echo('Retried {0} jobs.'.format(_outbox().retry(ids)))
+
+
+def init_app(app):  # creates the app's job queue from the (already loaded) app config, and registers the `jobs` commands
+    app.extensions['job_queue'] = JobQueue(
+        app,
+        workers=app.config['JOB_WORKERS'],
+        max_attempts=app.config['JOB_MAX_ATTEMPTS'],
+        retry_delay=app.config['JOB_RETRY_DELAY'],
+        timeout=app.config['JOB_TIMEOUT'],
+        poll_interval=app.config['JOB_POLL_INTERVAL']
+    )
+    app.cli.add_command(jobs_command)
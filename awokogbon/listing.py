@@ -0,0 +1,126 @@
+import click
+from markupsafe import escape
+from flask import current_app
+from flask.cli import with_appcontext
+from awokogbon.db import open_db, write_transaction
+from awokogbon.rendering import make_excerpt, render_markdown
+
+
+# The post listing projection [the `post_listing` and `author_listing` tables]:
+#   - a copy of what the index page shows, with the author's name already in each row, so listing posts needs no JOIN
+#   - posts are listed by a fixed-length `excerpt` computed at write time, so a row's size does not grow with its post's body
+#   - `post_listing` is keyed by `(created, id)` WITHOUT ROWID, so a page of the index is one range scan of its primary key
+#   - kept up to date by the repositories' writes, in the same transaction as the write itself
+#   - writes that bypass the repositories (e.g. `import-posts`) must be followed by `rebuild_listing()`
+#   - a post not rendered yet is listed by its markdown source, until its `render_post` job stores the html [see `rendering.py`]
+def add_post(db, id):
+    post = db.execute('SELECT body, body_html FROM post WHERE id = ?', (id,)).fetchone()
+    db.execute(
+        'INSERT OR REPLACE INTO post_listing (created, id, updated, author_id, author_name, title, excerpt)'
+        ' SELECT p.created, p.id, p.updated, p.author_id, u.username, p.title, ?'
+        ' FROM post p JOIN user u ON p.author_id = u.id WHERE p.id = ?',
+        (_excerpt(post['body'], post['body_html'], render=False), id)
+    )
+    db.execute('UPDATE author_listing SET post_count = post_count + 1 WHERE id = (SELECT author_id FROM post WHERE id = ?)', (id,))
+
+
+def update_post(db, id):
+    post = db.execute('SELECT body, body_html FROM post WHERE id = ?', (id,)).fetchone()
+    db.execute(
+        'UPDATE post_listing SET (title, updated) = (SELECT title, updated FROM post WHERE id = ?), excerpt = ?'
+        ' WHERE id = ?', (id, _excerpt(post['body'], post['body_html'], render=False), id)
+    )
+
+
+def remove_post(db, id):  # must run before the post itself is deleted
+    db.execute('UPDATE author_listing SET post_count = post_count - 1 WHERE id = (SELECT author_id FROM post WHERE id = ?)', (id,))
+    db.execute('DELETE FROM post_listing WHERE id = ?', (id,))
+
+
+def add_author(db, id):
+    db.execute('INSERT OR REPLACE INTO author_listing (id, username, post_count) SELECT id, username, 0 FROM user WHERE id = ?', (id,))
+
+
+def _excerpt(body, body_html, render=True):  # without `render`, a post with no `body_html` is excerpted from its (escaped) markdown
+    if body_html is None:
+        body_html = render_markdown(body) if render else escape(body)
+    return make_excerpt(body_html, current_app.config['EXCERPT_LENGTH'])
+
+
+# rebuilds the whole projection from the `post` and `user` tables, streaming the posts `batch_size` at a time
+#   - the views keep writing in between the batches, so a batch replaces the rows `add_post()` listed since the rebuild began
+def rebuild_listing(batch_size=1000):
+    with write_transaction() as db:
+        db.execute('DELETE FROM post_listing')
+        db.execute('DELETE FROM author_listing')
+        db.execute(
+            'INSERT INTO author_listing (id, username, post_count)'
+            ' SELECT u.id, u.username, (SELECT COUNT(*) FROM post p WHERE p.author_id = u.id) FROM user u'
+        )
+
+    db = open_db()
+    rebuilt = 0
+    last_id = 0
+    while True:
+        rows = db.execute('SELECT id, body, body_html FROM post WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)).fetchall()
+        if not rows:
+            return rebuilt
+        with write_transaction() as db:
+            db.executemany(  # the timestamps are copied by SQLite itself, so they keep their stored text exactly
+                'INSERT OR REPLACE INTO post_listing (created, id, updated, author_id, author_name, title, excerpt)'
+                ' SELECT p.created, p.id, p.updated, p.author_id, u.username, p.title, ?'
+                ' FROM post p JOIN user u ON p.author_id = u.id WHERE p.id = ?',
+                [(_excerpt(row['body'], row['body_html']), row['id']) for row in rows]
+            )
+        rebuilt += len(rows)
+        last_id = rows[-1]['id']
+
+
+# checks the projection against the `post` and `user` tables, returning the number of rows out of line in each
+def check_listing():
+    db = open_db()
+    return {
+        'missing posts': db.execute(
+            'SELECT COUNT(*) FROM post p WHERE NOT EXISTS (SELECT 1 FROM post_listing l WHERE l.id = p.id)'
+        ).fetchone()[0],
+        'deleted posts': db.execute(
+            'SELECT COUNT(*) FROM post_listing l WHERE NOT EXISTS (SELECT 1 FROM post p WHERE p.id = l.id)'
+        ).fetchone()[0],
+        'stale posts': db.execute(
+            'SELECT COUNT(*) FROM post p JOIN user u ON p.author_id = u.id JOIN post_listing l ON l.id = p.id'
+            ' WHERE l.created IS NOT p.created OR l.updated IS NOT p.updated OR l.title IS NOT p.title'
+            ' OR l.author_id IS NOT p.author_id OR l.author_name IS NOT u.username'
+        ).fetchone()[0],
+        'stale authors': db.execute(
+            'SELECT COUNT(*) FROM user u LEFT JOIN author_listing a ON a.id = u.id'
+            ' WHERE a.id IS NULL OR a.username IS NOT u.username'
+            ' OR a.post_count != (SELECT COUNT(*) FROM post p WHERE p.author_id = u.id)'
+        ).fetchone()[0],
+    }
+
+
+@click.command('check-listing')  # a decorator to turn `check_listing()` into a command line tool
+@click.option('--rebuild', is_flag=True, help='Rebuild the projection when it is out of line.')
+@with_appcontext  # this ensures application context is set when `check_listing_command` is called
+def check_listing_command(rebuild):
+    problems = {name: count for name, count in check_listing().items() if count}
+    if not problems:
+        click.echo('The post listing is consistent.')
+        return
+    for name, count in problems.items():
+        click.echo('{0}: {1}'.format(name, count))
+    if not rebuild:
+        raise click.ClickException('The post listing is out of line, run `flask rebuild-listing` (or pass --rebuild).')
+    click.echo('Rebuilt {0} posts.'.format(rebuild_listing()))
+
+
+@click.command('rebuild-listing')  # a decorator to turn `rebuild_listing()` into a command line tool
+@click.option('--batch-size', default=1000, show_default=True, help='Posts copied per transaction.')
+@with_appcontext  # this ensures application context is set when `rebuild_listing_command` is called
+def rebuild_listing_command(batch_size):
+    click.echo('Rebuilt {0} posts.'.format(rebuild_listing(batch_size)))
+
+
+def init_app(app):  # registers the projection's commands
+    app.cli.add_command(check_listing_command)
+    app.cli.add_command(rebuild_listing_command)
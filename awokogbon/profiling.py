@@ -0,0 +1,256 @@
+import bisect
+import collections
+import cProfile
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+import click
+from werkzeug.exceptions import abort
+from flask import (
+  before_render_template,
+  current_app,
+  g,
+  has_app_context,
+  jsonify,
+  request,
+  template_rendered
+)
+
+_STARTED = 'awokogbon.profiling.started'  # wsgi environ key holding the request's start time
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # upper bounds of the latency histogram buckets [plus one for anything slower]
+
+
+# RouteStats:
+#   - rolling per-endpoint latency histograms, kept for the current and the previous `window` seconds
+#   - so the stats always describe the last one to two windows of traffic, not the whole life of the process
+class RouteStats(object):
+    def __init__(self, window=300):
+        self.window = window
+        self._lock = threading.Lock()
+        self._window_started = time.time()
+        self._current = {}
+        self._previous = {}
+
+    def _rotate(self, now):  # must be called while holding `_lock`
+        if now - self._window_started >= self.window:
+            self._previous = self._current if now - self._window_started < 2 * self.window else {}
+            self._current = {}
+            self._window_started = now
+
+    def record(self, endpoint, duration, queries, query_time):
+        with self._lock:
+            self._rotate(time.time())
+            stats = self._current.get(endpoint)
+            if stats is None:
+                stats = self._current[endpoint] = {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+                                                   'query_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)}
+            ms = duration * 1000
+            stats['count'] += 1
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            stats['queries'] += queries
+            stats['query_ms'] += query_time * 1000
+            stats['buckets'][bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def snapshot(self):  # merges both windows into one json-ready dict per endpoint
+        with self._lock:
+            self._rotate(time.time())
+            merged = {}
+            for window in (self._previous, self._current):
+                for endpoint, stats in window.items():
+                    total = merged.setdefault(endpoint, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queries': 0,
+                                                         'query_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)})
+                    for key in ('count', 'total_ms', 'queries', 'query_ms'):
+                        total[key] += stats[key]
+                    total['max_ms'] = max(total['max_ms'], stats['max_ms'])
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], stats['buckets'])]
+        for stats in merged.values():
+            stats['mean_ms'] = stats['total_ms'] / stats['count']
+            stats['histogram'] = collections.OrderedDict(
+                ('le_{0}ms'.format(bound) if bound else 'slower', count)
+                for bound, count in zip(BUCKETS_MS + (None,), stats.pop('buckets'))
+            )
+        return merged
+
+
+def _timings():  # the current request's accumulated timings, in seconds
+    if '_timings' not in g:
+        g._timings = collections.defaultdict(float)
+        g._timings['queries'] = 0
+    return g._timings
+
+
+def _on_statement(connection, method, sql, parameters, duration):  # pool statement listener [see `db.ConnectionPool`]
+    if has_app_context():
+        timings = _timings()
+        timings['queries'] += 1
+        timings['db'] += duration
+
+
+def _on_before_render(app, template, context, **extra):
+    g._template_started = time.perf_counter()
+
+
+def _on_rendered(app, template, context, **extra):
+    started = g.pop('_template_started', None)
+    if started is not None:
+        _timings()['template'] += time.perf_counter() - started
+
+
+# TimedSessionInterface: wraps the app's session backend, timing how long loading and saving the session takes
+class TimedSessionInterface(object):
+    def __init__(self, session_interface):
+        self.session_interface = session_interface
+
+    def __getattr__(self, name):
+        return getattr(self.session_interface, name)
+
+    def open_session(self, app, request):
+        started = time.perf_counter()
+        try:
+            return self.session_interface.open_session(app, request)
+        finally:
+            _timings()['session_open'] += time.perf_counter() - started
+
+    def save_session(self, app, session, response):
+        started = time.perf_counter()
+        try:
+            return self.session_interface.save_session(app, session, response)
+        finally:
+            _timings()['session_save'] += time.perf_counter() - started
+
+
+# ProfilingMiddleware:
+#   - records when each request starts, before flask itself runs
+#   - runs a random `sample_rate` share of requests under cProfile, and dumps the profile of those slower than `slow_threshold` seconds
+class ProfilingMiddleware(object):
+    def __init__(self, wsgi_app, sample_rate=0.0, slow_threshold=0.5, directory=None):
+        self.wsgi_app = wsgi_app
+        self.sample_rate = sample_rate
+        self.slow_threshold = slow_threshold
+        self.directory = directory
+
+    def __call__(self, environ, start_response):
+        environ[_STARTED] = time.perf_counter()
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.wsgi_app(environ, start_response)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return self.wsgi_app(environ, start_response)
+        finally:
+            profiler.disable()
+            if time.perf_counter() - environ[_STARTED] >= self.slow_threshold:
+                os.makedirs(self.directory, exist_ok=True)
+                name = '{0}-{1}.prof'.format(
+                    datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), environ.get('PATH_INFO', '').strip('/').replace('/', '_') or 'index'
+                )
+                profiler.dump_stats(os.path.join(self.directory, name))  # inspect with `python -m pstats <file>`
+
+
+def _server_timing(response):  # adds the request's timings as a `Server-Timing` header [the session save runs later, so it is only in the stats]
+    timings = _timings()
+    started = request.environ.get(_STARTED)
+    metrics = [
+        'db;dur={0:.2f};desc="{1} queries"'.format(timings['db'] * 1000, timings['queries']),
+        'template;dur={0:.2f}'.format(timings['template'] * 1000),
+        'session;dur={0:.2f}'.format(timings['session_open'] * 1000),
+    ]
+    if started is not None:
+        metrics.append('app;dur={0:.2f}'.format((time.perf_counter() - started) * 1000))
+    response.headers.add('Server-Timing', ', '.join(metrics))
+    return response
+
+
+def _record(exc=None):  # runs once the response (and the session) is done, to add the request to the route stats
+    started = request.environ.get(_STARTED)
+    if started is None:
+        return
+    timings = _timings()
+    current_app.extensions['route_stats'].record(
+        request.endpoint or '<unmatched>', time.perf_counter() - started, timings['queries'], timings['db']
+    )
+
+
+# Profiling Stats View:
+#   - the rolling per-route stats, and the rate limiter's allowed/throttled counters, as json
+#   - when `PROFILING_STATS_TOKEN` is set, it must be passed as `?token=`
+def stats():
+    token = current_app.config['PROFILING_STATS_TOKEN']
+    if token and request.args.get('token') != token:
+        abort(403)
+    limiter = current_app.extensions.get('rate_limiter')
+    return jsonify(window_seconds=current_app.extensions['route_stats'].window,
+                   routes=current_app.extensions['route_stats'].snapshot(),
+                   rate_limits=limiter.stats() if limiter is not None else {})
+
+
+# run in a fresh interpreter by `measure_startup()`, reporting its timings as the last line of stdout
+_STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from awokogbon import create_app
+imported = time.perf_counter()
+create_app(json.loads(sys.argv[1]))
+print(json.dumps({'import': imported - started, 'create_app': time.perf_counter() - imported}))
+'''
+
+
+# measures a cold start: importing the package and creating the app, in a new interpreter [so nothing is imported yet]
+#   - returns the two timings, and `(module, self, cumulative)` seconds for every module imported [from `python -X importtime`]
+#   - `test_config` is passed to `create_app()`, and must be json serialisable
+def measure_startup(test_config=None):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', _STARTUP_SCRIPT, json.dumps(test_config)],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True
+    )
+    if result.returncode:
+        raise RuntimeError('Creating the app failed:\n' + result.stderr[-2000:])
+
+    modules = []
+    for line in result.stderr.splitlines():
+        own, _, rest = line.partition('import time:')[2].partition('|')
+        cumulative, _, name = rest.partition('|')
+        try:
+            modules.append((name.strip(), int(own) / 1e6, int(cumulative) / 1e6))
+        except ValueError:  # the header line, and anything else written to stderr
+            continue
+    return json.loads(result.stdout.splitlines()[-1]), modules
+
+
+@click.command('profile-startup')  # a decorator to turn `measure_startup()` into a command line tool
+@click.option('--limit', default=25, show_default=True, help='Number of modules listed.')
+@click.option('--sort', type=click.Choice(['cumulative', 'self']), default='cumulative', show_default=True,
+              help='Order modules by their own import time, or including the modules they import.')
+def profile_startup_command(limit, sort):
+    try:
+        timings, modules = measure_startup()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo('Imported awokogbon in {0:.1f}ms, create_app() took {1:.1f}ms.'.format(timings['import'] * 1000, timings['create_app'] * 1000))
+    click.echo('{0:>10} {1:>12}  module'.format('self', 'cumulative'))
+    for name, own, cumulative in sorted(modules, key=lambda module: module[2 if sort == 'cumulative' else 1], reverse=True)[:limit]:
+        click.echo('{0:>8.1f}ms {1:>10.1f}ms  {2}'.format(own * 1000, cumulative * 1000, name))
+
+
+def init_app(app):  # wires the instrumentation into the app, after its session backend and blueprints are set up [only called when enabled]
+    app.extensions['route_stats'] = RouteStats(window=app.config['PROFILING_WINDOW'])
+    app.extensions.setdefault('db_statement_listeners', []).append(_on_statement)
+    app.session_interface = TimedSessionInterface(app.session_interface)
+    before_render_template.connect(_on_before_render, app)
+    template_rendered.connect(_on_rendered, app)
+    app.after_request(_server_timing)
+    app.teardown_request(_record)
+    app.add_url_rule('/_profiling/stats', 'profiling_stats', stats)
+    app.wsgi_app = ProfilingMiddleware(
+        app.wsgi_app,
+        sample_rate=app.config['PROFILING_SAMPLE_RATE'],
+        slow_threshold=app.config['PROFILING_SLOW_THRESHOLD'],
+        directory=app.config['PROFILING_DIR'] or os.path.join(app.instance_path, 'profiles')
+    )
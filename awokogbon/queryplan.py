@@ -0,0 +1,122 @@
+import logging
+import sqlite3
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from awokogbon.blog import encode_cursor
+from awokogbon.db import open_db
+
+logger = logging.getLogger(__name__)  # a child of the app's logger, so slow queries go wherever the app logs
+
+
+def explain(connection, sql, parameters=None):  # the `EXPLAIN QUERY PLAN` details of a statement, one string per plan step
+    try:
+        return [row[3] for row in connection.execute('EXPLAIN QUERY PLAN ' + sql, parameters or ())]
+    except sqlite3.Error as e:  # e.g. DDL, or a statement that only makes sense inside its own transaction
+        return ['(no plan: {0})'.format(e)]
+
+
+def full_scans(plan):  # the plan steps that read a whole table [an ordered index scan, or a virtual table lookup, is fine]
+    return [step for step in plan
+            if (step.startswith('SCAN ') and ' INDEX ' not in step and 'VIRTUAL TABLE' not in step) or 'TEMP B-TREE' in step]
+
+
+def parameters_shape(parameters):  # the types of a statement's parameters, never their values [which may be passwords]
+    if parameters is None:
+        return '()'
+    if isinstance(parameters, dict):
+        return '{' + ', '.join('{0}: {1}'.format(key, type(value).__name__) for key, value in parameters.items()) + '}'
+    if not isinstance(parameters, (list, tuple)):  # e.g. the rows generator given to `executemany`
+        return type(parameters).__name__
+    return '(' + ', '.join(type(value).__name__ for value in parameters) + ')'
+
+
+# SlowQueryLog:
+#   - a pool statement listener [see `db.ConnectionPool`] logging every statement slower than `threshold` seconds
+#   - each entry has the statement, the shape of its parameters, its duration and its query plan
+class SlowQueryLog(object):
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def __call__(self, connection, method, sql, parameters, duration):
+        if duration < self.threshold:
+            return
+        plan = explain(connection, sql, parameters) if method == 'execute' else []  # a script, or a batch, has no single plan
+        logger.warning(
+            'Slow query (%.1f ms): %s params=%s plan=%s%s',
+            duration * 1000, ' '.join(sql.split()), parameters_shape(parameters), plan,
+            ' FULL SCAN' if full_scans(plan) else ''
+        )
+
+
+# the read-only requests that exercise the app's queries [the `{placeholders}` are filled from the database]
+EXPLAINED_REQUESTS = (
+    ('GET', '/', False),
+    ('GET', '/', True),
+    ('GET', '/?cursor={cursor}', False),
+    ('GET', '/api/posts', False),
+    ('GET', '/api/posts/{post_id}', False),
+    ('GET', '/search?q={word}', False),
+    ('GET', '/{post_id}/update', True),
+    ('POST', '/auth/login', False),
+)
+
+
+# capture_queries():
+#   - runs `EXPLAINED_REQUESTS` through a test client against the current database, logged in as a post's author where needed
+#   - records every distinct statement the app issues along the way, with its parameters
+#   - only read-only requests are made [a login with a wrong password writes nothing]
+def capture_queries():
+    app = current_app._get_current_object()
+    db = open_db()
+    post = db.execute('SELECT p.id, p.author_id, p.title, u.username FROM post p JOIN user u ON p.author_id = u.id LIMIT 1').fetchone()
+    values = {
+        'post_id': post['id'] if post else 1,
+        'author_id': post['author_id'] if post else 1,
+        'username': post['username'] if post else 'nobody',
+        'word': (post['title'].split() or ['post'])[0] if post else 'post',
+        'cursor': encode_cursor(datetime.utcnow(), 0),  # seeks from now, so the page query with a cursor is exercised too
+    }
+
+    captured = {}
+
+    def listener(connection, method, sql, parameters, duration):
+        if method == 'execute' and not sql.lstrip().upper().startswith(('PRAGMA', 'EXPLAIN', 'SELECT 1')):
+            captured.setdefault(' '.join(sql.split()), parameters)
+    listeners = app.extensions.setdefault('db_statement_listeners', [])
+    listeners.append(listener)
+    try:
+        for method, path, logged_in in EXPLAINED_REQUESTS:
+            with app.app_context():  # a fresh `g` per request [flask would otherwise reuse the command's app context, and its `g.user`]
+                client = app.test_client()
+                if logged_in:
+                    with client.session_transaction() as session:
+                        session['user_id'] = values['author_id']
+                data = {'username': values['username'], 'password': ''} if method == 'POST' else None
+                client.open(path.format(**values), method=method, data=data)
+    finally:
+        listeners.remove(listener)
+    return captured
+
+
+@click.command('explain-queries')  # a decorator to turn `capture_queries()` into a command line tool
+@with_appcontext  # this ensures application context is set when `explain_queries_command` is called
+def explain_queries_command():
+    db = open_db()
+    scans = 0
+    for sql, parameters in capture_queries().items():
+        plan = explain(db, sql, parameters)
+        flagged = full_scans(plan)
+        scans += bool(flagged)
+        click.echo('{0} {1}'.format('FULL SCAN' if flagged else 'ok       ', sql))
+        for step in plan:
+            click.echo('            {0}{1}'.format(step, '  <--' if step in flagged else ''))
+    click.echo('{0} queries with full scans.'.format(scans))
+
+
+def init_app(app):  # adds the slow query log [unless `DB_SLOW_QUERY_THRESHOLD` is None] and the `explain-queries` command
+    threshold = app.config['DB_SLOW_QUERY_THRESHOLD']
+    if threshold is not None:
+        app.extensions.setdefault('db_statement_listeners', []).append(SlowQueryLog(threshold / 1000.0))
+    app.cli.add_command(explain_queries_command)
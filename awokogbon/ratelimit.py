@@ -0,0 +1,143 @@
+import collections
+import functools
+import math
+import threading
+import time
+from flask import current_app, request
+from werkzeug.exceptions import TooManyRequests
+from awokogbon.db import write_transaction
+
+
+class RateLimited(TooManyRequests):  # a 429, raised before the view does any database or hashing work
+    description = 'Too many attempts, please try again later.'
+
+    def __init__(self, retry_after=1):  # sent as the `Retry-After` header
+        super(RateLimited, self).__init__(retry_after=retry_after)
+
+
+# take_token(): the token bucket arithmetic shared by the stores
+#   - a bucket holds up to `capacity` tokens and refills at `rate` tokens per second; each request takes one
+#   - returns the bucket's new `tokens`, and the seconds until a token is available again (0 when this request may proceed)
+def take_token(tokens, updated, now, capacity, rate):
+    tokens = min(capacity, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / rate
+
+
+# MemoryStore:
+#   - the buckets of this process only, kept in a bounded LRU [dropping an idle bucket only forgets a full one]
+class MemoryStore(object):
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens, retry_after = take_token(tokens, updated, now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# SqliteStore:
+#   - the buckets in the `rate_limit` table of the app database, so every worker process draws from the same buckets
+#   - each take is one short `BEGIN IMMEDIATE` transaction, so concurrent workers can not both spend the last token
+class SqliteStore(object):
+    def take(self, key, capacity, rate):
+        now = time.time()
+        with write_transaction() as db:
+            row = db.execute('SELECT tokens, updated FROM rate_limit WHERE key = ?', (key,)).fetchone()
+            tokens, retry_after = take_token(row['tokens'], row['updated'], now, capacity, rate) if row else (capacity - 1, 0)
+            db.execute('INSERT OR REPLACE INTO rate_limit (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+        return retry_after
+
+    def sweep(self, now, max_idle):  # drops the buckets idle for long enough to be full again
+        with write_transaction() as db:
+            db.execute('DELETE FROM rate_limit WHERE updated < ?', (now - max_idle,))
+
+    def clear(self):
+        with write_transaction() as db:
+            db.execute('DELETE FROM rate_limit')
+
+
+# RateLimiter:
+#   - `RATELIMIT_RULES` maps an action (e.g. 'login') to its limits per client ip and/or per submitted username,
+#     each as `(requests, per_seconds)` e.g. `{'login': {'ip': (20, 60), 'username': (5, 60)}}`
+#   - counts the allowed and throttled requests per action and key type, for monitoring [see `stats()`]
+class RateLimiter(object):
+    def __init__(self, store, rules, sweep_interval=300):
+        self.store = store
+        self.rules = rules
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+
+    def check(self, action, ip, username=None):  # raises `RateLimited` when any of the action's buckets is empty
+        retry_after = 0
+        for key_type, value in (('ip', ip), ('username', username)):
+            limit = self.rules.get(action, {}).get(key_type)
+            if limit is None or not value:
+                continue
+            requests, per_seconds = limit
+            wait = self.store.take('{0}:{1}:{2}'.format(action, key_type, value), requests, requests / float(per_seconds))
+            with self._lock:
+                self._counters[action, key_type, 'throttled' if wait else 'allowed'] += 1
+            retry_after = max(retry_after, wait)
+        self._maybe_sweep()
+        if retry_after:
+            raise RateLimited(retry_after=int(math.ceil(retry_after)))
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if not hasattr(self.store, 'sweep') or now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        max_idle = max(per_seconds for limits in self.rules.values() for requests, per_seconds in limits.values())
+        self.store.sweep(now, max_idle)
+
+    def stats(self):  # e.g. `{'login': {'ip': {'allowed': 10, 'throttled': 2}}}`
+        stats = {}
+        with self._lock:
+            for (action, key_type, outcome), count in self._counters.items():
+                stats.setdefault(action, {}).setdefault(key_type, {'allowed': 0, 'throttled': 0})[outcome] = count
+        return stats
+
+
+# Rate Limited decorator:
+#   - throttles the POSTs of a view by client ip and submitted `username`, before the view itself runs
+#   - GETs (i.e. just showing the form) are never throttled
+def rate_limited(action):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapped_view(**kwargs):
+            limiter = current_app.extensions.get('rate_limiter')
+            if limiter is not None and request.method == 'POST':
+                limiter.check(action, request.remote_addr, request.form.get('username'))
+            return view(**kwargs)
+        return wrapped_view
+    return decorator
+
+
+def create_store(app):  # builds the bucket store selected by `RATELIMIT_STORAGE`
+    storage = app.config['RATELIMIT_STORAGE']
+    if storage == 'memory':
+        return MemoryStore(max_entries=app.config['RATELIMIT_MAX_ENTRIES'])
+    if storage == 'sqlite':
+        return SqliteStore()
+    raise ValueError('Unknown RATELIMIT_STORAGE {0!r}.'.format(storage))
+
+
+def init_app(app):  # creates the rate limiter from the (already loaded) app config [empty `RATELIMIT_RULES` disable it]
+    if app.config['RATELIMIT_RULES']:
+        app.extensions['rate_limiter'] = RateLimiter(create_store(app), app.config['RATELIMIT_RULES'])
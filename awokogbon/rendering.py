@@ -0,0 +1,100 @@
+import hashlib
+import threading
+import click
+from markupsafe import Markup
+from flask import current_app
+from flask.cli import with_appcontext
+from awokogbon import jobs
+from awokogbon.cache import MemoryCache
+from awokogbon.db import open_db, write_transaction
+
+_local = threading.local()  # a `Markdown` instance is not thread safe, so each thread keeps its own
+_rendered = MemoryCache(max_entries=1024, ttl=3600)  # rendered html by content hash, for posts that have no stored `body_html` yet
+
+
+def render_markdown(text):  # renders a post body to sanitised html [see `safe_markdown.py`]
+    md = getattr(_local, 'markdown', None)
+    if md is None:
+        from awokogbon.safe_markdown import create_markdown  # only imported when a post is first rendered [markdown is slow to import]
+        md = _local.markdown = create_markdown()
+    return md.reset().convert(text)
+
+
+def make_excerpt(html, length=280):  # the plain text start of a rendered post, cut at a word boundary
+    text = Markup(html).striptags()  # also collapses the whitespace
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0] + '\u2026'
+
+
+def render_jobs(id, body_html):  # the jobs of a post write [see `repositories.py`]: a post stored without `body_html` gets rendered
+    return [('render_post', {'id': id})] if body_html is None else []
+
+
+# the `render_post` job: renders a post's markdown after its write committed, instead of in the author's request
+#   - until it runs, the post is listed by its markdown source and shown through `post_body_html`
+#   - the html is only stored if the post was not edited since it was read [the edit recorded its own job]
+@jobs.handler('render_post')
+def render_post(id):
+    from awokogbon.repositories import get_posts  # imported here, as `repositories` imports this module (through `listing`)
+    post = get_posts().get(id)
+    if post is not None:
+        get_posts().set_body_html(id, post['body'], render_markdown(post['body']))
+
+
+# returns a post's body as html
+#   - from its `body_html` column, filled in at write time
+#   - or else (for rows not yet backfilled) rendered once and memoised by content hash
+def post_body_html(post):
+    html = post['body_html']
+    if html is None:
+        key = hashlib.sha1(post['body'].encode('utf8')).hexdigest()
+        html = _rendered.get(key)
+        if html is None:
+            html = render_markdown(post['body'])
+            _rendered.set(key, html)
+    return Markup(html)
+
+
+# renders the `body_html` of existing posts, streaming them `batch_size` at a time [never loading the whole table]
+#   - adds the `body_html` column first, for databases created before it existed
+#   - only posts without `body_html` are rendered, unless `rerender` is set
+def backfill_body_html(batch_size=500, rerender=False):
+    db = open_db()
+    if 'body_html' not in [column['name'] for column in db.execute('PRAGMA table_info(post)')]:
+        with write_transaction() as db:
+            db.execute('ALTER TABLE post ADD COLUMN body_html TEXT')
+
+    rendered = 0
+    last_id = 0
+    while True:
+        rows = db.execute(
+            'SELECT id, body FROM post WHERE id > ? AND (? OR body_html IS NULL) ORDER BY id LIMIT ?',
+            (last_id, rerender, batch_size)
+        ).fetchall()
+        if not rows:
+            return rendered
+        html = [(render_markdown(row['body']), row['id'], row['body']) for row in rows]
+        with write_transaction() as db:
+            db.executemany('UPDATE post SET body_html = ? WHERE id = ? AND body = ?', html)  # skips posts edited since they were read
+            db.executemany(  # and keeps the post listing projection in line [see `listing.py`]
+                'UPDATE post_listing SET excerpt = ?4'
+                ' WHERE id = ?2 AND EXISTS (SELECT 1 FROM post WHERE id = ?2 AND body = ?3)',
+                [row + (make_excerpt(row[0], current_app.config['EXCERPT_LENGTH']),) for row in html]
+            )
+        rendered += len(rows)
+        last_id = rows[-1]['id']
+
+
+@click.command('render-posts')  # a decorator to turn `backfill_body_html()` into a command line tool
+@click.option('--batch-size', default=500, show_default=True, help='Posts rendered per transaction.')
+@click.option('--all', 'rerender', is_flag=True, help='Re-render every post, not only those without html.')
+@with_appcontext  # this ensures application context is set when `render_posts_command` is called
+def render_posts_command(batch_size, rerender):
+    rendered = backfill_body_html(batch_size, rerender)
+    click.echo('Rendered {0} posts.'.format(rendered))
+
+
+def init_app(app):  # registers the `post_body_html` template filter and the `render-posts` command
+    app.add_template_filter(post_body_html, 'body_html')
+    app.cli.add_command(render_posts_command)
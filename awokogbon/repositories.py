@@ -0,0 +1,279 @@
+import collections
+import threading
+from flask import current_app
+from awokogbon import listing
+from awokogbon.cache import forget_generation
+from awokogbon.db import open_db, read_db, stick_to_primary, write_transaction
+from awokogbon.jobs import enqueue, notify
+from awokogbon.rendering import render_jobs
+
+_engine_lock = threading.Lock()
+
+# the post columns shown on the index page, as read from the `post_listing` projection [see `listing.py`]
+#   - an excerpt rather than the body, so a page's size is bounded by `POSTS_PER_PAGE` and `EXCERPT_LENGTH`
+LISTING_COLUMNS = ('id', 'title', 'excerpt', 'created', 'updated', 'author_id', 'author_name AS username')
+LISTING_START = ('9999-12-31 23:59:59', 0)  # a cursor past every post
+
+# the post fields `stream()` can select [e.g. by the json api's `?fields=`], and the column each one is read from
+POST_FIELDS = collections.OrderedDict([
+    ('id', 'p.id'),
+    ('title', 'p.title'),
+    ('body', 'p.body'),
+    ('body_html', 'p.body_html'),
+    ('created', 'p.created'),
+    ('updated', 'p.updated'),
+    ('author_id', 'p.author_id'),
+    ('username', 'u.username'),
+])
+
+# sentinels wrapped around the matched terms of a `search()` result, swapped for `<mark>` tags once the text is escaped [see `search.py`]
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+# the posts matching the FTS5 expression `:match`, best match first (FTS5's bm25 `rank`) [the `post_search` index of `schema.sql`]
+SEARCH_QUERY = (
+    'SELECT p.id, p.created, p.author_id, u.username,'
+    ' highlight(post_search, 0, :start, :end) AS title,'
+    ' snippet(post_search, 1, :start, :end, \'…\', 32) AS body'
+    ' FROM post_search'
+    ' JOIN post p ON p.id = post_search.rowid'
+    ' JOIN user u ON p.author_id = u.id'
+    ' WHERE post_search MATCH :match'
+    ' ORDER BY rank LIMIT :limit OFFSET :offset'
+)
+
+
+def search_parameters(terms, offset, limit):  # the parameters of `SEARCH_QUERY` [every term is quoted, so user input is never FTS5 query syntax]
+    match = ' '.join('"{0}"'.format(term.replace('"', '""')) for term in terms)
+    return {'start': MATCH_START, 'end': MATCH_END, 'match': match, 'limit': limit, 'offset': offset}
+
+
+# select a single page of posts, newest first, seeking past `cursor` [instead of OFFSET-ing through every earlier row]
+#   - the `(created, id)` seek is served by the `post_created_id` index, so the cost is the same for page 1 and page 10,000
+#   - one extra row is selected to know whether a next page exists, without a separate COUNT(*)
+#   - returns the (lazily iterated) sqlite cursor, so callers can stream the rows
+#   - served by a read replica when the request allows it [see `db.read_db`]
+def select_posts_page(columns, cursor=None, limit=None):
+    query = 'SELECT {0} FROM post p JOIN user u ON p.author_id = u.id'.format(', '.join(columns))
+    params = ()
+    if cursor is not None:
+        query += ' WHERE (p.created, p.id) < (?, ?)'
+        params = cursor
+    query += ' ORDER BY p.created DESC, p.id DESC LIMIT ?'
+    return read_db().execute(query, params + (limit + 1,))
+
+
+# select a single page of the index from the `post_listing` projection [the same page as `select_posts_page`]
+#   - a range seek on the projection's `(created, id)` primary key, which holds every listed column: so no JOIN and no table lookups
+#   - the first page seeks from `LISTING_START`, so every page is the same statement [and the same plan]
+def select_listing_page(cursor=None, limit=None):
+    return read_db().execute(
+        'SELECT {0} FROM post_listing WHERE (created, id) < (?, ?) ORDER BY created DESC, id DESC LIMIT ?'.format(', '.join(LISTING_COLUMNS)),
+        (cursor or LISTING_START) + (limit + 1,)
+    )
+
+
+# Repositories:
+#   - the posts and users storage used by `blog.py` and `auth.py`, so the views never write SQL themselves
+#   - every engine returns rows that can be read by column name e.g. `post['title']`, with `created`/`updated` as datetimes
+#   - `STORAGE_ENGINE` picks the engine: 'sqlite' (the app's own connection pool) or 'sqlalchemy' (any `DATABASE_URL`)
+#   - the 'sqlalchemy' engine lives in `sqlalchemy_repositories.py`, only imported when it is picked [SQLAlchemy is slow to import]
+#   - reads may be served by a replica [see `db.use_replica`], writes go to the primary and start the user's read-your-writes window
+#   - writes also maintain the `post_listing`/`author_listing` projection, within the same transaction
+#   - post writes record their `jobs` (side effects, see `jobs.py`) in the same transaction too, and notify the job queue once it commits
+#     [which claims them through `get_jobs()`, from that same database]
+#   - a post written with a `body_html` of None also gets a `render_post` job, which renders it [see `rendering.render_post`]
+#   - `generation()` reads the `post_generation` counter every change to the posts bumps [see `cache.current_generation`], and post
+#     writes drop the copy this process keeps of it, so the process sees its own writes at once
+#   - `search()` returns the posts matching every one of `terms`, their matches wrapped in `MATCH_START`/`MATCH_END`
+class SqlitePostRepository(object):
+    def page(self, cursor=None, limit=10):  # up to `limit + 1` posts past `cursor` [the extra one only signals a next page]
+        return select_listing_page(cursor, limit).fetchall()
+
+    def versions(self, cursor=None, limit=10):  # the `(id, updated)` of the posts `stream()` returns, without reading their bodies
+        return select_posts_page(('p.id', 'p.updated'), cursor, limit).fetchall()
+
+    def stream(self, fields, cursor=None, limit=10):  # like `page()` from the posts themselves, with `fields` [plus `_created` and `_id`], read lazily
+        columns = ['{0} AS {1}'.format(POST_FIELDS[field], field) for field in fields]
+        return select_posts_page(columns + ['p.created AS _created', 'p.id AS _id'], cursor, limit)
+
+    def search(self, terms, offset=0, limit=10):
+        return read_db().execute(SEARCH_QUERY, search_parameters(terms, offset, limit)).fetchall()
+
+    def get(self, id):
+        return read_db().execute(
+            'SELECT p.id, title, body, body_html, created, updated, author_id, username'
+            ' FROM post p JOIN user u ON p.author_id = u.id'
+            ' WHERE p.id = ?', (id,)
+        ).fetchone()
+
+    def generation(self):
+        return read_db().execute('SELECT generation FROM post_generation WHERE id = 1').fetchone()[0]
+
+    def create(self, title, body, body_html, author_id, jobs=()):
+        with write_transaction() as db:
+            id = db.execute(
+                'INSERT INTO post (title, body, body_html, author_id) VALUES (?, ?, ?, ?)',
+                (title, body, body_html, author_id)
+            ).lastrowid
+            listing.add_post(db, id)
+            jobs = list(jobs) + render_jobs(id, body_html)
+            enqueue(db, jobs)
+        stick_to_primary()
+        forget_generation()
+        if jobs:
+            notify()
+        return id
+
+    def update(self, id, title, body, body_html, jobs=()):
+        jobs = list(jobs) + render_jobs(id, body_html)
+        with write_transaction() as db:
+            db.execute(
+                "UPDATE post SET title=?, body=?, body_html=?, updated=strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = ?",
+                (title, body, body_html, id)
+            )
+            listing.update_post(db, id)
+            enqueue(db, jobs)
+        stick_to_primary()
+        forget_generation()
+        if jobs:
+            notify()
+
+    def set_body_html(self, id, body, body_html):  # stores a post's rendered `body`, unless the post was edited since [returns whether it was]
+        with write_transaction() as db:
+            stored = db.execute('UPDATE post SET body_html = ? WHERE id = ? AND body = ?', (body_html, id, body)).rowcount
+            if stored:
+                listing.update_post(db, id)
+        forget_generation()
+        return bool(stored)
+
+    def delete(self, id, jobs=()):
+        with write_transaction() as db:
+            listing.remove_post(db, id)
+            db.execute('DELETE FROM post WHERE id = ?', (id,))
+            enqueue(db, jobs)
+        stick_to_primary()
+        forget_generation()
+        if jobs:
+            notify()
+
+
+class SqliteUserRepository(object):
+    def get(self, id):
+        return read_db().execute('SELECT * FROM user WHERE id = ?', (id,)).fetchone()
+
+    def get_by_username(self, username):
+        return read_db().execute('SELECT * FROM user WHERE username = ?', (username,)).fetchone()
+
+    def create(self, username, password_hash):
+        with write_transaction() as db:
+            id = db.execute('INSERT INTO user (username, password) VALUES (?, ?)', (username, password_hash)).lastrowid
+            listing.add_author(db, id)
+        stick_to_primary()
+        return id
+
+    def set_password(self, id, password_hash):
+        with write_transaction() as db:
+            db.execute('UPDATE user SET password = ? WHERE id = ?', (password_hash, id))
+        stick_to_primary()
+
+
+# the job queue's outbox [see `jobs.py`], in the database the writes recording the jobs go to
+#   - always on the primary: jobs are claimed by writing, and a replica's copy of the outbox lags
+#   - `claim()` takes the next due job and pushes it back `timeout` seconds, burying the due jobs already claimed `max_attempts` times
+#   - `fail()` puts a failed job back for a retry at `run_after`, or buries it when there is none
+class SqliteJobRepository(object):
+    def claim(self, now, timeout, max_attempts):
+        if open_db().execute('SELECT 1 FROM job WHERE run_after <= ? LIMIT 1', (now,)).fetchone() is None:
+            return None  # checked first without the write lock, as idle workers poll
+        with write_transaction() as db:  # the write lock keeps each claim to one worker
+            while True:
+                job = db.execute('SELECT * FROM job WHERE run_after <= ? ORDER BY run_after, id LIMIT 1', (now,)).fetchone()
+                if job is None or job['attempts'] < max_attempts:
+                    break
+                _bury_job(db, job['id'], job['last_error'] or 'Timed out.')  # claimed `max_attempts` times, and never finished
+            if job is not None:
+                db.execute('UPDATE job SET attempts = attempts + 1, run_after = ? WHERE id = ?', (now + timeout, job['id']))
+        return job
+
+    def finish(self, id):
+        with write_transaction() as db:
+            db.execute('DELETE FROM job WHERE id = ?', (id,))
+
+    def fail(self, id, error, run_after=None):
+        with write_transaction() as db:
+            if run_after is None:
+                _bury_job(db, id, error)
+            else:
+                db.execute('UPDATE job SET run_after = ?, last_error = ? WHERE id = ?', (run_after, error, id))
+
+    def counts(self, now):  # the number of queued, due and dead jobs
+        db = open_db()
+        return (
+            db.execute('SELECT COUNT(*) FROM job').fetchone()[0],
+            db.execute('SELECT COUNT(*) FROM job WHERE run_after <= ?', (now,)).fetchone()[0],
+            db.execute('SELECT COUNT(*) FROM dead_job').fetchone()[0],
+        )
+
+    def list(self, dead=False, limit=20):  # the oldest queued [or dead] jobs
+        return open_db().execute('SELECT * FROM {0} ORDER BY id LIMIT ?'.format('dead_job' if dead else 'job'), (limit,)).fetchall()
+
+    def retry(self, ids=()):  # puts the dead jobs `ids` [or every dead job] back in the outbox, with their attempts reset
+        where, params = ('WHERE id IN ({0})'.format(', '.join('?' * len(ids))), tuple(ids)) if ids else ('', ())
+        with write_transaction() as db:
+            retried = db.execute(
+                'INSERT INTO job (id, kind, payload, last_error, created)'
+                ' SELECT id, kind, payload, last_error, created FROM dead_job ' + where, params
+            ).rowcount
+            db.execute('DELETE FROM dead_job ' + where, params)
+        return retried
+
+
+def _bury_job(db, id, error):  # moves a job to the dead letter table
+    db.execute(
+        'INSERT INTO dead_job (id, kind, payload, attempts, last_error, created)'
+        ' SELECT id, kind, payload, attempts, ?, created FROM job WHERE id = ?', (error, id)
+    )
+    db.execute('DELETE FROM job WHERE id = ?', (id,))
+
+
+def dispose_engines(app):  # closes and forgets the app's engines [and the repositories using them], e.g. before forking workers
+    with _engine_lock:
+        engines = [app.extensions.pop('db_engine', None)] + (app.extensions.pop('db_replica_engines', None) or [])
+        app.extensions.pop('repositories', None)
+    for engine in engines:
+        if engine is not None:
+            engine.dispose()
+
+
+def _repositories():
+    app = current_app._get_current_object()
+    repositories = app.extensions.get('repositories')
+    if repositories is None:
+        engine = app.config['STORAGE_ENGINE']
+        if engine == 'sqlite':
+            repositories = (SqlitePostRepository(), SqliteUserRepository(), SqliteJobRepository())
+        elif engine == 'sqlalchemy':
+            from awokogbon import sqlalchemy_repositories as engines
+            engine, replicas = engines.get_engine(app), engines.get_replica_engines(app)
+            repositories = (
+                engines.SqlAlchemyPostRepository(engine, replicas),
+                engines.SqlAlchemyUserRepository(engine, replicas),
+                engines.SqlAlchemyJobRepository(engine)
+            )
+        else:
+            raise ValueError('Unknown STORAGE_ENGINE: {0}'.format(engine))
+        app.extensions['repositories'] = repositories
+    return repositories
+
+
+def get_posts():  # the posts repository of the configured `STORAGE_ENGINE`
+    return _repositories()[0]
+
+
+def get_users():  # the users repository of the configured `STORAGE_ENGINE`
+    return _repositories()[1]
+
+
+def get_jobs():  # the job outbox of the configured `STORAGE_ENGINE`
+    return _repositories()[2]
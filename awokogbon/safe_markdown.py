@@ -0,0 +1,47 @@
+import html
+import urllib.parse
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+from markdown.util import AMP_SUBSTITUTE
+
+# the markdown renderer behind `rendering.render_markdown()`, only imported by the first render [markdown is slow to import]
+
+_SAFE_SCHEMES = ('', 'http', 'https', 'mailto')  # '' is a relative url
+_URL_ATTRIBUTES = (('a', 'href'), ('img', 'src'))
+
+
+# the url a browser would follow for an attribute value, as markdown left it in the tree
+#   - markdown keeps entities (e.g. `&#106;`) with `&` swapped for its `AMP_SUBSTITUTE` placeholder, which browsers decode
+#   - browsers also drop control characters and whitespace (e.g. a tab inside `jav&#x09;ascript:`)
+def _decoded_url(value):
+    url = html.unescape(value.replace(AMP_SUBSTITUTE, '&'))
+    return ''.join(c for c in url if c.isprintable() and not c.isspace())
+
+
+# SafeTreeprocessor:
+#   - drops link and image urls whose scheme is not in `_SAFE_SCHEMES` (e.g. `javascript:`), as decoded by a browser
+class SafeTreeprocessor(Treeprocessor):
+    def run(self, root):
+        for tag, attribute in _URL_ATTRIBUTES:
+            for element in root.iter(tag):
+                url = _decoded_url(element.get(attribute, ''))
+                try:
+                    scheme = urllib.parse.urlsplit(url).scheme.lower()
+                except ValueError:
+                    scheme = None
+                if scheme not in _SAFE_SCHEMES:
+                    element.set(attribute, '')
+
+
+# SafeExtension:
+#   - sanitises the rendered html: raw html in a post is escaped (instead of passed through), and unsafe urls are dropped
+class SafeExtension(Extension):
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister('html_block')
+        md.inlinePatterns.deregister('html')
+        md.treeprocessors.register(SafeTreeprocessor(md), 'safe', 0)
+
+
+def create_markdown():  # a new renderer [not thread safe, so `rendering.py` keeps one per thread]
+    return markdown.Markdown(extensions=[SafeExtension(), 'fenced_code'])
@@ -0,0 +1,132 @@
+DROP TABLE IF EXISTS user;
+DROP TABLE IF EXISTS post;
+
+CREATE TABLE user (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  username TEXT UNIQUE NOT NULL,
+  password TEXT NOT NULL
+);
+
+CREATE TABLE post (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  author_id INTEGER NOT NULL,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  updated TIMESTAMP NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),  -- set again by every edit, in milliseconds [used for ETags]
+  title TEXT NOT NULL,
+  body TEXT NOT NULL,
+  body_html TEXT,  -- `body` rendered from markdown at write time [NULL until rendered]
+  FOREIGN KEY (author_id) REFERENCES user (id)
+);
+
+-- supports the keyset (seek) pagination of the index page on `(created, id)`
+CREATE INDEX post_created_id ON post (created, id);
+
+-- a counter bumped by every change to the posts [by the triggers below], shared by every process on the database
+--   - each process's page and feed caches compare their entries against it, so a write invalidates them all [see `cache.py`]
+DROP TABLE IF EXISTS post_generation;
+
+CREATE TABLE post_generation (
+  id INTEGER PRIMARY KEY CHECK (id = 1),  -- a single row, read by its key [rather than scanned]
+  generation INTEGER NOT NULL
+);
+
+INSERT INTO post_generation (id, generation) VALUES (1, 0);
+
+CREATE TRIGGER post_generation_insert AFTER INSERT ON post BEGIN
+  UPDATE post_generation SET generation = generation + 1;
+END;
+
+CREATE TRIGGER post_generation_update AFTER UPDATE ON post BEGIN
+  UPDATE post_generation SET generation = generation + 1;
+END;
+
+CREATE TRIGGER post_generation_delete AFTER DELETE ON post BEGIN
+  UPDATE post_generation SET generation = generation + 1;
+END;
+
+-- the read projection of the index page [see `listing.py`]: every column it shows, clustered on its `(created, id)` order
+DROP TABLE IF EXISTS post_listing;
+DROP TABLE IF EXISTS author_listing;
+
+CREATE TABLE post_listing (
+  created TIMESTAMP NOT NULL,
+  id INTEGER NOT NULL,
+  updated TIMESTAMP NOT NULL,
+  author_id INTEGER NOT NULL,
+  author_name TEXT NOT NULL,
+  title TEXT NOT NULL,
+  excerpt TEXT NOT NULL,  -- the plain text start of the post, `EXCERPT_LENGTH` characters at most [the full body is only read by `blog.show`]
+  PRIMARY KEY (created, id)
+) WITHOUT ROWID;
+
+CREATE UNIQUE INDEX post_listing_id ON post_listing (id);
+
+CREATE TABLE author_listing (
+  id INTEGER PRIMARY KEY,  -- the author's `user.id`
+  username TEXT NOT NULL,
+  post_count INTEGER NOT NULL DEFAULT 0
+);
+
+-- server-side sessions, when `SESSION_TYPE` is 'sqlite'
+DROP TABLE IF EXISTS session;
+
+CREATE TABLE session (
+  id TEXT PRIMARY KEY,
+  data TEXT NOT NULL,
+  expires REAL NOT NULL
+);
+
+CREATE INDEX session_expires ON session (expires);
+
+-- token buckets of the rate limiter, when `RATELIMIT_STORAGE` is 'sqlite' [shared by every worker on the host]
+DROP TABLE IF EXISTS rate_limit;
+
+CREATE TABLE rate_limit (
+  key TEXT PRIMARY KEY,
+  tokens REAL NOT NULL,
+  updated REAL NOT NULL
+);
+
+-- the job queue's outbox [see `jobs.py`]: side effects recorded in the same transaction as the write causing them
+DROP TABLE IF EXISTS job;
+DROP TABLE IF EXISTS dead_job;
+
+CREATE TABLE job (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,  -- never reused, so a dead job keeps its id when it is retried
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,  -- the handler's keyword arguments, as json
+  attempts INTEGER NOT NULL DEFAULT 0,
+  run_after REAL NOT NULL DEFAULT 0,  -- unix time the job is next due [pushed back while it runs, and between retries]
+  last_error TEXT,
+  created TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX job_run_after ON job (run_after);
+
+-- jobs that failed `JOB_MAX_ATTEMPTS` times, kept for inspection [`flask jobs list --dead`] and retries [`flask jobs retry`]
+CREATE TABLE dead_job (
+  id INTEGER PRIMARY KEY,  -- the id it had in `job`
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  attempts INTEGER NOT NULL,
+  last_error TEXT,
+  created TIMESTAMP NOT NULL,
+  failed TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- full text index over the posts, kept in sync by the triggers below [the rowid of an indexed post is its `post.id`]
+DROP TABLE IF EXISTS post_search;
+
+CREATE VIRTUAL TABLE post_search USING fts5(title, body);
+
+CREATE TRIGGER post_search_insert AFTER INSERT ON post BEGIN
+  INSERT OR REPLACE INTO post_search (rowid, title, body) VALUES (new.id, new.title, new.body);
+END;
+
+CREATE TRIGGER post_search_update AFTER UPDATE OF title, body ON post BEGIN
+  UPDATE post_search SET title = new.title, body = new.body WHERE rowid = old.id;
+END;
+
+CREATE TRIGGER post_search_delete AFTER DELETE ON post BEGIN
+  DELETE FROM post_search WHERE rowid = old.id;
+END;
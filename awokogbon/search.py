@@ -0,0 +1,85 @@
+import click
+from markupsafe import escape, Markup
+from werkzeug.exceptions import abort
+from flask import (
+  Blueprint,
+  current_app,
+  render_template,
+  request
+)
+from flask.cli import with_appcontext
+from awokogbon.db import write_transaction
+from awokogbon.repositories import get_posts, MATCH_END, MATCH_START
+
+blueprint = Blueprint('search', __name__)  # initialize a Blueprint instance
+
+
+def init_blueprint(app):  # registers `blueprint_instance` and the search index cli command
+    app.register_blueprint(blueprint)  # tells flask to register `bp` after creating `app` instance
+    app.cli.add_command(rebuild_search_index_command)  # tells flask that `rebuild-search-index` can be run with flask command
+
+
+def _highlighted(text):  # escapes the (user written) post text, then marks the matched terms
+    return Markup(escape(text).replace(MATCH_START, Markup('<mark>')).replace(MATCH_END, Markup('</mark>')))
+
+
+# search the posts through the storage engine's `search()` [FTS5, best match first], one page at a time
+#   - every term is matched as a plain word, so user input is always a plain AND of words [and never query syntax]
+#   - returns the page of results, and whether there is a next page
+def search_posts(query, page=1, limit=None):
+    if limit is None:
+        limit = current_app.config['POSTS_PER_PAGE']
+    terms = query.split()
+    if not terms:
+        return [], False
+    rows = get_posts().search(terms, (page - 1) * limit, limit + 1)
+
+    results = [dict(row, title=_highlighted(row['title']), body=_highlighted(row['body'])) for row in rows[:limit]]
+    return results, len(rows) > limit
+
+
+# Search Page View:
+#   - `?q=` holds the search terms, `?page=` the (1-based) page of results
+#   - only the first `SEARCH_MAX_RESULTS` results are paged through, a later page is a 404
+@blueprint.route('/search')
+def search():
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    pages = -(-current_app.config['SEARCH_MAX_RESULTS'] // current_app.config['POSTS_PER_PAGE'])  # rounded up
+    if page > pages:
+        abort(404)
+    results, has_next = search_posts(query, page) if query else ([], False)
+    has_next = has_next and page < pages
+    return render_template('search/results.html', query=query, results=results, page=page, has_next=has_next)
+
+
+# rebuilds the `post_search` index from the `post` table
+#   - the index is emptied (by re-creating it) in one short transaction, then refilled `batch_size` posts per transaction
+#   - so the write lock is only ever held for one batch, and the views keep writing (and the triggers keep indexing) in between
+#   - until the rebuild finishes, searches only see the posts indexed so far
+def rebuild_search_index(batch_size=1000):
+    with write_transaction() as db:
+        db.execute('DROP TABLE IF EXISTS post_search')
+        db.execute('CREATE VIRTUAL TABLE post_search USING fts5(title, body)')
+
+    indexed = 0
+    last_id = 0
+    while True:
+        with write_transaction() as db:
+            rows = db.execute('SELECT id FROM post WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)).fetchall()
+            if not rows:
+                return indexed
+            db.execute(
+                'INSERT OR REPLACE INTO post_search (rowid, title, body)'
+                ' SELECT id, title, body FROM post WHERE id > ? AND id <= ?', (last_id, rows[-1]['id'])
+            )
+        indexed += len(rows)
+        last_id = rows[-1]['id']
+
+
+@click.command('rebuild-search-index')  # a decorator to turn `rebuild_search_index()` into a command line tool
+@click.option('--batch-size', default=1000, show_default=True, help='Posts indexed per transaction.')
+@with_appcontext  # this ensures application context is set when `rebuild_search_index_command` is called
+def rebuild_search_index_command(batch_size):
+    indexed = rebuild_search_index(batch_size)
+    click.echo('Rebuilt the search index ({0} posts).'.format(indexed))
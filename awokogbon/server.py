@@ -0,0 +1,196 @@
+import gc
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+import click
+from werkzeug.serving import BaseWSGIServer, select_address_family
+from awokogbon import create_app
+from awokogbon.db import close_pools, open_db
+from awokogbon.rendering import render_markdown
+from awokogbon.repositories import dispose_engines
+
+
+def rss_bytes(pid='self'):  # the resident set size of a process, read from `/proc` [None where there is no `/proc`]
+    try:
+        with open('/proc/{0}/statm'.format(pid)) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _format_rss(size):
+    return 'unknown' if size is None else '{0:.1f}MiB'.format(size / 1048576.0)
+
+
+# _WorkerServer:
+#   - werkzeug's single threaded server, accepting from the listening socket the prefork parent opened
+#   - that socket is non-blocking, so a worker losing the race for a connection gets a `BlockingIOError` [ignored by
+#     `handle_request()`] instead of blocking in `accept()`, and `timeout` bounds how long a stop signal goes unnoticed
+class _WorkerServer(BaseWSGIServer):
+    timeout = 1
+
+    def get_request(self):
+        connection, address = self.socket.accept()
+        connection.setblocking(True)  # some platforms hand out accepted sockets non-blocking, like the listening one
+        return connection, address
+
+
+# PreforkServer:
+#   - builds nothing itself: `app` is created (and its templates precompiled, and markdown imported) once in the parent, then shared copy-on-write
+#   - the parent closes its db pools and engines before forking, so each worker opens its own on first use [no shared handles]
+#   - a worker handles one request at a time and is replaced after `max_requests` [plus up to `max_requests_jitter`]
+#   - SIGTERM/SIGINT stop the server: workers finish their current request, and are killed after `graceful_timeout` seconds
+class PreforkServer(object):
+    def __init__(self, app, host='127.0.0.1', port=5000, workers=4, max_requests=0, max_requests_jitter=0, graceful_timeout=30):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.socket = None
+        self._children = {}  # worker pid -> worker number
+        self._stopping = False
+        self._served = 0
+
+    def log(self, message):
+        click.echo('[{0}] {1}'.format(os.getpid(), message), err=True)
+
+    def run(self, started=None):  # serves until stopped; `started` is the `time.perf_counter()` to report the startup time from
+        started = time.perf_counter() if started is None else started
+        self.socket = self._listen()
+        self._warm()
+        signal.signal(signal.SIGTERM, self._stop)  # inherited by the workers
+        signal.signal(signal.SIGINT, self._stop)  # ctrl-c reaches the workers too, as they share the terminal's process group
+        try:
+            for number in range(self.workers):
+                self._spawn(number)
+            self.log('Serving on http://{0}:{1} with {2} workers, started in {3:.0f}ms (rss {4}).'.format(
+                self.host, self.port, self.workers, (time.perf_counter() - started) * 1000, _format_rss(rss_bytes())
+            ))
+            while not self._stopping:
+                self._reap()
+                time.sleep(0.1)
+        finally:
+            self._shutdown()
+            self.socket.close()
+        self.log('Stopped.')
+
+    def _listen(self):
+        family = select_address_family(self.host, self.port)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(128)
+        sock.setblocking(False)  # see `_WorkerServer`
+        self.port = sock.getsockname()[1]  # the port picked by the os, when `port` is 0
+        return sock
+
+    def _warm(self):
+        with self.app.app_context():
+            open_db().execute('SELECT 1')  # fails fast (in the parent) on a missing or unreadable database
+        render_markdown('')  # imports markdown in the parent [`create_app()` does not], so the workers share it
+        close_pools(self.app)
+        dispose_engines(self.app)
+        gc.collect()
+        if hasattr(gc, 'freeze'):  # python 3.7+: the warm objects are left out of the workers' collections, so their pages stay shared
+            gc.freeze()
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def _spawn(self, number):
+        pid = os.fork()
+        if pid:
+            self._children[pid] = number
+            return
+        status = 0
+        try:
+            self._work(number)
+        except BaseException:
+            traceback.print_exc()
+            status = 1
+        finally:
+            os._exit(status)  # never return into the parent's code [or run its exit handlers]
+
+    def _work(self, number):
+        forked = time.perf_counter()
+        limit = self.max_requests + random.randint(0, self.max_requests_jitter) if self.max_requests else None
+
+        def counting_app(environ, start_response):
+            self._served += 1
+            return self.app(environ, start_response)
+
+        server = _WorkerServer(self.host, self.port, counting_app, fd=self.socket.fileno())
+        self.log('Worker {0} ready in {1:.0f}ms (rss {2}).'.format(number, (time.perf_counter() - forked) * 1000, _format_rss(rss_bytes())))
+        try:
+            while not self._stopping and (limit is None or self._served < limit):
+                server.handle_request()
+        finally:
+            server.server_close()
+            self.app.extensions['job_queue'].stop(self.graceful_timeout)  # its unfinished jobs stay in the outbox, for the other workers
+            close_pools(self.app)
+            dispose_engines(self.app)
+        self.log('Worker {0} exiting after {1} requests (rss {2}).'.format(number, self._served, _format_rss(rss_bytes())))
+
+    def _reap(self):  # collects exited workers, replacing them unless the server is stopping
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            number = self._children.pop(pid, None)
+            if number is None:
+                continue
+            if status:
+                self.log('Worker {0} (pid {1}) exited with status {2}.'.format(number, pid, status))
+            if not self._stopping:
+                self._spawn(number)
+
+    def _shutdown(self):
+        for pid in list(self._children):
+            _kill(pid, signal.SIGTERM)
+        deadline = time.time() + self.graceful_timeout
+        while self._children and time.time() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._children):
+            self.log('Killing worker {0} (pid {1}).'.format(self._children.pop(pid), pid))
+            _kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+
+
+def _kill(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+@click.group()
+def cli():  # the `awokogbon` command [installed by setup.py]
+    pass
+
+
+@cli.command('serve')
+@click.option('--host', default='127.0.0.1', show_default=True, help='Interface to listen on.')
+@click.option('--port', default=5000, show_default=True, help='Port to listen on.')
+@click.option('--workers', type=int, help='Worker processes [defaults to SERVER_WORKERS].')
+@click.option('--max-requests', type=int, help='Requests a worker handles before it is replaced [defaults to SERVER_MAX_REQUESTS].')
+def serve_command(host, port, workers, max_requests):
+    started = time.perf_counter()
+    app = create_app()
+    click.echo('Built the app in {0:.0f}ms.'.format((time.perf_counter() - started) * 1000), err=True)
+    PreforkServer(
+        app, host, port,
+        workers=app.config['SERVER_WORKERS'] if workers is None else workers,
+        max_requests=app.config['SERVER_MAX_REQUESTS'] if max_requests is None else max_requests,
+        max_requests_jitter=app.config['SERVER_MAX_REQUESTS_JITTER'],
+        graceful_timeout=app.config['SERVER_GRACEFUL_TIMEOUT']
+    ).run(started)
@@ -0,0 +1,261 @@
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from flask import session as current_session
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SecureCookieSessionInterface, SessionInterface
+from awokogbon.db import open_db, write_transaction
+
+logger = logging.getLogger(__name__)
+
+SID_PATTERN = re.compile(r'[A-Za-z0-9_-]{43}\Z')  # the ids `new_sid()` makes: any other cookie value is never looked up [e.g. `../../`]
+
+
+def new_sid():  # an unguessable id, so it needs no signature
+    return secrets.token_urlsafe(32)
+
+
+# ServerSideSession:
+#   - a session whose data lives in a server-side store, and whose cookie only carries the random session id
+#   - tracks `modified`/`accessed` like flask's cookie session, so unmodified sessions are never written back
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None, expires=None):
+        super(ServerSideSession, self).__init__(initial)
+        self.sid = sid
+        self.expires = expires  # when the stored copy expires [`None` for a session that has not been stored yet]
+        self.previous_sid = None  # the id replaced by `regenerate_session()`, whose stored copy is deleted on save
+
+
+# regenerate_session(): gives the current session a new id, e.g. at login
+#   - so an id planted in the browser before the login [session fixation] never becomes a logged in session
+#   - a no-op for the 'cookie' backend, whose whole cookie is re-signed with every change
+def regenerate_session():
+    session = current_session._get_current_object()
+    if isinstance(session, ServerSideSession):
+        session.previous_sid = session.previous_sid or session.sid
+        session.sid = new_sid()
+        session.modified = True
+
+
+# FileSystemStore:
+#   - one file per session, spread over 256 sub-directories (by session id prefix) so no directory grows too large
+#   - each file holds the expiry timestamp on its first line, followed by the serialized session
+class FileSystemStore(object):
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid[:2], sid)
+
+    def get(self, sid):
+        try:
+            with open(self._path(sid), 'r', encoding='utf8') as f:
+                expires = float(f.readline())
+                if expires < time.time():
+                    return None, None
+                return f.read(), expires
+        except (OSError, ValueError):  # missing or half-written files are treated as no session
+            return None, None
+
+    def set(self, sid, data, expires):
+        path = self._path(sid)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass
+        tmp_path = '{0}.{1}.tmp'.format(path, threading.get_ident())
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            f.write('{0}\n{1}'.format(expires, data))
+        os.replace(tmp_path, path)  # atomic, so concurrent readers never see a partial session
+
+    def delete(self, sid):
+        try:
+            os.remove(self._path(sid))
+        except OSError:
+            pass
+
+    def sweep(self, now, max_entries):  # removes expired sessions, then the oldest ones beyond `max_entries`
+        live = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    with open(path, 'r', encoding='utf8') as f:
+                        expires = float(f.readline())
+                except (OSError, ValueError):
+                    expires = 0
+                if expires < now:
+                    _remove(path)
+                else:
+                    live.append((expires, path))
+        if len(live) > max_entries:
+            live.sort()
+            for expires, path in live[:len(live) - max_entries]:
+                _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# SqliteStore:
+#   - keeps the sessions in the `session` table of the app database, through the same pooled connections as the views
+#   - the `session_expires` index keeps sweeping cheap
+class SqliteStore(object):
+    def get(self, sid):
+        row = open_db().execute(
+            'SELECT data, expires FROM session WHERE id = ? AND expires >= ?', (sid, time.time())
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row['data'], row['expires']
+
+    def set(self, sid, data, expires):
+        with write_transaction() as db:
+            db.execute('INSERT OR REPLACE INTO session (id, data, expires) VALUES (?, ?, ?)', (sid, data, expires))
+
+    def delete(self, sid):
+        with write_transaction() as db:
+            db.execute('DELETE FROM session WHERE id = ?', (sid,))
+
+    def sweep(self, now, max_entries):
+        with write_transaction() as db:
+            db.execute('DELETE FROM session WHERE expires < ?', (now,))
+            db.execute(
+                'DELETE FROM session WHERE id IN ('
+                ' SELECT id FROM session ORDER BY expires'
+                ' LIMIT max(0, (SELECT COUNT(*) FROM session) - ?))', (max_entries,)
+            )
+
+
+# ServerSideSessionInterface:
+#   - loads and saves `ServerSideSession`s through a store [`FileSystemStore` or `SqliteStore`]
+#   - a session is only written back when it was modified, or when its stored copy is past half its lifetime [so active sessions do not expire]
+#   - only cookies holding an id shaped like `new_sid()`'s are looked up in the store, others get a new session
+#   - every `SESSION_SWEEP_INTERVAL` seconds, a background thread sweeps expired sessions and caps the store at `SESSION_MAX_ENTRIES`
+#     [started by the first request to save a session, so it is never forked, see `server.py`, and never slows a request down]
+class ServerSideSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+    session_class = ServerSideSession
+
+    def __init__(self, store, sweep_interval=300, max_entries=100000):
+        self.store = store
+        self.sweep_interval = sweep_interval
+        self.max_entries = max_entries
+        self._sweeper = None
+        self._sweep_lock = threading.Lock()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.config['SESSION_COOKIE_NAME'])
+        if sid and SID_PATTERN.match(sid):
+            data, expires = self.store.get(sid)
+            if data is not None:
+                try:
+                    return self.session_class(self.serializer.loads(data), sid=sid, expires=expires)
+                except ValueError:
+                    pass
+        return self.session_class(sid=new_sid())
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        cookie_name = app.config['SESSION_COOKIE_NAME']
+        now = time.time()
+        self._start_sweeper(app)
+        if session.previous_sid is not None:  # regenerated, so the copy stored under the old id is dropped
+            self.store.delete(session.previous_sid)
+
+        # If the session is modified to be empty, remove it from the store and remove the cookie.
+        if not session:
+            if session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(cookie_name, domain=domain, path=path)
+            return
+
+        if session.accessed:
+            response.vary.add('Cookie')
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        stale = session.expires is not None and session.expires - now < lifetime / 2
+        if not session.modified and not stale:  # nothing changed, so there is nothing to write
+            return
+
+        expires = now + lifetime
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), expires)
+        response.set_cookie(
+            cookie_name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),  # `None` keeps non-permanent sessions as browser-session cookies
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=app.config['SESSION_COOKIE_SAMESITE']
+        )
+
+    def _start_sweeper(self, app):
+        if self._sweeper is None:
+            with self._sweep_lock:
+                if self._sweeper is None:
+                    self._sweeper = threading.Thread(target=self._sweep, args=(app,), name='session-sweeper', daemon=True)
+                    self._sweeper.start()
+
+    def _sweep(self, app):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                with app.app_context():  # the sqlite store checks its connection out of the app's pool
+                    self.store.sweep(time.time(), self.max_entries)
+            except Exception:  # e.g. a locked database: the expired sessions are swept next time
+                logger.exception('Sweeping the sessions failed.')
+
+
+SESSION_TYPES = ('cookie', 'filesystem', 'sqlite')
+
+
+def create_session_interface(app):  # builds the session backend selected by `SESSION_TYPE`
+    session_type = app.config['SESSION_TYPE']
+    if session_type == 'cookie':  # flask's own signed cookie session: no server-side storage at all [requires `SECRET_KEY`]
+        return SecureCookieSessionInterface()
+    if session_type == 'filesystem':
+        store = FileSystemStore(app.config['SESSION_FILE_DIR'] or os.path.join(app.instance_path, 'flask_session'))
+    elif session_type == 'sqlite':
+        store = SqliteStore()
+    else:
+        raise ValueError('Unknown SESSION_TYPE {0!r}.'.format(session_type))
+    return ServerSideSessionInterface(
+        store,
+        sweep_interval=app.config['SESSION_SWEEP_INTERVAL'],
+        max_entries=app.config['SESSION_MAX_ENTRIES']
+    )
+
+
+# LazySessionInterface:
+#   - stands in for the app's session backend, building it on first use [so creating the app, or running a command, never does]
+#   - every attribute is read from the backend it builds, like `profiling.TimedSessionInterface`
+class LazySessionInterface(object):
+    def __init__(self, app):
+        self._app = app
+        self._session_interface = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        session_interface = self._session_interface
+        if session_interface is None:
+            with self._lock:
+                if self._session_interface is None:
+                    self._session_interface = create_session_interface(self._app)
+                session_interface = self._session_interface
+        return getattr(session_interface, name)
+
+
+def init_app(app):  # sets the app's session backend from the (already loaded) app config, building it on the first request
+    if app.config['SESSION_TYPE'] not in SESSION_TYPES:  # still fails when the app is created, rather than on its first request
+        raise ValueError('Unknown SESSION_TYPE {0!r}.'.format(app.config['SESSION_TYPE']))
+    app.session_interface = LazySessionInterface(app)
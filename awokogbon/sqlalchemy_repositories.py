@@ -0,0 +1,414 @@
+import contextlib
+import json
+import random
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import (
+    bindparam,
+    Column,
+    create_engine,
+    DateTime,
+    event,
+    Float,
+    ForeignKey,
+    func,
+    Index,
+    inspect,
+    Integer,
+    literal,
+    MetaData,
+    select,
+    Table,
+    Text,
+    text,
+    tuple_
+)
+from sqlalchemy.dialects import sqlite
+from awokogbon.cache import forget_generation
+from awokogbon.db import _pragmas, stick_to_primary, use_replica
+from awokogbon.jobs import notify
+from awokogbon.listing import _excerpt
+from awokogbon.rendering import render_jobs
+from awokogbon.repositories import _engine_lock, SEARCH_QUERY, search_parameters
+
+
+# the tables `schema.sql` creates, described for SQLAlchemy [so the queries are compiled for whichever database `DATABASE_URL` is]
+metadata = MetaData()
+
+user_table = Table(
+    'user', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', Text, unique=True, nullable=False),
+    Column('password', Text, nullable=False),
+)
+
+# sqlite's `CURRENT_TIMESTAMP` has no fraction, so page cursors are bound in the same format [or `(created, id)` would not seek]
+_created = DateTime().with_variant(
+    sqlite.DATETIME(storage_format='%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d'), 'sqlite'
+)
+
+post_table = Table(
+    'post', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('author_id', Integer, ForeignKey('user.id'), nullable=False),
+    Column('created', _created, nullable=False),
+    Column('updated', DateTime, nullable=False),
+    Column('title', Text, nullable=False),
+    Column('body', Text, nullable=False),
+    Column('body_html', Text),
+    Index('post_created_id', 'created', 'id'),
+)
+
+post_listing_table = Table(
+    'post_listing', metadata,
+    Column('created', _created, primary_key=True),
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('updated', DateTime, nullable=False),
+    Column('author_id', Integer, nullable=False),
+    Column('author_name', Text, nullable=False),
+    Column('title', Text, nullable=False),
+    Column('excerpt', Text, nullable=False),
+    Index('post_listing_id', 'id', unique=True),
+)
+
+post_generation_table = Table(
+    'post_generation', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('generation', Integer, nullable=False),
+)
+
+# the job queue's outbox [see `SqlAlchemyJobRepository`]
+job_table = Table(
+    'job', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('kind', Text, nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('attempts', Integer, nullable=False, server_default='0'),
+    Column('run_after', Float, nullable=False, server_default='0'),
+    Column('last_error', Text),
+    Column('created', DateTime, nullable=False, server_default=func.current_timestamp()),
+    Index('job_run_after', 'run_after'),
+)
+
+dead_job_table = Table(
+    'dead_job', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('kind', Text, nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('attempts', Integer, nullable=False),
+    Column('last_error', Text),
+    Column('created', DateTime, nullable=False),
+    Column('failed', DateTime, nullable=False, server_default=func.current_timestamp()),
+)
+
+author_listing_table = Table(
+    'author_listing', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('username', Text, nullable=False),
+    Column('post_count', Integer, nullable=False),
+)
+
+
+class SqlAlchemyRepository(object):
+    def __init__(self, engine, replicas=()):
+        self.engine = engine
+        self.replicas = replicas
+
+    def _read_engine(self):  # a replica when the request allows it [see `db.use_replica`], else the primary
+        return random.choice(self.replicas) if self.replicas and use_replica() else self.engine
+
+    def _all(self, query):
+        with self._read_engine().connect() as connection:
+            return [row._mapping for row in connection.execute(query)]
+
+    def _first(self, query):
+        with self._read_engine().connect() as connection:
+            row = connection.execute(query).first()
+        return row._mapping if row is not None else None
+
+    def _iterate(self, query):  # yields the rows one at a time, holding a connection until they are read [or the generator is closed]
+        with self._read_engine().connect() as connection:
+            for row in connection.execution_options(yield_per=100).execute(query):
+                yield row._mapping
+
+    @contextlib.contextmanager
+    def _transaction(self, jobs=()):  # one transaction on the primary, also recording `jobs`, which then starts the user's read-your-writes window
+        with self.engine.begin() as connection:
+            yield connection
+            if jobs:
+                connection.execute(job_table.insert(), [{'kind': kind, 'payload': json.dumps(payload)} for kind, payload in jobs])
+        stick_to_primary()
+        if jobs:
+            notify()
+
+
+def _before(created, id, cursor):  # the `(created, id) < cursor` seek of a page, with `created` bound like the column it is compared with
+    return tuple_(created, id) < tuple_(
+        bindparam('cursor_created', datetime.fromisoformat(cursor[0]), type_=created.type),
+        bindparam('cursor_id', cursor[1], type_=Integer)
+    )
+
+
+def _like(term):  # a LIKE pattern matching `term` anywhere [its own wildcards escaped with `\`]
+    return '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+# the posts repository of the 'sqlalchemy' engine [see `repositories.SqlitePostRepository`]
+#   - `search()` uses the FTS5 index of `schema.sql` where the database has it, else a LIKE match of every term, newest first
+#     [a portable fallback, without ranking or highlighting]
+class SqlAlchemyPostRepository(SqlAlchemyRepository):
+    _posts = post_table.join(user_table, post_table.c.author_id == user_table.c.id)
+    _fields = dict(post_table.c.items(), username=user_table.c.username)  # the columns of `repositories.POST_FIELDS`
+    _full_text = None  # whether the database has the `post_search` index, checked on the first search
+
+    @contextlib.contextmanager
+    def _transaction(self, jobs=()):  # also bumps the posts' generation [which sqlite's triggers do too, other databases may lack them]
+        with super(SqlAlchemyPostRepository, self)._transaction(jobs) as connection:
+            yield connection
+            g = post_generation_table.c
+            connection.execute(post_generation_table.update().where(g.id == 1).values(generation=g.generation + 1))
+        forget_generation()
+
+    def page(self, cursor=None, limit=10):
+        l = post_listing_table.c
+        query = select(l.id, l.title, l.excerpt, l.created, l.updated, l.author_id, l.author_name.label('username'))
+        if cursor is not None:
+            query = query.where(_before(l.created, l.id, cursor))
+        return self._all(query.order_by(l.created.desc(), l.id.desc()).limit(limit + 1))
+
+    def _posts_page(self, columns, cursor, limit):
+        p = post_table.c
+        query = select(*columns).select_from(self._posts)
+        if cursor is not None:
+            query = query.where(_before(p.created, p.id, cursor))
+        return query.order_by(p.created.desc(), p.id.desc()).limit(limit + 1)
+
+    def versions(self, cursor=None, limit=10):
+        return self._all(self._posts_page((post_table.c.id, post_table.c.updated), cursor, limit))
+
+    def stream(self, fields, cursor=None, limit=10):
+        columns = [self._fields[field].label(field) for field in fields]
+        return self._iterate(self._posts_page(columns + [post_table.c.created.label('_created'), post_table.c.id.label('_id')], cursor, limit))
+
+    def search(self, terms, offset=0, limit=10):
+        p, u = post_table.c, user_table.c
+        if self._full_text is None:
+            self._full_text = inspect(self.engine).has_table('post_search')
+        if self._full_text:
+            return self._all(text(SEARCH_QUERY).columns(created=p.created.type).bindparams(**search_parameters(terms, offset, limit)))
+        query = select(p.id, p.created, p.author_id, u.username, p.title, func.substr(p.body, 1, 200).label('body')).select_from(self._posts)
+        for term in terms:
+            query = query.where(p.title.ilike(_like(term), escape='\\') | p.body.ilike(_like(term), escape='\\'))
+        return self._all(query.order_by(p.created.desc(), p.id.desc()).limit(limit).offset(offset))
+
+    def get(self, id):
+        p, u = post_table.c, user_table.c
+        return self._first(select(
+            p.id, p.title, p.body, p.body_html, p.created, p.updated, p.author_id, u.username
+        ).select_from(self._posts).where(p.id == id))
+
+    def generation(self):
+        return self._first(select(post_generation_table.c.generation).where(post_generation_table.c.id == 1))['generation']
+
+    def create(self, title, body, body_html, author_id, jobs=()):
+        now = datetime.utcnow()
+        authors = author_listing_table
+        jobs = list(jobs)  # recorded by `_transaction()` once the block is done, so the post's own `render_jobs` can still be added
+        with self._transaction(jobs) as connection:
+            id = connection.execute(post_table.insert().values(
+                title=title, body=body, body_html=body_html, author_id=author_id, created=now, updated=now
+            )).inserted_primary_key[0]
+            connection.execute(post_listing_table.insert().values(
+                created=now, id=id, updated=now, author_id=author_id, title=title,
+                author_name=select(user_table.c.username).where(user_table.c.id == author_id).scalar_subquery(),
+                excerpt=_excerpt(body, body_html, render=False)
+            ))
+            connection.execute(authors.update().where(authors.c.id == author_id).values(post_count=authors.c.post_count + 1))
+            jobs.extend(render_jobs(id, body_html))
+        return id
+
+    def update(self, id, title, body, body_html, jobs=()):
+        now = datetime.utcnow()
+        with self._transaction(list(jobs) + render_jobs(id, body_html)) as connection:
+            connection.execute(post_table.update().where(post_table.c.id == id).values(
+                title=title, body=body, body_html=body_html, updated=now
+            ))
+            connection.execute(post_listing_table.update().where(post_listing_table.c.id == id).values(
+                title=title, updated=now, excerpt=_excerpt(body, body_html, render=False)
+            ))
+
+    def set_body_html(self, id, body, body_html):
+        p = post_table.c
+        with self._transaction() as connection:
+            stored = connection.execute(post_table.update().where((p.id == id) & (p.body == body)).values(body_html=body_html)).rowcount
+            if stored:
+                connection.execute(post_listing_table.update().where(post_listing_table.c.id == id).values(excerpt=_excerpt(body, body_html)))
+        return bool(stored)
+
+    def delete(self, id, jobs=()):
+        authors = author_listing_table
+        with self._transaction(jobs) as connection:
+            connection.execute(authors.update().where(
+                authors.c.id == select(post_table.c.author_id).where(post_table.c.id == id).scalar_subquery()
+            ).values(post_count=authors.c.post_count - 1))
+            connection.execute(post_listing_table.delete().where(post_listing_table.c.id == id))
+            connection.execute(post_table.delete().where(post_table.c.id == id))
+
+
+class SqlAlchemyUserRepository(SqlAlchemyRepository):
+    def get(self, id):
+        return self._first(select(user_table).where(user_table.c.id == id))
+
+    def get_by_username(self, username):
+        return self._first(select(user_table).where(user_table.c.username == username))
+
+    def create(self, username, password_hash):
+        with self._transaction() as connection:
+            id = connection.execute(user_table.insert().values(username=username, password=password_hash)).inserted_primary_key[0]
+            connection.execute(author_listing_table.insert().values(id=id, username=username, post_count=0))
+        return id
+
+    def set_password(self, id, password_hash):
+        with self._transaction() as connection:
+            connection.execute(user_table.update().where(user_table.c.id == id).values(password=password_hash))
+
+
+# the job queue's outbox in the engine's database, so the jobs of a write are claimed where the write recorded them
+#   - each claim is guarded by the job's `attempts`, which every claim bumps, so two workers never both claim a job
+#   - on databases supporting it, the due job is also selected `FOR UPDATE SKIP LOCKED`, so concurrent workers pass each other by
+class SqlAlchemyJobRepository(object):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def claim(self, now, timeout, max_attempts):
+        j = job_table.c
+        due = select(job_table).where(j.run_after <= now).order_by(j.run_after, j.id).limit(1).with_for_update(skip_locked=True)
+        with self.engine.begin() as connection:
+            while True:
+                job = connection.execute(due).first()
+                if job is None:
+                    return None
+                job = job._mapping
+                if job['attempts'] >= max_attempts:  # claimed `max_attempts` times, and never finished
+                    _bury_job(connection, job['id'], job['last_error'] or 'Timed out.')
+                    continue
+                claimed = connection.execute(job_table.update().where((j.id == job['id']) & (j.attempts == job['attempts'])).values(
+                    attempts=j.attempts + 1, run_after=now + timeout
+                )).rowcount
+                if claimed:
+                    return job
+
+    def finish(self, id):
+        with self.engine.begin() as connection:
+            connection.execute(job_table.delete().where(job_table.c.id == id))
+
+    def fail(self, id, error, run_after=None):
+        with self.engine.begin() as connection:
+            if run_after is None:
+                _bury_job(connection, id, error)
+            else:
+                connection.execute(job_table.update().where(job_table.c.id == id).values(run_after=run_after, last_error=error))
+
+    def counts(self, now):
+        count = select(func.count())
+        with self.engine.connect() as connection:
+            return (
+                connection.execute(count.select_from(job_table)).scalar(),
+                connection.execute(count.select_from(job_table).where(job_table.c.run_after <= now)).scalar(),
+                connection.execute(count.select_from(dead_job_table)).scalar(),
+            )
+
+    def list(self, dead=False, limit=20):
+        table = dead_job_table if dead else job_table
+        with self.engine.connect() as connection:
+            return [row._mapping for row in connection.execute(select(table).order_by(table.c.id).limit(limit))]
+
+    def retry(self, ids=()):
+        d = dead_job_table.c
+        dead = select(d.id, d.kind, d.payload, d.last_error, d.created)
+        delete = dead_job_table.delete()
+        if ids:
+            dead, delete = dead.where(d.id.in_(ids)), delete.where(d.id.in_(ids))
+        with self.engine.begin() as connection:
+            retried = connection.execute(job_table.insert().from_select(['id', 'kind', 'payload', 'last_error', 'created'], dead)).rowcount
+            connection.execute(delete)
+        return retried
+
+
+def _bury_job(connection, id, error):  # moves a job to the dead letter table
+    j = job_table.c
+    connection.execute(dead_job_table.insert().from_select(
+        ['id', 'kind', 'payload', 'attempts', 'last_error', 'created'],
+        select(j.id, j.kind, j.payload, j.attempts, literal(error, Text), j.created).where(j.id == id)
+    ))
+    connection.execute(job_table.delete().where(j.id == id))
+
+
+# create_engine_from_config():
+#   - a pooled engine for `DATABASE_URL` [defaults to the app's sqlite `DATABASE`], sized like the sqlite pool
+#   - statements are built once and compiled through SQLAlchemy's statement cache, so each query shape is only compiled once
+#   - sqlite connections get the same pragmas as the app's own pool
+def create_engine_from_config(config, url=None):
+    url = url or config['DATABASE_URL'] or 'sqlite:///{0}'.format(config['DATABASE'])
+    engine = create_engine(url, pool_size=config['DB_POOL_SIZE'], pool_timeout=config['DB_POOL_TIMEOUT'], pool_pre_ping=True)
+    if engine.dialect.name == 'sqlite':
+        pragmas = _pragmas(config)
+
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(connection, record):
+            for name, value in pragmas.items():
+                if value is not None:  # `None` leaves the SQLite default in place [as in `db.ConnectionPool`]
+                    connection.execute('PRAGMA {0} = {1}'.format(name, value))
+    return engine
+
+
+# creates the tables of `metadata` missing from the engine's database, and the `post_generation` row
+#   - the portable schema, for databases other than sqlite: without `schema.sql`'s triggers (the repositories maintain the
+#     projection and the generation themselves) and without its FTS5 search index [see `SqlAlchemyPostRepository.search`]
+def create_schema(engine):
+    metadata.create_all(engine)
+    g = post_generation_table.c
+    with engine.begin() as connection:
+        if connection.execute(select(g.id).where(g.id == 1)).first() is None:
+            connection.execute(post_generation_table.insert().values(id=1, generation=0))
+
+
+# initializes the 'sqlalchemy' engine's database [`flask init-db`]: sqlite gets `schema.sql` itself, other databases `create_schema()`
+def init_storage(app=None):
+    app = app or current_app._get_current_object()
+    engine = get_engine(app)
+    if engine.dialect.name != 'sqlite':
+        create_schema(engine)
+        return
+    connection = engine.raw_connection()
+    try:
+        with app.open_resource('schema.sql') as f:
+            connection.executescript(f.read().decode('utf8'))
+    finally:
+        connection.close()
+
+
+def get_engine(app=None):  # returns the app's SQLAlchemy engine, creating it on first use
+    app = app or current_app._get_current_object()
+    engine = app.extensions.get('db_engine')
+    if engine is None:
+        with _engine_lock:
+            engine = app.extensions.get('db_engine')
+            if engine is None:
+                engine = app.extensions['db_engine'] = create_engine_from_config(app.config)
+    return engine
+
+
+def get_replica_engines(app=None):  # returns the app's engines for `DATABASE_REPLICA_URLS`, creating them on first use
+    app = app or current_app._get_current_object()
+    engines = app.extensions.get('db_replica_engines')
+    if engines is None:
+        with _engine_lock:
+            engines = app.extensions.get('db_replica_engines')
+            if engines is None:
+                engines = app.extensions['db_replica_engines'] = [
+                    create_engine_from_config(app.config, url) for url in app.config['DATABASE_REPLICA_URLS']
+                ]
+    return engines
+
+
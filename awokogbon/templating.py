@@ -0,0 +1,64 @@
+import os
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from awokogbon.cache import MemoryCache
+
+
+# FragmentCacheExtension:
+#   - adds a `{% cache key, ... %}...{% endcache %}` tag, which renders its body once per distinct key and then reuses the html
+#   - the key must include everything the fragment depends on, as nothing else invalidates it: e.g. a post's id and update time, and
+#     what changes without an update (its author's name, and its excerpt when `flask render-posts --all` re-renders it)
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super(FragmentCacheExtension, self).__init__(environment)
+        environment.extend(fragment_cache=None)  # set by `init_app()`; while None, fragments are always rendered
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = repr(tuple(key))
+        html = cache.get(key)
+        if html is None:
+            html = caller()  # already escaped `Markup`, so it is cached (and reused) as is
+            cache.set(key, html)
+        return html
+
+
+# precompile():
+#   - compiles every template up front, so the first requests of a cold worker do not pay for it
+#   - filters are resolved while compiling, so it must run after every `add_template_filter()` i.e. at the end of `create_app()`
+def precompile(app):
+    if not app.config['TEMPLATE_PRECOMPILE']:
+        return
+    env = app.jinja_env
+    for name in env.list_templates():
+        env.get_template(name)
+
+
+# init_app():
+#   - must run before anything else touches `app.jinja_env`, as the jinja options are only read when it is created
+#   - compiled templates are kept on disk under `TEMPLATE_BYTECODE_DIR`, so new workers load them instead of recompiling
+def init_app(app):
+    options = dict(app.jinja_options)
+    options['extensions'] = list(options.get('extensions', ())) + [FragmentCacheExtension]
+    directory = app.config['TEMPLATE_BYTECODE_DIR'] or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(directory, exist_ok=True)
+    options['bytecode_cache'] = FileSystemBytecodeCache(directory)
+    app.jinja_options = options
+
+    if app.config['FRAGMENT_CACHE_TTL']:  # a TTL of 0 (or None) disables the fragment cache
+        app.jinja_env.fragment_cache = MemoryCache(
+            max_entries=app.config['FRAGMENT_CACHE_MAX_ENTRIES'],
+            ttl=app.config['FRAGMENT_CACHE_TTL']
+        )
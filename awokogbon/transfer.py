@@ -0,0 +1,191 @@
+import csv
+import json
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+import click
+from flask.cli import with_appcontext
+from awokogbon.db import open_db, write_transaction
+from awokogbon.listing import rebuild_listing
+
+# the exported (and importable) columns of each table
+TABLES = {
+    'post': ('id', 'author_id', 'created', 'updated', 'title', 'body'),
+    'user': ('id', 'username', 'password'),
+}
+
+# the statement each imported row goes through [left out, `id`, `created` and `updated` get their usual defaults]
+INSERTS = {
+    'post': (
+        'INSERT OR REPLACE INTO post (id, author_id, created, updated, title, body)'
+        " VALUES (?, ?, coalesce(?, CURRENT_TIMESTAMP), coalesce(?, strftime('%Y-%m-%d %H:%M:%f', 'now')), ?, ?)"
+    ),
+    'user': (  # an update, never a replace: a username taken by another id fails the import, rather than orphaning that user's posts
+        'INSERT INTO user (id, username, password) VALUES (?, ?, ?)'
+        ' ON CONFLICT (id) DO UPDATE SET username = excluded.username, password = excluded.password'
+    ),
+}
+OPTIONAL_COLUMNS = ('id', 'created', 'updated')  # an empty value in these means "use the default"
+TIMESTAMP_COLUMNS = ('created', 'updated')  # parsed on import, and stored in SQLite's own format [see `_timestamp`]
+
+# secondary indexes dropped while importing into a table, and re-created once the rows are in
+DEFERRED_INDEXES = {
+    'post': {'post_created_id': 'CREATE INDEX IF NOT EXISTS post_created_id ON post (created, id)'},
+    'user': {},
+}
+
+
+def _value(value):  # timestamps are written back in SQLite's own `YYYY-MM-DD HH:MM:SS[.fff]` format
+    return value.isoformat(' ') if isinstance(value, datetime) else value
+
+
+# an imported timestamp, as stored by SQLite itself: `YYYY-MM-DD HH:MM:SS[.ffffff]` in UTC
+#   - any ISO 8601 form is accepted, e.g. the `T` separated (and zoned) timestamps of `/api/posts`
+#   - raises a `ValueError` for anything else, which `sqlite3`'s timestamp converter would fail to read back on every request
+def _timestamp(value):
+    if not isinstance(value, str):
+        raise ValueError(value)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat(' ')
+
+
+def _detect_format(path, format):
+    if format:
+        return format
+    return 'csv' if path.endswith('.csv') else 'ndjson'
+
+
+# streams a table out, one row at a time, as NDJSON (one json object per line) or CSV [with a header row]
+def export_rows(table, out, format='ndjson'):
+    columns = TABLES[table]
+    rows = open_db().execute('SELECT {0} FROM {1} ORDER BY id'.format(', '.join(columns), table))  # iterated lazily, never fetched all at once
+    writer = csv.writer(out) if format == 'csv' else None
+    if writer:
+        writer.writerow(columns)
+    exported = 0
+    for row in rows:
+        values = [_value(row[column]) for column in columns]
+        if writer:
+            writer.writerow(values)
+        else:
+            out.write(json.dumps(dict(zip(columns, values))) + '\n')
+        exported += 1
+    return exported
+
+
+# yields one tuple of `TABLES[table]` values per input record [missing values are None]
+#   - raises a `ValueError` naming the record, for a timestamp that is not ISO 8601
+def read_rows(table, lines, format='ndjson'):
+    columns = TABLES[table]
+    records = csv.DictReader(lines) if format == 'csv' else (json.loads(line) for line in lines if line.strip())
+    for number, record in enumerate(records, 1):
+        values = []
+        for column in columns:
+            value = record.get(column)
+            if column in OPTIONAL_COLUMNS and value in ('', None):
+                value = None
+            elif column in TIMESTAMP_COLUMNS:
+                try:
+                    value = _timestamp(value)
+                except ValueError:
+                    raise ValueError('{0} record {1} has an invalid {2} timestamp: {3!r}'.format(table, number, column, value))
+            values.append(value)
+        yield tuple(values)
+
+
+# imports rows into a table, `batch_size` rows per `executemany` and transaction
+#   - the table's deferred indexes are dropped first and re-created (then `ANALYZE`d) at the end, instead of being updated row by row
+#   - rows with an existing id replace (posts) or update (users) the existing row
+#   - a row conflicting with another row's unique value (a username taken by another user id) stops the import with an
+#     `IntegrityError`, its batch rolled back [the earlier batches stay imported]
+#   - memory stays constant in the size of the input, as only one batch is held at a time
+#   - the post listing projection is rebuilt afterwards, as the rows go around the repositories [see `listing.py`]
+def import_rows(table, rows, batch_size=1000):
+    insert = INSERTS[table]
+    with write_transaction() as db:
+        for name in DEFERRED_INDEXES[table]:
+            db.execute('DROP INDEX IF EXISTS {0}'.format(name))
+
+    imported = 0
+    try:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                with write_transaction() as db:
+                    db.executemany(insert, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            with write_transaction() as db:
+                db.executemany(insert, batch)
+            imported += len(batch)
+    finally:  # the indexes (and the listing of the batches imported) come back even when the import fails half-way
+        with write_transaction() as db:
+            for sql in DEFERRED_INDEXES[table].values():
+                db.execute(sql)
+            db.execute('ANALYZE {0}'.format(table))
+        rebuild_listing(batch_size)
+    return imported
+
+
+def _report(verb, count, table, started):
+    elapsed = time.perf_counter() - started
+    click.echo('{0} {1} {2} rows in {3:.1f}s ({4:.0f} rows/s).'.format(verb, count, table, elapsed, count / elapsed if elapsed else 0), err=True)
+
+
+def _export_command(table):
+    @click.command('export-{0}s'.format(table))
+    @click.argument('output', default='-')
+    @click.option('--format', type=click.Choice(['ndjson', 'csv']), help='Defaults to csv for a .csv file, else ndjson.')
+    @with_appcontext
+    def command(output, format):
+        format = _detect_format(output, format)
+        started = time.perf_counter()
+        if output == '-':
+            count = export_rows(table, sys.stdout, format)
+        else:
+            with open(output, 'w', encoding='utf8', newline='') as out:
+                count = export_rows(table, out, format)
+        _report('Exported', count, table, started)
+    command.help = 'Stream every {0} row to OUTPUT [a file, or - for stdout] as NDJSON or CSV.'.format(table)
+    return command
+
+
+def _import_command(table):
+    @click.command('import-{0}s'.format(table))
+    @click.argument('input', default='-')
+    @click.option('--format', type=click.Choice(['ndjson', 'csv']), help='Defaults to csv for a .csv file, else ndjson.')
+    @click.option('--batch-size', default=1000, show_default=True, help='Rows inserted per transaction.')
+    @with_appcontext
+    def command(input, format, batch_size):
+        format = _detect_format(input, format)
+        started = time.perf_counter()
+        try:
+            if input == '-':
+                count = import_rows(table, read_rows(table, sys.stdin, format), batch_size)
+            else:
+                with open(input, 'r', encoding='utf8', newline='') as lines:
+                    count = import_rows(table, read_rows(table, lines, format), batch_size)
+        except sqlite3.IntegrityError as e:
+            raise click.ClickException(
+                'Import stopped, a batch conflicts with existing {0}s ({1}): only the batches before it were imported.'.format(table, e)
+            )
+        except ValueError as e:
+            raise click.ClickException('Import stopped, {0}: only the batches before it were imported.'.format(e))
+        _report('Imported', count, table, started)
+        if table == 'post':
+            click.echo('Run `flask render-posts` to render the imported posts ahead of time.', err=True)
+    command.help = 'Stream {0} rows from INPUT [a file, or - for stdin] as NDJSON or CSV, in batched transactions.'.format(table)
+    return command
+
+
+# the commands, registered by `create_app()` without importing this module [see `awokogbon.LazyCommand`]
+export_posts_command = _export_command('post')
+import_posts_command = _import_command('post')
+export_users_command = _export_command('user')
+import_users_command = _import_command('user')
+
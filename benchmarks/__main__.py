@@ -0,0 +1,3 @@
+from benchmarks.bench import bench_command
+
+bench_command()  # `python -m benchmarks --help`
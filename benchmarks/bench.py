@@ -0,0 +1,245 @@
+# Load-testing and latency benchmarks for the blog and auth endpoints
+#   - seeds a throwaway SQLite database with `--rows` posts (and `--users` users)
+#   - drives each scenario through the WSGI app, with flask's test client and/or a real multi-threaded server
+#   - reports p50/p95/p99 latency, throughput and peak RSS, and writes machine-readable json for comparing commits
+#
+# e.g. `python -m benchmarks --rows 1000 --rows 100000 --driver client --driver server --output bench.json`
+
+import http.client
+import http.cookies
+import json
+import os
+import platform
+import resource
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timedelta
+import click
+from werkzeug.security import generate_password_hash
+from werkzeug.serving import make_server, WSGIRequestHandler
+from awokogbon import create_app
+from awokogbon.db import get_pool, init_db
+from awokogbon.listing import rebuild_listing
+
+PASSWORD = 'password'  # every seeded user shares it, so it is hashed once
+SCENARIOS = ('index', 'index_logged_in', 'update', 'login', 'create')
+
+
+def seed(app, users, posts, batch_size=10000):  # creates the schema, then bulk inserts `users` users and `posts` posts
+    with app.app_context():
+        init_db()
+    password_hash = generate_password_hash(PASSWORD, app.config['PASSWORD_HASH_METHOD'])
+    db = sqlite3.connect(app.config['DATABASE'])
+    db.execute('PRAGMA journal_mode = WAL')
+    db.execute('PRAGMA synchronous = OFF')  # a throwaway database, so durability does not matter while seeding
+    with db:
+        db.executemany(
+            'INSERT INTO user (id, username, password) VALUES (?, ?, ?)',
+            ((id, 'user{0}'.format(id), password_hash) for id in range(1, users + 1))
+        )
+    started = datetime(2015, 1, 1)
+    for offset in range(0, posts, batch_size):
+        with db:
+            db.executemany(
+                'INSERT INTO post (id, title, body, author_id, created) VALUES (?, ?, ?, ?, ?)',
+                (
+                    (id, 'Post {0}'.format(id), 'Body of post {0}.\n\nSome *markdown* text.'.format(id),
+                     (id - 1) % users + 1, (started + timedelta(minutes=id)).strftime('%Y-%m-%d %H:%M:%S'))
+                    for id in range(offset + 1, min(offset + batch_size, posts) + 1)
+                )
+            )
+    db.execute('ANALYZE')
+    db.close()
+    with app.app_context():
+        rebuild_listing(batch_size)  # the rows above went around the repositories, so the index page's projection is built once here
+
+
+# FlaskClientDriver: requests go straight into the WSGI app, through one flask test client per worker
+class FlaskClientDriver(object):
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def worker(self):
+        return self.app.test_client()
+
+    def login(self, client, username):
+        client.post('/auth/login', data={'username': username, 'password': PASSWORD})
+
+    def request(self, client, method, path, data=None):
+        return client.open(path, method=method, data=data).status_code
+
+
+class QuietRequestHandler(WSGIRequestHandler):  # the server's per-request access log would drown the report
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+# ServerDriver: requests go over HTTP to a real multi-threaded werkzeug server, through one keep-alive connection per worker
+class ServerDriver(object):
+    name = 'server'
+
+    def __init__(self, app):
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.thread.join()
+
+    def worker(self):
+        return {'connection': http.client.HTTPConnection('127.0.0.1', self.server.server_port), 'cookies': {}}
+
+    def login(self, client, username):
+        self.request(client, 'POST', '/auth/login', {'username': username, 'password': PASSWORD})
+
+    def request(self, client, method, path, data=None):
+        headers = {}
+        body = None
+        if client['cookies']:
+            headers['Cookie'] = '; '.join('{0}={1}'.format(*cookie) for cookie in client['cookies'].items())
+        if data is not None:
+            body = urllib.parse.urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        client['connection'].request(method, path, body=body, headers=headers)
+        response = client['connection'].getresponse()
+        response.read()
+        for header in response.msg.get_all('Set-Cookie') or ():
+            for name, morsel in http.cookies.SimpleCookie(header).items():
+                client['cookies'][name] = morsel.value
+        return response.status
+
+
+def scenario_requests(name, users, posts):  # returns (login as, make the i-th request) for a scenario
+    own_posts = max((posts - 1) // users + 1, 1)  # posts authored by `user1` are ids 1, 1 + users, 1 + 2 * users ...
+    return {
+        'index': (None, lambda i: ('GET', '/', None)),
+        'index_logged_in': ('user1', lambda i: ('GET', '/', None)),
+        'update': ('user1', lambda i: ('GET', '/{0}/update'.format((i % own_posts) * users + 1), None)),
+        'login': (None, lambda i: ('POST', '/auth/login', {'username': 'user{0}'.format(i % users + 1), 'password': PASSWORD})),
+        'create': ('user1', lambda i: ('POST', '/create', {'title': 'Benchmark {0}'.format(i), 'body': 'Created by the benchmark.'})),
+    }[name]
+
+
+def percentile(samples, fraction):  # nearest-rank percentile of already sorted samples
+    return samples[min(int(round(fraction * len(samples) + 0.5)) - 1, len(samples) - 1)] if samples else None
+
+
+def run_scenario(driver, name, users, posts, requests, concurrency, warmup=5):
+    login_as, make_request = scenario_requests(name, users, posts)
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    per_worker = max(requests // concurrency, 1)
+
+    def work(index):
+        client = driver.worker()
+        if login_as:
+            driver.login(client, login_as)
+        for i in range(warmup):
+            driver.request(client, *make_request(i))
+        for i in range(index * per_worker, (index + 1) * per_worker):
+            started = time.perf_counter()
+            status = driver.request(client, *make_request(i))
+            latencies[index].append(time.perf_counter() - started)
+            if status >= 400:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=work, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = sorted(latency for worker in latencies for latency in worker)
+    return {
+        'scenario': name,
+        'driver': driver.name,
+        'rows': posts,
+        'users': users,
+        'concurrency': concurrency,
+        'requests': len(samples),
+        'errors': sum(errors),
+        'p50_ms': percentile(samples, 0.50) * 1000,
+        'p95_ms': percentile(samples, 0.95) * 1000,
+        'p99_ms': percentile(samples, 0.99) * 1000,
+        'throughput_rps': len(samples) / elapsed,
+        'peak_rss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,  # peak of the whole process so far, in KiB on linux
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows, users, drivers, scenarios, requests, concurrency, config=None, echo=None):
+    results = []
+    for posts in rows:
+        directory = tempfile.mkdtemp(prefix='awokogbon-bench-')
+        try:
+            app = create_app(dict({
+                'DATABASE': os.path.join(directory, 'bench.sqlite'),
+                'SESSION_FILE_DIR': os.path.join(directory, 'sessions'),
+                'SECRET_KEY': 'benchmark',
+                'RATELIMIT_RULES': {},  # every benchmark request comes from the one client ip, which the limiter would throttle
+            }, **(config or {})))
+            started = time.perf_counter()
+            seed(app, min(users, max(posts, 1)), posts)
+            if echo:
+                echo('Seeded {0} posts in {1:.1f}s'.format(posts, time.perf_counter() - started))
+            for driver_class in drivers:
+                with driver_class(app) as driver:
+                    for name in scenarios:
+                        result = run_scenario(driver, name, min(users, max(posts, 1)), posts, requests, concurrency)
+                        results.append(result)
+                        if echo:
+                            echo('{driver:6} {scenario:16} rows={rows:<9} p50={p50_ms:8.2f}ms p95={p95_ms:8.2f}ms'
+                                 ' p99={p99_ms:8.2f}ms {throughput_rps:9.1f} req/s rss={peak_rss_kib}KiB errors={errors}'.format(**result))
+            get_pool(app).close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    return {
+        'commit': _git_commit(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'results': results,
+    }
+
+
+@click.command('bench')
+@click.option('--rows', type=int, multiple=True, default=(1000,), show_default=True, help='Posts to seed; repeat for several volumes.')
+@click.option('--users', type=int, default=100, show_default=True, help='Users to seed.')
+@click.option('--driver', 'drivers', type=click.Choice(['client', 'server']), multiple=True, default=('client',), show_default=True)
+@click.option('--scenario', 'scenarios', type=click.Choice(SCENARIOS), multiple=True, default=SCENARIOS, show_default=True)
+@click.option('--requests', type=int, default=200, show_default=True, help='Timed requests per scenario.')
+@click.option('--concurrency', type=int, default=4, show_default=True, help='Concurrent client threads.')
+@click.option('--output', type=click.Path(dir_okay=False, writable=True), help='Write the json results here [default: stdout].')
+def bench_command(rows, users, drivers, scenarios, requests, concurrency, output):
+    driver_classes = [{'client': FlaskClientDriver, 'server': ServerDriver}[driver] for driver in drivers]
+    report = run_benchmarks(rows, users, driver_classes, scenarios, requests, concurrency, echo=lambda line: click.echo(line, err=True))
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        click.echo(json.dumps(report, indent=2))
@@ -6,27 +6,24 @@ setup(
   author='Damilare Lana',
   author_email='damilarelana@gmail.com',
   version='1.0.0',
-  packages=find_packages(),
+  packages=find_packages(exclude=['benchmarks']),
   include_package_data=True,
   zip_safe=False,
+  entry_points={
+    'console_scripts': ['awokogbon=awokogbon.server:cli'],
+  },
   install_requires=[
     'flask',
-    'flask-bootstrap',
-    'flask-migrate',
-    'Flask-Session',
-    'Flask-SQLAlchemy',
+    'blinker',
     'Werkzeug',
-    'SQLAlchemy',
     'MarkupSafe',
     'Jinja2',
     'itsdangerous',
     'Click',
-    'itsdangerous',
     'Markdown',
-    'flask-babel',
-    'flask-wtf',
-    'pytest',
-    'pytest-xdist',
-    'coverage',
   ],
+  extras_require={
+    'sqlalchemy': ['SQLAlchemy'],  # only needed for `STORAGE_ENGINE = 'sqlalchemy'`
+    'test': ['pytest', 'pytest-xdist', 'coverage'],
+  },
 )
@@ -1,9 +1,10 @@
 # Here testing setup functions are configured
 import os
+import shutil
 import tempfile
 import pytest
 from awokogbon import create_app
-from awokogbon.db import open_db, init_db
+from awokogbon.db import get_pool, open_db, init_db
 
 
 # parse sql statement to be used to create testdata
@@ -23,10 +24,15 @@ with open(os.path.join(os.path.dirname(__file__), 'data.sql'), 'rb') as f:
 @pytest.fixture
 def app():  # for the `testing of the application itself: awokogbon`
     db_tempfile, db_tempfilepath = tempfile.mkstemp()  # create temporary file/path needed for the tests database
+    session_tempdir = tempfile.mkdtemp()  # create temporary directory needed for the tests sessions
+    template_tempdir = tempfile.mkdtemp()  # create temporary directory needed for the tests compiled templates
 
     app = create_app({  # create an instance of the application
         'TESTING': True,  # let's flask know that the application is in testing mode
         'DATABASE': db_tempfilepath,  # points to the database path where `_data_sql` would be stored when used
+        'SESSION_FILE_DIR': session_tempdir,  # keeps the test sessions out of the instance folder
+        'TEMPLATE_BYTECODE_DIR': template_tempdir,  # keeps the tests compiled templates out of the instance folder
+        'JOB_WORKERS': 0,  # runs the jobs of a write before its request returns, so the tests see their side effects
     })
 
     with app.app_context():  # initialize the app context e.g. app `in testing mode` to use test database `_data_sql`
@@ -35,9 +41,14 @@ def app():  # for the `testing of the application itself: awokogbon`
 
     yield app  # `an alternative to using return` i.e. a more efficient `return` [what works like a generator]
 
-    # close the temporary file and unlink the temporary file path
+    # close the pooled connections, then close the temporary file and unlink the temporary file path
+    get_pool(app).close()
+    if 'db_engine' in app.extensions:  # only created when a test uses the 'sqlalchemy' storage engine
+        app.extensions['db_engine'].dispose()
     os.close(db_tempfile)
     os.unlink(db_tempfilepath)
+    shutil.rmtree(session_tempdir)
+    shutil.rmtree(template_tempdir)
 
 
 # test actions which we do not want to repeat within test_authentication.py itself
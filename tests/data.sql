@@ -0,0 +1,16 @@
+INSERT INTO user (username, password)
+VALUES
+  ('test', 'pbkdf2:sha256:50000$TCI4GzcX$0de171a4f4dac32e3364c7ddc7c14f3e2fa61f2d17574483f7ffbb431b4acb2f'),
+  ('other', 'pbkdf2:sha256:50000$kJPKsz6N$d2d4784f1b030a9761f5ccaeeaca413f27f2ecb76d6168407af962ddce849f79');
+
+INSERT INTO post (title, body, author_id, created)
+VALUES
+  ('test title', 'test' || x'0a' || 'body', 1, '2018-01-01 00:00:00');
+
+INSERT INTO author_listing (id, username, post_count)
+VALUES
+  (1, 'test', 1),
+  (2, 'other', 0);
+
+INSERT INTO post_listing (created, id, updated, author_id, author_name, title, excerpt)
+SELECT created, id, updated, author_id, 'test', title, 'test body' FROM post;
@@ -0,0 +1,64 @@
+# unit tests focused on the json api `api.py`
+# - tests `list_posts()` view
+# - tests `get_post()` view
+
+import json
+from awokogbon.db import open_db
+
+
+def test_list_posts(client):
+    response = client.get('/api/posts')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['next_cursor'] is None
+    assert data['posts'][0]['title'] == 'test title'
+    assert data['posts'][0]['username'] == 'test'
+    assert data['posts'][0]['created'] == '2018-01-01T00:00:00'
+
+
+def test_list_posts_fields(client):
+    data = json.loads(client.get('/api/posts?fields=id,title').data)
+    assert data['posts'] == [{'id': 1, 'title': 'test title'}]
+
+    response = client.get('/api/posts?fields=id,password')
+    assert response.status_code == 400
+    assert json.loads(response.data)['error'] == 'Unknown fields: password.'
+
+
+def test_list_posts_pagination(client, app):
+    with app.app_context():
+        db = open_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id, created) VALUES (?, ?, 1, ?)',
+            [('post {}'.format(i), '', '2019-01-0{} 00:00:00'.format(i)) for i in range(1, 4)]
+        )
+        db.commit()
+
+    data = json.loads(client.get('/api/posts?fields=title&limit=3').data)
+    assert [post['title'] for post in data['posts']] == ['post 3', 'post 2', 'post 1']
+    data = json.loads(client.get('/api/posts?fields=title&limit=3&cursor=' + data['next_cursor']).data)
+    assert [post['title'] for post in data['posts']] == ['test title']
+    assert data['next_cursor'] is None
+
+
+def test_list_posts_etag(client, authentication):
+    etag = client.get('/api/posts').headers['ETag']
+    assert client.get('/api/posts', headers={'If-None-Match': etag}).status_code == 304
+
+    authentication.login()
+    client.post('/1/update', data={'title': 'updated', 'body': ''})
+    assert client.get('/api/posts', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_get_post(client):
+    response = client.get('/api/posts/1?fields=id,body')
+    assert json.loads(response.data) == {'id': 1, 'body': 'test\nbody'}
+    assert client.get('/api/posts/1?fields=id,body', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    response = client.get('/api/posts/2')
+    assert response.status_code == 404
+    assert 'error' in json.loads(response.data)
+
+    response = client.get('/api/posts/{0}'.format(2 ** 63))  # larger than any sqlite integer
+    assert response.status_code == 404
+    assert 'error' in json.loads(response.data)
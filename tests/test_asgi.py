@@ -0,0 +1,101 @@
+# unit tests focused on the ASGI entry point [from `asgi.py`]
+import asyncio
+import pytest
+from awokogbon.asgi import ASGIApp
+from awokogbon.repositories import get_posts
+
+
+@pytest.fixture
+def asgi_app(app):
+    asgi_app = ASGIApp(app, max_workers=2)
+    yield asgi_app
+    asgi_app.executor.shutdown()
+
+
+# drives a single http request through the ASGI app, returning the messages it sent
+def exchange(asgi_app, method, path, body=b'', headers=()):
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'query_string': query_string.encode(), 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers],
+        'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    chunks = [{'type': 'http.request', 'body': body[:5], 'more_body': True}, {'type': 'http.request', 'body': body[5:]}]
+    messages = []
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi_app(scope, receive, send))
+    return messages
+
+
+# drives a single http request through the ASGI app, returning the status, headers and (joined) body
+def request(asgi_app, method, path, body=b'', headers=()):
+    messages = exchange(asgi_app, method, path, body, headers)
+    start, bodies = messages[0], messages[1:]
+    assert start['type'] == 'http.response.start' and not bodies[-1]['more_body']
+    headers = {name.decode(): value.decode() for name, value in start['headers']}
+    return start['status'], headers, b''.join(message['body'] for message in bodies)
+
+
+def test_index(asgi_app):
+    status, headers, body = request(asgi_app, 'GET', '/')
+    assert status == 200
+    assert b'test title' in body
+
+
+# test form bodies [sent in several chunks] and cookies make it through, so logging in works
+def test_login(asgi_app):
+    status, headers, _ = request(
+        asgi_app, 'POST', '/auth/login', b'username=test&password=test',
+        [('Content-Type', 'application/x-www-form-urlencoded'), ('Content-Length', '27')]
+    )
+    assert status == 302
+    cookie = headers['set-cookie'].split(';', 1)[0]
+
+    status, _, body = request(asgi_app, 'GET', '/', headers=[('Cookie', cookie)])
+    assert b'Log Out' in body
+
+
+# test streamed responses are sent as several chunks
+def test_streamed_api(asgi_app):
+    start, *bodies = exchange(asgi_app, 'GET', '/api/posts?limit=1')
+    assert start['status'] == 200
+    chunks = [message for message in bodies if message['body']]
+    assert len(chunks) > 1  # each chunk was sent as it was produced, not joined into one body first
+    assert all(message['type'] == 'http.response.body' and message['more_body'] for message in chunks)
+    assert bodies[-1] == {'type': 'http.response.body', 'body': b'', 'more_body': False}
+    assert b'"test title"' in b''.join(message['body'] for message in chunks)
+
+
+def test_async_database(asgi_app):
+    async def fetch():
+        row = await asgi_app.db.fetchone('SELECT title FROM post WHERE id = ?', (1,))
+        await asgi_app.db.write(lambda db: db.execute("UPDATE post SET title = 'async' WHERE id = 1"))
+        rows = await asgi_app.db.fetchall('SELECT title FROM post')
+        return row['title'], [row['title'] for row in rows]
+
+    assert asyncio.run(fetch()) == ('test title', ['async'])
+
+
+# test startup opens the pool, and shutdown closes the pools and engines again
+def test_lifespan(app, asgi_app):
+    app.config['STORAGE_ENGINE'] = 'sqlalchemy'
+    asyncio.run(asgi_app.db.run(lambda db: get_posts().get(1)))  # creates the 'sqlalchemy' engine
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(asgi_app({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+    assert 'db_pool' not in app.extensions and 'db_engine' not in app.extensions
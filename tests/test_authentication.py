@@ -1,7 +1,11 @@
 # unit tests focused on user authentication handler `auth.py`
+import threading
 import pytest
 from flask import g, session
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+from awokogbon.auth import invalidate_user
 from awokogbon.db import open_db
+from awokogbon.hashing import HashingPool, needs_rehash
 
 
 # test the register endpoint
@@ -78,3 +82,78 @@ def test_logout(client, authentication):
     with client:
         authentication.logout()
         assert 'user_id' not in session
+
+
+# test the lazy, cached user lookup
+# - routes that never read `g.user` never look the user up
+# - the user record is cached across requests, until `invalidate_user()` is called
+def test_load_logged_in_user_cached(app, client, authentication):
+    authentication.login()
+
+    with client:
+        client.get('/hello')
+        assert 'user' not in g.__dict__
+
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'test'
+
+    with app.app_context():
+        db = open_db()
+        db.execute("UPDATE user SET username = 'renamed' WHERE id = 1")
+        db.commit()
+
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'test'  # still served from the user cache
+
+    with app.test_request_context():
+        invalidate_user(1)
+
+    with client:
+        client.get('/')
+        assert g.user['username'] == 'renamed'
+
+
+# test logging in upgrades a stored hash made with a different method or cost than `PASSWORD_HASH_METHOD`
+def test_login_rehash(app, authentication):
+    with app.app_context():
+        assert open_db().execute('SELECT password FROM user WHERE id = 1').fetchone()[0].startswith('pbkdf2:sha256:50000$')
+
+    authentication.login()
+
+    with app.app_context():
+        password_hash = open_db().execute('SELECT password FROM user WHERE id = 1').fetchone()[0]
+        assert password_hash.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+    assert authentication.login().headers.get('Location') == 'http://localhost/'
+
+
+# test the stored and configured methods are compared with werkzeug's defaults filled in, not as text
+@pytest.mark.parametrize(('configured', 'stored', 'rehash'), (
+    ('pbkdf2:sha256', 'pbkdf2:sha256:50000', True),  # the configured method has werkzeug's default iterations
+    ('pbkdf2:sha256', 'pbkdf2:sha256:{0}'.format(DEFAULT_PBKDF2_ITERATIONS), False),
+    ('pbkdf2:sha256:150000', 'pbkdf2:sha256:150000', False),
+    ('pbkdf2:sha256:150000', 'pbkdf2:sha256:1500000', True),
+    ('pbkdf2:sha512:150000', 'pbkdf2:sha256:150000', True),
+    ('pbkdf2:sha256:150000', 'sha256', True),
+))
+def test_needs_rehash(app, configured, stored, rehash):
+    app.config['PASSWORD_HASH_METHOD'] = configured
+    with app.app_context():
+        assert needs_rehash(stored + '$salt$hash') is rehash
+
+
+# test a saturated hashing pool rejects new logins with a fast 503
+def test_login_hashing_pool_full(app, authentication):
+    pool = HashingPool(max_workers=1, max_queue=0)
+    app.extensions['hashing_pool'] = pool
+    release = threading.Event()
+    pool.submit(release.wait)  # occupies the only slot
+
+    try:
+        response = authentication.login()
+    finally:
+        release.set()
+        pool.shutdown()
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
@@ -0,0 +1,15 @@
+# smoke test for the benchmark harness `benchmarks/bench.py`
+
+from benchmarks.bench import run_benchmarks, SCENARIOS, ServerDriver, FlaskClientDriver
+
+
+def test_run_benchmarks():
+    report = run_benchmarks(
+        rows=(20,), users=3, drivers=(FlaskClientDriver, ServerDriver), scenarios=SCENARIOS, requests=4, concurrency=2,
+        config={'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000'}  # keeps the login scenario fast
+    )
+    assert len(report['results']) == 2 * len(SCENARIOS)
+    for result in report['results']:
+        assert result['errors'] == 0
+        assert result['requests'] == 4
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
@@ -5,8 +5,11 @@
 # - tests `update()` view
 # - tests `delete()` view
 
+import base64
 import pytest
 from awokogbon.db import open_db
+from awokogbon.blog import fetch_posts_page
+from awokogbon.listing import rebuild_listing
 
 
 def test_index(client, authentication):
@@ -26,7 +29,7 @@ def test_index(client, authentication):
     assert b'Log Out' in response.data
     assert b'test title' in response.data
     assert b'by test on 2018-01-01' in response.data
-    assert b'test\nbody' in response.data
+    assert b'test body' in response.data  # the excerpt [the full body is on the post's own page]
     assert b'href="/1/update"' in response.data
 
 
@@ -60,6 +63,7 @@ def test_logged_in_user(app, client, authentication, path):
     with app.app_context():
         db = open_db()
         db.execute('UPDATE post SET author_id = 2 WHERE id = 1')
+        db.execute("UPDATE post_listing SET author_id = 2, author_name = 'other' WHERE id = 1")  # the index reads the projection
         db.commit()
 
     # ensure current user is logged in and then try to access the `/1/update` and `/1/delete` urls
@@ -76,7 +80,8 @@ def test_logged_in_user(app, client, authentication, path):
 # checking if the server throws a 404 error if we attempt to access a post id=2 that does not even exist
 @pytest.mark.parametrize('path', (
     '/2/update',
-    '/2/update'
+    '/2/update',
+    '/{0}/delete'.format(2 ** 63)  # larger than any sqlite integer
 ))
 def test_exists_required(client, authentication, path):
     authentication.login()  # login with current user
@@ -172,3 +177,69 @@ def test_delete(client, authentication, app):
             'SELECT  * FROM post WHERE id = 1'
         ).fetchone()
         assert post is None
+
+
+# test to ensure index() pages through the posts with a cursor
+# - only `POSTS_PER_PAGE` posts are shown per page
+# - the `Older posts` link carries the cursor to the next page
+# - an invalid cursor is rejected
+def test_index_pagination(client, app):
+    app.config['POSTS_PER_PAGE'] = 2
+    with app.app_context():
+        db = open_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id, created) VALUES (?, ?, 1, ?)',
+            [('post {}'.format(i), '', '2019-01-0{} 00:00:00'.format(i)) for i in range(1, 4)]
+        )
+        db.commit()
+        rebuild_listing()  # the posts were inserted around the repositories
+
+    response = client.get('/')
+    assert b'post 3' in response.data
+    assert b'post 2' in response.data
+    assert b'post 1' not in response.data
+    assert b'Older posts' in response.data
+
+    with app.test_request_context():
+        posts, next_cursor = fetch_posts_page()
+    response = client.get('/?cursor=' + next_cursor)
+    assert b'post 1' in response.data
+    assert b'test title' in response.data
+    assert b'Older posts' not in response.data
+
+    assert client.get('/?cursor=garbage').status_code == 400
+
+
+# test a cursor holding a malformed timestamp (or id) is rejected as well, by the index and the api on every storage engine
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+@pytest.mark.parametrize('raw', [
+    'not a date|1', '2018-01-01 00:00:00+01:00|1', '2018-01-01 00:00:00|one', '2018-01-01 00:00:00|{0}'.format(2 ** 63)
+])
+def test_malformed_cursor(client, app, engine, raw):
+    app.config['STORAGE_ENGINE'] = engine
+    token = base64.urlsafe_b64encode(raw.encode('utf8')).decode('ascii')
+    assert client.get('/?cursor=' + token).status_code == 400
+    assert client.get('/api/posts?cursor=' + token).status_code == 400
+
+
+# test the post page shows the full body, revalidates like the index, and 404s for missing posts
+def test_show(client):
+    response = client.get('/1')
+    assert response.status_code == 200
+    assert b'test title' in response.data
+    assert b'test\nbody' in response.data
+    assert client.get('/1', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/2').status_code == 404
+    assert client.get('/{0}'.format(2 ** 63)).status_code == 404
+
+
+# test the index only carries excerpts, so its size does not grow with the length of the posts
+def test_index_size(client, authentication, app):
+    small = len(client.get('/').data)
+    authentication.login()
+    client.post('/1/update', data={'title': 'test title', 'body': 'long ' * 100000})
+    authentication.logout()
+
+    response = client.get('/')
+    assert len(response.data) < small + app.config['EXCERPT_LENGTH'] * 2
+    assert len(client.get('/1').data) > 500000
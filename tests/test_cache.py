@@ -0,0 +1,118 @@
+# unit tests focused on the page cache `cache.py`
+# - tests anonymous index hits are cached and revalidated with 304s [without touching the database]
+# - tests the blog write views invalidate the cached pages [of every process]
+# - tests the memory and filesystem backends
+
+import time
+import pytest
+from awokogbon import create_app
+from awokogbon.cache import FileSystemCache, MemoryCache
+from awokogbon.db import get_pool, open_db
+
+
+# anonymous index hits are rendered once, then served from the cache [even though the listing changed underneath]
+def test_index_cached(client, app):
+    response = client.get('/')
+    assert response.headers['X-Page-Cache'] == 'MISS'
+    etag = response.headers['ETag']
+
+    with app.app_context():
+        db = open_db()
+        db.execute("UPDATE post_listing SET title = 'changed' WHERE id = 1")  # leaves the posts' generation as is
+        db.commit()
+
+    response = client.get('/')
+    assert response.headers['X-Page-Cache'] == 'HIT'
+    assert b'test title' in response.data
+
+    # a conditional request with the current `ETag` is answered with a 304 and no body
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+# hits (and their 304s) reuse the posts' generation this process read, without touching the database
+def test_hit_skips_database(client, app):
+    etag = client.get('/').headers['ETag']
+    statements = []
+    get_pool(app).statement_listeners.append(lambda connection, method, sql, *args: statements.append(sql))
+    assert client.get('/').headers['X-Page-Cache'] == 'HIT'
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+    assert statements == []
+
+    app.config['PAGE_CACHE_GENERATION_TTL'] = 0
+    app.extensions.pop('post_generation')
+    client.get('/', headers={'If-None-Match': etag})
+    assert any('post_generation' in sql for sql in statements)
+
+
+# a logged in user never gets (or fills) the shared page
+def test_logged_in_not_cached(client, authentication):
+    authentication.login()
+    response = client.get('/')
+    assert 'X-Page-Cache' not in response.headers
+    assert b'Log Out' in response.data
+
+
+# the write views clear the cached pages
+@pytest.mark.parametrize(('path', 'data'), (
+    ('/create', {'title': 'created', 'body': ''}),
+    ('/1/update', {'title': 'updated', 'body': ''}),
+    ('/1/delete', {}),
+))
+def test_write_invalidates(client, app, authentication, path, data):
+    client.get('/')
+    authentication.login()
+    client.post(path, data=data)
+    authentication.logout()
+    assert client.get('/').headers['X-Page-Cache'] == 'MISS'
+
+
+# a write through one process invalidates the pages cached by another [e.g. another `serve` worker on the same database]
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_write_invalidates_other_processes(client, app, authentication, engine, monkeypatch):
+    app.config['STORAGE_ENGINE'] = engine
+    other = create_app(dict(app.config, STORAGE_ENGINE=engine))
+    try:
+        other_client = other.test_client()
+        assert other_client.get('/').headers['X-Page-Cache'] == 'MISS'
+        assert other_client.get('/').headers['X-Page-Cache'] == 'HIT'
+
+        authentication.login()
+        client.post('/1/update', data={'title': 'updated', 'body': ''})
+        assert other_client.get('/').headers['X-Page-Cache'] == 'HIT'  # within the other process's `PAGE_CACHE_GENERATION_TTL`
+        monotonic = time.monotonic
+        monkeypatch.setattr(time, 'monotonic', lambda: monotonic() + other.config['PAGE_CACHE_GENERATION_TTL'])
+        response = other_client.get('/')
+        assert response.headers['X-Page-Cache'] == 'MISS' and b'updated' in response.data
+    finally:
+        get_pool(other).close()
+        if 'db_engine' in other.extensions:
+            other.extensions['db_engine'].dispose()
+
+
+def test_memory_cache_eviction(monkeypatch):
+    cache = MemoryCache(max_entries=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')  # `a` is now the most recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+
+    monkeypatch.setattr('awokogbon.cache.time.time', lambda: 10 ** 12)  # far past every expiry
+    assert cache.get('a') is None
+
+
+def test_filesystem_cache(tmpdir):
+    cache = FileSystemCache(str(tmpdir), max_entries=2, ttl=60)
+    entry = {'body': b'<p>page</p>\n', 'etag': 'abc', 'content_type': 'text/html', 'last_modified': 0}
+    cache.set('/', entry)
+    assert cache.get('/') == entry
+
+    cache.set('/?cursor=1', entry)
+    cache.set('/?cursor=2', entry)
+    assert len(tmpdir.listdir()) == 2
+
+    cache.clear()
+    assert cache.get('/') is None
@@ -1,10 +1,14 @@
 # unit tests focused on the database connection handler
 # it tests the open_db(), close_db(), init_db(), init_db_command() and init_app() functions
 
+import os
 import sqlite3
+import threading
+import time
 import pytest
 
-from awokogbon.db import open_db
+from awokogbon.listing import rebuild_listing
+from awokogbon.db import get_pool, open_db, PoolTimeout, STICKY_KEY, write_transaction, WriteQueue
 
 
 # `app` is automatically available as an argument because we already defined it as a fixture in conftest.py
@@ -34,3 +38,132 @@ def test_init_db_command(runner, monkeypatch):
     result = runner.invoke(args=['init-db'])  # `runner` is instance of `test_cli_runner`, with `invoke()` method, that returns a `result object`
     assert 'Initialized' in result.output  # the `result` object has the `output` attribute: which gives the result as a `unicode string`
     assert Logger.flag  # this should be true, if `awokogbon.db.init_db()` was ran i.e. `awokogbon.db.init_db.mock_flag()` also runs implicitly
+
+
+# test the connection pool
+# - a released connection is reused by the next application context [instead of reconnecting]
+# - the pool reports its statistics
+# - an exhausted pool raises `PoolTimeout` once `DB_POOL_TIMEOUT` has passed
+def test_connection_pool(app):
+    app.config['DB_POOL_TIMEOUT'] = 0.05
+    app.extensions.pop('db_pool', None)  # rebuild the pool with the shorter timeout
+    pool = get_pool(app)
+
+    with app.app_context():
+        first = open_db()._connection
+    with app.app_context():
+        assert open_db()._connection is first
+        assert pool.stats()['in_use'] == 1
+    assert pool.stats()['in_use'] == 0
+    assert pool.stats()['idle'] == 1
+
+    held = [pool.acquire() for _ in range(pool.max_size)]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    for connection in held:
+        pool.release(connection)
+    assert pool.stats()['waits'] == 1
+
+
+# test the connection tuning and write serialisation
+# - pooled connections are configured from the `DB_*` app config
+# - write_transaction() commits on success and rolls back on error
+# - the write queue hands the lock to waiting writers in order
+def test_pragmas_and_write_transaction(app):
+    with app.app_context():
+        db = open_db()
+        assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        assert db.execute('PRAGMA busy_timeout').fetchone()[0] == app.config['DB_BUSY_TIMEOUT']
+
+        with write_transaction() as db:
+            db.execute("UPDATE post SET title = 'written' WHERE id = 1")
+        with pytest.raises(RuntimeError):
+            with write_transaction() as db:
+                db.execute("UPDATE post SET title = 'rolled back' WHERE id = 1")
+                raise RuntimeError
+        assert db.execute('SELECT title FROM post WHERE id = 1').fetchone()[0] == 'written'
+
+
+# test write_transaction() nests: inner blocks join the outer transaction [without queueing again], which alone commits
+# - an inner block that raises rolls back only its own writes
+def test_nested_write_transaction(app):
+    app.config['DB_SERIALIZE_WRITES'] = True  # a nested block queueing again would wait on itself, and time out
+    app.config['DB_BUSY_TIMEOUT'] = 100
+    app.extensions.pop('db_pool').close()  # rebuild the pool with a write queue
+    with app.app_context():
+        with write_transaction() as outer:
+            outer.execute("UPDATE post SET title = 'outer' WHERE id = 1")
+            with write_transaction() as inner:
+                inner.execute("INSERT INTO post (title, body, author_id) VALUES ('inner', '', 1)")
+            with pytest.raises(RuntimeError):
+                with write_transaction() as inner:
+                    inner.execute("UPDATE post SET title = 'rolled back' WHERE id = 1")
+                    raise RuntimeError
+            assert outer.in_transaction
+        db = open_db()
+        assert not db.in_transaction
+        assert [row[0] for row in db.execute('SELECT title FROM post ORDER BY id')] == ['outer', 'inner']
+
+        with pytest.raises(RuntimeError):
+            with write_transaction() as outer:
+                with write_transaction() as inner:
+                    inner.execute("UPDATE post SET title = 'never committed' WHERE id = 1")
+                raise RuntimeError
+        assert db.execute('SELECT title FROM post WHERE id = 1').fetchone()[0] == 'outer'
+        assert len(get_pool().write_queue) == 0
+
+
+def test_write_queue():
+    queue = WriteQueue()
+    order = []
+    assert queue.acquire()
+
+    def writer(name):
+        queue.acquire()
+        order.append(name)
+        queue.release()
+
+    threads = []
+    for name in ('first', 'second'):
+        threads.append(threading.Thread(target=writer, args=(name,)))
+        threads[-1].start()
+        while len(queue) < len(threads):  # wait until the writer is queued, to fix the arrival order
+            time.sleep(0.001)
+
+    assert not queue.acquire(timeout=0.01)  # still held, and the timed out waiter leaves the queue
+    assert len(queue) == 2
+    queue.release()
+    for thread in threads:
+        thread.join()
+    assert order == ['first', 'second']
+
+
+# test GET reads are served by a replica, except during a user's read-your-writes window
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_read_replicas(app, client, authentication, engine):
+    replica_path = app.config['DATABASE'] + '-replica'
+    with app.app_context():
+        replica = sqlite3.connect(replica_path)
+        open_db().backup(replica)  # the replica is a snapshot, it never sees the writes below
+        replica.close()
+        with write_transaction() as db:
+            db.execute("INSERT INTO post (title, body, author_id) VALUES ('primary only', '', 1)")
+        rebuild_listing()
+
+    app.config.update(STORAGE_ENGINE=engine, DB_REPLICAS=[replica_path], DATABASE_REPLICA_URLS=['sqlite:///' + replica_path])
+    try:
+        authentication.login()  # logging in starts a window too
+        assert b'primary only' in client.get('/').data
+
+        with client.session_transaction() as session:
+            session[STICKY_KEY] = 0
+        assert b'primary only' not in client.get('/').data
+
+        client.post('/create', data={'title': 'my own write', 'body': ''})
+        assert b'my own write' in client.get('/').data
+    finally:
+        for pool in app.extensions.get('db_replica_pools', ()):
+            pool.close()
+        for replica_engine in app.extensions.get('db_replica_engines', ()):
+            replica_engine.dispose()
+        os.unlink(replica_path)
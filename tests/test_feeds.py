@@ -0,0 +1,67 @@
+# unit tests focused on the atom and rss feeds [from `feeds.py`]
+from xml.etree import ElementTree
+import pytest
+from flask import render_template
+from awokogbon import feeds
+from awokogbon.db import write_transaction
+from awokogbon.listing import rebuild_listing
+
+
+@pytest.mark.parametrize('kind', ['atom', 'rss'])
+def test_feed(client, kind):
+    response = client.get('/feed.' + kind)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/{0}+xml'.format(kind)
+    assert not response.headers['ETag'].startswith('W/')  # a strong ETag
+    assert b'test title' in response.data
+    ElementTree.fromstring(response.data)  # well formed, with the post body escaped into the xml
+
+    assert client.get('/feed.' + kind, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+# test the feed is only regenerated when a write changes the posts it lists
+def test_feed_regeneration(app, client, authentication, monkeypatch):
+    app.config['FEED_SIZE'] = 1
+    etag = client.get('/feed.atom').headers['ETag']
+    rendered = []
+    monkeypatch.setattr(feeds, 'render_template', lambda *args, **kwargs: rendered.append(args) or render_template(*args, **kwargs))
+
+    with app.app_context():  # a post outside the feed window [older than the only post in it]
+        with write_transaction() as db:
+            db.execute("INSERT INTO post (title, body, author_id, created) VALUES ('older', '', 1, '2017-01-01 00:00:00')")
+        rebuild_listing()
+    authentication.login()
+    client.post('/2/update', data={'title': 'older, edited', 'body': ''})
+    assert client.get('/feed.atom').headers['ETag'] == etag
+    assert rendered == []  # the feed's posts are unchanged, so it was kept rather than rendered again
+
+    client.post('/1/update', data={'title': 'edited', 'body': ''})
+    response = client.get('/feed.atom', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and b'edited' in response.data
+    etag = response.headers['ETag']
+
+    client.post('/create', data={'title': 'newest', 'body': ''})
+    response = client.get('/feed.atom')
+    assert response.headers['ETag'] != etag
+    assert b'newest' in response.data and b'<title>edited' not in response.data
+
+
+# test a feed cached for one host is never served to another, as its links are absolute
+def test_feed_per_host(client):
+    first = client.get('/feed.atom', base_url='http://one.example')
+    second = client.get('/feed.atom', base_url='http://two.example')
+    assert b'http://one.example/1' in first.data and b'one.example' not in second.data
+    assert b'http://two.example/1' in second.data
+    assert first.headers['ETag'] != second.headers['ETag']
+    assert client.get('/feed.atom', base_url='http://two.example', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+
+# test an empty feed still has the `<updated>` atom requires
+def test_empty_feed(app, client):
+    with app.app_context():
+        with write_transaction() as db:
+            db.execute('DELETE FROM post')
+        rebuild_listing()
+    feed = ElementTree.fromstring(client.get('/feed.atom').data)
+    assert feed.find('{http://www.w3.org/2005/Atom}updated').text
+    assert feed.find('{http://www.w3.org/2005/Atom}entry') is None
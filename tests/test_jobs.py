@@ -0,0 +1,138 @@
+# unit tests focused on the job queue [from `jobs.py`]
+import sqlite3
+import threading
+import pytest
+from awokogbon import jobs
+from awokogbon.db import open_db, write_transaction
+from awokogbon.repositories import get_posts
+
+calls = []
+
+
+@jobs.handler('test_record')
+def record(**payload):
+    calls.append(payload)
+
+
+@jobs.handler('test_fail')
+def fail():
+    raise ValueError('always fails')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    del calls[:]
+
+
+def _count(app, table):
+    with app.app_context():
+        return open_db().execute('SELECT COUNT(*) FROM {0}'.format(table)).fetchone()[0]
+
+
+# test jobs are only recorded when the write recording them commits
+def test_enqueue_is_transactional(app):
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            with write_transaction() as db:
+                jobs.enqueue(db, [('test_record', {'n': 1})])
+                raise RuntimeError()
+        with write_transaction() as db:
+            jobs.enqueue(db, [('test_record', {'n': 2})])
+    assert _count(app, 'job') == 1
+
+    assert jobs.JobQueue(app).run_pending() == 1
+    assert calls == [{'n': 2}] and _count(app, 'job') == 0
+
+
+# test the repositories record the jobs of a post write, which run (inline, with no workers) once it commits
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_repositories_enqueue(app, engine):
+    app.config['STORAGE_ENGINE'] = engine
+    with app.test_request_context(method='POST'):
+        posts = get_posts()
+        id = posts.create('created', '', '', 1, jobs=[('test_record', {'write': 'create'})])
+        posts.update(id, 'updated', '', '', jobs=[('test_record', {'write': 'update'})])
+        posts.delete(id, jobs=[('test_record', {'write': 'delete'})])
+    assert calls == [{'write': 'create'}, {'write': 'update'}, {'write': 'delete'}]
+    assert _count(app, 'job') == 0
+
+
+# test the jobs of the 'sqlalchemy' engine are claimed from its `DATABASE_URL`, not from the app's sqlite `DATABASE`
+def test_sqlalchemy_outbox(app, tmpdir):
+    path = str(tmpdir.join('storage.sqlite'))
+    with app.open_resource('schema.sql') as f:
+        storage = sqlite3.connect(path)
+        storage.executescript(f.read().decode('utf8'))
+        storage.execute("INSERT INTO user (username, password) VALUES ('author', '')")
+        storage.commit()
+        storage.close()
+    app.config.update(STORAGE_ENGINE='sqlalchemy', DATABASE_URL='sqlite:///' + path, JOB_WORKERS=0)
+    queue = app.extensions['job_queue']
+    queue.max_attempts = 1
+    with app.test_request_context(method='POST'):
+        get_posts().create('created', '', '', 1, jobs=[('test_record', {'n': 1}), ('test_fail', {})])
+    assert calls == [{'n': 1}]
+
+    storage = sqlite3.connect(path)
+    try:
+        assert storage.execute('SELECT COUNT(*) FROM job').fetchone()[0] == 0
+        assert storage.execute('SELECT kind FROM dead_job').fetchall() == [('test_fail',)]
+    finally:
+        storage.close()
+    assert (_count(app, 'job'), _count(app, 'dead_job')) == (0, 0)
+
+
+# test a failing job is retried with a backoff, then moved to the dead jobs, from where it can be retried
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_retries_and_dead_jobs(app, runner, engine):
+    app.config['STORAGE_ENGINE'] = engine
+    queue = jobs.JobQueue(app, max_attempts=3, retry_delay=0)
+    with app.app_context():
+        with write_transaction() as db:
+            jobs.enqueue(db, [('test_fail', {})])
+
+    assert queue.run_pending() == 3
+    assert _count(app, 'job') == 0
+    with app.app_context():
+        dead = open_db().execute('SELECT * FROM dead_job').fetchone()
+    assert (dead['kind'], dead['attempts'], dead['last_error']) == ('test_fail', 3, 'ValueError: always fails')
+
+    result = runner.invoke(args=['jobs', 'list', '--dead'])
+    assert '0 queued (0 due), 1 dead.' in result.output and 'always fails' in result.output
+    assert 'Retried 1 jobs.' in runner.invoke(args=['jobs', 'retry']).output
+    assert (_count(app, 'job'), _count(app, 'dead_job')) == (1, 0)
+
+    queue.retry_delay = 60
+    assert queue.run_pending() == 1  # the first attempt, the retry is not due yet
+    assert 'Ran 0 jobs.' in runner.invoke(args=['jobs', 'run']).output
+    assert '1 queued (0 due), 0 dead.' in runner.invoke(args=['jobs', 'list']).output
+
+
+# test a job claimed by a worker that never finished it is run again, and buried once it used up its attempts
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_lost_jobs(app, engine):
+    app.config['STORAGE_ENGINE'] = engine
+    queue = jobs.JobQueue(app, max_attempts=2, timeout=-1)  # every claim has already timed out
+    with app.app_context():
+        with write_transaction() as db:
+            jobs.enqueue(db, [('test_record', {})])
+        assert queue._claim()['attempts'] == 0
+        assert queue._claim()['attempts'] == 1
+        assert queue._claim() is None
+        assert open_db().execute('SELECT last_error FROM dead_job').fetchone()[0] == 'Timed out.'
+
+
+# test the worker threads run the jobs they are notified of
+def test_workers(app):
+    queue = jobs.JobQueue(app, workers=2)
+    done = threading.Event()
+    jobs.handler('test_done')(lambda: done.set())
+    try:
+        with app.app_context():
+            with write_transaction() as db:
+                jobs.enqueue(db, [('test_done', {})])
+        queue.notify()
+        assert done.wait(5)
+    finally:
+        queue.stop(5)
+    assert not any(thread.is_alive() for thread in queue._threads)
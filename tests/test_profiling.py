@@ -0,0 +1,77 @@
+# unit tests focused on the request instrumentation `profiling.py`
+# - tests the `Server-Timing` header
+# - tests the rolling route stats view
+# - tests the sampled cProfile dumps
+# - tests the cold start measurement
+
+import json
+import pytest
+from awokogbon import create_app
+from awokogbon.profiling import measure_startup
+
+
+@pytest.fixture
+def profiled_app(app, tmpdir):  # the test app again [same database and sessions], with the instrumentation turned on
+    return create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'SESSION_FILE_DIR': app.config['SESSION_FILE_DIR'],
+        'PROFILING_ENABLED': True,
+        'PROFILING_STATS_TOKEN': 'secret',
+        'PROFILING_SAMPLE_RATE': 1.0,
+        'PROFILING_SLOW_THRESHOLD': 0,
+        'PROFILING_DIR': str(tmpdir),
+    })
+
+
+def test_server_timing(profiled_app):
+    client = profiled_app.test_client()
+    client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    timing = client.get('/').headers['Server-Timing']
+    assert 'desc="2 queries"' in timing  # the user lookup and the index page
+    for metric in ('db;', 'template;', 'session;', 'app;'):
+        assert metric in timing
+
+
+def test_route_stats(profiled_app):
+    client = profiled_app.test_client()
+    client.get('/')
+    client.get('/')
+    client.get('/hello')
+
+    assert client.get('/_profiling/stats').status_code == 403
+    routes = json.loads(client.get('/_profiling/stats?token=secret').data)['routes']
+    assert routes['blog.index']['count'] == 2
+    assert sum(routes['blog.index']['histogram'].values()) == 2
+    assert routes['hello']['queries'] == 0
+
+
+def test_profile_dumps(profiled_app, tmpdir):
+    profiled_app.test_client().get('/hello')
+    assert [path.basename.endswith('-hello.prof') for path in tmpdir.listdir()] == [True]
+
+
+def test_disabled_by_default(client):
+    assert 'Server-Timing' not in client.get('/').headers
+    assert client.get('/_profiling/stats').status_code == 404
+
+
+# test a cold start is measured in a new interpreter, which only imports SQLAlchemy for the 'sqlalchemy' storage engine
+#   - nor the instrumentation (unless enabled), the import/export commands or markdown [until a post is first rendered]
+def test_measure_startup(app):
+    config = {name: app.config[name] for name in ('TESTING', 'DATABASE', 'SESSION_FILE_DIR', 'TEMPLATE_BYTECODE_DIR')}
+    timings, modules = measure_startup(config)
+    assert timings['import'] > 0 and timings['create_app'] > 0
+    names = [name for name, own, cumulative in modules]
+    assert 'awokogbon' in names and 'awokogbon.repositories' in names
+    assert 'sqlalchemy' not in names and 'awokogbon.sqlalchemy_repositories' not in names
+    for name in ('awokogbon.profiling', 'awokogbon.transfer', 'awokogbon.safe_markdown', 'markdown'):
+        assert name not in names
+
+
+# test the lazily registered commands are listed, and run their module's command once used
+def test_lazy_commands(runner, monkeypatch):
+    assert 'import-posts' in runner.invoke(args=['--help']).output
+    monkeypatch.setattr('awokogbon.profiling.measure_startup', lambda: ({'import': 0.1, 'create_app': 0.2}, [('awokogbon', 0.001, 0.1)]))
+    result = runner.invoke(args=['profile-startup'])
+    assert 'create_app() took 200.0ms' in result.output and 'awokogbon' in result.output
@@ -0,0 +1,45 @@
+# unit tests focused on the query plan tooling `queryplan.py`
+# - tests the slow query log
+# - tests the `explain-queries` command
+
+import logging
+from awokogbon import queryplan
+from awokogbon.db import open_db
+from awokogbon.queryplan import full_scans, parameters_shape
+
+
+def test_slow_query_log(app, caplog):
+    app.config['DB_SLOW_QUERY_THRESHOLD'] = 0  # every statement is slow
+    app.extensions['db_statement_listeners'][:] = []  # replace the default slow query log, like `create_app` would
+    queryplan.init_app(app)
+
+    with caplog.at_level(logging.WARNING, logger='awokogbon.queryplan'):
+        with app.app_context():
+            open_db().execute('SELECT * FROM post WHERE body = ?', ('secret',)).fetchall()
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert 'SELECT * FROM post WHERE body = ?' in message
+    assert 'params=(str)' in message
+    assert 'secret' not in message  # parameter values are never logged
+    assert 'SCAN post' in message
+    assert message.endswith('FULL SCAN')
+
+
+def test_full_scans():
+    assert full_scans(['SCAN post']) == ['SCAN post']
+    assert full_scans(['SCAN p USING INDEX post_created_id', 'SEARCH u USING INTEGER PRIMARY KEY (rowid=?)']) == []
+    assert full_scans(['SCAN post_search VIRTUAL TABLE INDEX 32:M2', 'USE TEMP B-TREE FOR ORDER BY']) == ['USE TEMP B-TREE FOR ORDER BY']
+
+
+def test_parameters_shape():
+    assert parameters_shape((1, 'a', None)) == '(int, str, NoneType)'
+    assert parameters_shape({'id': 1}) == '{id: int}'
+    assert parameters_shape(None) == '()'
+
+
+def test_explain_queries_command(runner):
+    result = runner.invoke(args=['explain-queries'])
+    assert 'SELECT * FROM user WHERE username = ?' in result.output
+    assert 'FROM post_listing WHERE (created, id) < (?, ?)' in result.output
+    assert '0 queries with full scans.' in result.output
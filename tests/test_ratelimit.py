@@ -0,0 +1,41 @@
+# unit tests focused on the rate limiter [from `ratelimit.py`]
+import pytest
+from awokogbon.ratelimit import MemoryStore, RateLimiter, SqliteStore, take_token
+
+
+def test_take_token():
+    assert take_token(2, 0, 0, capacity=2, rate=1) == (1, 0)
+    assert take_token(0.5, 0, 0, capacity=2, rate=0.25) == (0.5, 2.0)  # half a token short, at a quarter token per second
+    assert take_token(0, 0, 100, capacity=2, rate=1) == (1, 0)  # refills up to `capacity` only
+
+
+@pytest.mark.parametrize('storage', ['memory', 'sqlite'])
+def test_login_throttled_by_username(app, client, storage):
+    store = MemoryStore() if storage == 'memory' else SqliteStore()
+    app.extensions['rate_limiter'] = RateLimiter(store, {'login': {'ip': (100, 60), 'username': (2, 60)}})
+
+    for _ in range(2):
+        assert client.post('/auth/login', data={'username': 'test', 'password': 'wrong'}).status_code == 200
+    response = client.post('/auth/login', data={'username': 'test', 'password': 'test'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) == 30
+
+    # other usernames, and just showing the form, are not throttled
+    assert client.post('/auth/login', data={'username': 'other', 'password': 'other'}).status_code == 302
+    assert client.get('/auth/login').status_code == 200
+
+    assert app.extensions['rate_limiter'].stats() == {
+        'login': {'ip': {'allowed': 4, 'throttled': 0}, 'username': {'allowed': 3, 'throttled': 1}}
+    }
+
+
+# test a throttled request never reaches the database or the hashing pool
+def test_throttled_before_any_work(app, client, monkeypatch):
+    app.extensions['rate_limiter'] = RateLimiter(MemoryStore(), {'register': {'ip': (1, 60)}})
+    client.post('/auth/register', data={'username': 'a', 'password': 'a'})
+
+    def fail(*args):
+        raise AssertionError('not throttled early enough')
+    monkeypatch.setattr('awokogbon.auth.get_users', fail)
+    monkeypatch.setattr('awokogbon.auth.hash_password', fail)
+    assert client.post('/auth/register', data={'username': 'b', 'password': 'b'}).status_code == 429
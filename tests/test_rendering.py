@@ -0,0 +1,73 @@
+# unit tests focused on the markdown rendering `rendering.py`
+# - tests the rendered html is sanitised
+# - tests the write views store the rendered html
+# - tests the html is rendered by a job, after the write committed
+# - tests the `render-posts` backfill command
+
+import pytest
+from awokogbon.db import open_db
+from awokogbon.rendering import render_markdown
+from awokogbon.repositories import get_posts
+
+
+@pytest.mark.parametrize(('text', 'html'), (
+    ('**bold**', '<p><strong>bold</strong></p>'),
+    ('<script>alert(1)</script>', '<p>&lt;script&gt;alert(1)&lt;/script&gt;</p>'),
+    ('[link](javascript:alert(1))', '<p><a href="">link</a></p>'),
+    ('[link](&#106;avascript:alert(1))', '<p><a href="">link</a></p>'),  # entity encoded
+    ('[link](jav&#x09;ascript:alert(1))', '<p><a href="">link</a></p>'),  # split by an encoded tab
+    ('[link](java&#10;script:alert(1))', '<p><a href="">link</a></p>'),  # split by an encoded newline
+    ('![image](&#x6A;avascript:alert(1))', '<p><img alt="image" src="" /></p>'),
+    ('[link](https://example.com/?a=1&b=2)', '<p><a href="https://example.com/?a=1&amp;b=2">link</a></p>'),
+    ('[link](https://example.com)', '<p><a href="https://example.com">link</a></p>'),
+))
+def test_render_markdown(text, html):
+    assert render_markdown(text) == html
+
+
+def test_write_stores_html(client, authentication, app):
+    authentication.login()
+    client.post('/create', data={'title': 'created', 'body': '*new*'})
+    client.post('/1/update', data={'title': 'updated', 'body': '# heading'})
+
+    with app.app_context():
+        db = open_db()
+        assert db.execute('SELECT body_html FROM post WHERE id = 1').fetchone()[0] == '<h1>heading</h1>'
+        assert db.execute('SELECT body_html FROM post WHERE id = 2').fetchone()[0] == '<p><em>new</em></p>'
+
+    assert b'<h1>heading</h1>' in client.get('/1').data
+
+
+# test a post written without html is listed by its source, and rendered by its `render_post` job [unless it was edited since]
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_render_post_job(app, monkeypatch, engine):
+    app.config['STORAGE_ENGINE'] = engine
+    monkeypatch.setattr('awokogbon.repositories.notify', lambda: None)  # the job is left in the outbox, as if no worker took it yet
+    monkeypatch.setattr('awokogbon.sqlalchemy_repositories.notify', lambda: None)
+    with app.app_context():
+        posts = get_posts()
+        id = posts.create('created', '*new*', None, 1)
+        assert posts.get(id)['body_html'] is None and posts.page(limit=1)[0]['excerpt'] == '*new*'
+        assert not posts.set_body_html(id, '*old*', '<p>stale</p>')
+
+    assert app.extensions['job_queue'].run_pending() == 1
+    with app.app_context():
+        assert get_posts().get(id)['body_html'] == '<p><em>new</em></p>'
+        assert get_posts().page(limit=1)[0]['excerpt'] == 'new'
+
+
+def test_render_posts_command(runner, app):
+    with app.app_context():
+        db = open_db()
+        db.executemany('INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)', [('old', '*old*')] * 2)
+        db.commit()
+
+    result = runner.invoke(args=['render-posts', '--batch-size', '2'])
+    assert 'Rendered 3 posts.' in result.output
+
+    with app.app_context():
+        db = open_db()
+        assert db.execute('SELECT COUNT(*) FROM post WHERE body_html IS NULL').fetchone()[0] == 0
+        assert db.execute('SELECT body_html FROM post WHERE id = 2').fetchone()[0] == '<p><em>old</em></p>'
+
+    assert 'Rendered 0 posts.' in runner.invoke(args=['render-posts']).output
@@ -0,0 +1,136 @@
+# unit tests focused on the posts and users repositories [from `repositories.py`], run against every storage engine
+import json
+import pytest
+from awokogbon.repositories import get_posts, get_users
+
+
+@pytest.fixture(params=['sqlite', 'sqlalchemy'])
+def engine_app(app, request):
+    app.config['STORAGE_ENGINE'] = request.param  # the repositories are only created on first use, so this still applies
+    return app
+
+
+def test_posts(engine_app):
+    with engine_app.app_context():
+        posts = get_posts()
+        post = posts.get(1)
+        assert (post['title'], post['username'], post['created'].year) == ('test title', 'test', 2018)
+        assert posts.get(2) is None
+
+        id = posts.create('second', 'body', '<p>body</p>', 1)
+        page = posts.page(limit=1)
+        assert [row['id'] for row in page] == [id, 1]  # one extra row signals a next page
+        assert [row['id'] for row in posts.page((str(page[0]['created']), page[0]['id']), limit=1)] == [1]
+
+        updated = page[1]['updated']
+        posts.update(1, 'updated', 'new body', '<p>new body</p>')
+        post = posts.page((str(page[0]['created']), page[0]['id']), limit=1)[0]
+        assert (post['title'], post['excerpt']) == ('updated', 'new body')
+        assert post['updated'] > updated
+        assert posts.get(1)['body_html'] == '<p>new body</p>'
+
+        posts.delete(1)
+        assert posts.get(1) is None
+
+
+def test_users(engine_app):
+    with engine_app.app_context():
+        users = get_users()
+        assert users.get_by_username('test')['id'] == 1
+        assert users.get_by_username('nobody') is None
+
+        id = users.create('new', 'hash')
+        users.set_password(id, 'rehashed')
+        assert dict(users.get(id)) == {'id': id, 'username': 'new', 'password': 'rehashed'}
+
+
+# test the blog and auth views behave the same on the sqlalchemy engine
+def test_views_on_sqlalchemy(app, client, authentication):
+    app.config['STORAGE_ENGINE'] = 'sqlalchemy'
+
+    assert client.post('/auth/register', data={'username': 'a', 'password': 'a'}).status_code == 302
+    authentication.login('a', 'a')
+    client.post('/create', data={'title': 'from sqlalchemy', 'body': ''})
+    assert b'from sqlalchemy' in client.get('/').data
+    assert client.post('/1/update', data={'title': 'x', 'body': ''}).status_code == 403
+
+
+def test_unknown_engine(app):
+    app.config['STORAGE_ENGINE'] = 'mongo'
+    with app.app_context():
+        with pytest.raises(ValueError):
+            get_posts()
+
+
+# test the sqlalchemy engine leaves a pragma configured as `None` at its SQLite default, like the app's own pool
+def test_sqlalchemy_pragma_defaults(app):
+    from awokogbon.sqlalchemy_repositories import create_engine_from_config
+    engine = create_engine_from_config(dict(app.config, DB_MMAP_SIZE=None, DB_CACHE_SIZE=None))
+    try:
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == app.config['DB_BUSY_TIMEOUT']
+    finally:
+        engine.dispose()
+
+
+# the sqlalchemy engine on a database created by `create_schema()` alone, without `schema.sql`'s triggers and FTS5 index
+#   - a stand-in for a server database (e.g. postgresql) the tests cannot reach
+@pytest.fixture
+def portable_app(app, tmpdir):
+    from awokogbon.sqlalchemy_repositories import create_engine_from_config, create_schema
+    url = 'sqlite:///' + str(tmpdir.join('portable.sqlite'))
+    engine = create_engine_from_config(app.config, url)
+    try:
+        create_schema(engine)
+        create_schema(engine)  # only creates what is missing
+        with engine.connect() as connection:
+            assert connection.exec_driver_sql("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger'").scalar() == 0
+            assert connection.exec_driver_sql('SELECT generation FROM post_generation').fetchall() == [(0,)]
+    finally:
+        engine.dispose()
+    app.config.update(STORAGE_ENGINE='sqlalchemy', DATABASE_URL=url)
+    return app
+
+
+def test_views_on_portable_schema(portable_app, client, authentication):
+    assert client.post('/auth/register', data={'username': 'a', 'password': 'a'}).status_code == 302
+    authentication.login('a', 'a')
+    with portable_app.app_context():
+        generation = get_posts().generation()
+    client.post('/create', data={'title': 'portable', 'body': '*rendered*'})
+    assert b'portable' in client.get('/').data and b'<em>rendered</em>' in client.get('/1').data
+    client.post('/1/update', data={'title': 'edited', 'body': ''})
+    assert b'edited' in client.get('/').data
+
+    with portable_app.app_context():
+        assert get_posts().generation() > generation
+        assert get_posts().get(1)['body_html'] == ''
+    client.post('/1/delete')
+    assert b'edited' not in client.get('/').data
+
+
+# test the json api and the search read the 'sqlalchemy' engine's database too, not the app's sqlite `DATABASE`
+def test_api_and_search_on_portable_schema(portable_app, client, authentication):
+    client.post('/auth/register', data={'username': 'a', 'password': 'a'})
+    authentication.login('a', 'a')
+    client.post('/create', data={'title': 'portable', 'body': 'searchable 100% body'})
+    client.post('/create', data={'title': 'other', 'body': 'body'})
+
+    posts = json.loads(client.get('/api/posts?limit=1').data)
+    assert [post['title'] for post in posts['posts']] == ['other'] and posts['next_cursor']
+    posts = json.loads(client.get('/api/posts?fields=id,username&cursor=' + posts['next_cursor']).data)
+    assert posts == {'posts': [{'id': 1, 'username': 'a'}], 'next_cursor': None}
+    assert json.loads(client.get('/api/posts/1?fields=title').data) == {'title': 'portable'}
+    assert client.get('/api/posts/3').status_code == 404
+
+    assert b'searchable 100% body' in client.get('/search?q=Searchable+100%25').data  # a LIKE match, without the FTS5 index
+    assert b'No posts match' in client.get('/search?q=100_').data  # `_` is matched as itself, not as a wildcard
+
+
+# test `flask init-db` also initializes the 'sqlalchemy' engine's `DATABASE_URL`
+def test_init_storage(app, runner, tmpdir):
+    path = tmpdir.join('storage.sqlite')
+    app.config.update(STORAGE_ENGINE='sqlalchemy', DATABASE_URL='sqlite:///' + str(path))
+    assert 'Initialized the storage database.' in runner.invoke(args=['init-db']).output
+    with app.app_context():
+        assert get_posts().generation() == 0 and get_posts().page() == []
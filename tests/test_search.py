@@ -0,0 +1,93 @@
+# unit tests focused on the post search `search.py`
+# - tests `search()` view
+# - tests the triggers keep the index in sync with the posts
+# - tests the `rebuild-search-index` command
+
+import pytest
+from awokogbon.db import open_db
+
+
+@pytest.mark.parametrize('engine', ['sqlite', 'sqlalchemy'])
+def test_search(client, app, engine):
+    app.config['STORAGE_ENGINE'] = engine  # both search the FTS5 index of `DATABASE`
+    assert client.get('/search').status_code == 200
+
+    response = client.get('/search?q=body')
+    assert b'test title' in response.data
+    assert b'<mark>body</mark>' in response.data
+
+    response = client.get('/search?q=missing')
+    assert b'No posts match' in response.data
+
+
+# user input is never treated as FTS5 query syntax, and post text is escaped around the highlights
+@pytest.mark.parametrize('query', ('"unbalanced', 'body AND OR', 'title:x', '*'))
+def test_search_syntax(client, query):
+    assert client.get('/search', query_string={'q': query}).status_code == 200
+
+
+def test_search_escaped(client, authentication):
+    authentication.login()
+    client.post('/create', data={'title': '<script>alert(1)</script> escaped', 'body': ''})
+    response = client.get('/search?q=escaped')
+    assert b'<script>' not in response.data
+    assert b'&lt;script&gt;' in response.data
+
+
+def test_search_in_sync(client, authentication):
+    authentication.login()
+    client.post('/create', data={'title': 'created', 'body': 'fresh'})
+    assert b'created' in client.get('/search?q=fresh').data
+
+    client.post('/1/update', data={'title': 'updated', 'body': 'changed'})
+    assert b'No posts match' in client.get('/search?q=body').data
+    assert b'updated' in client.get('/search?q=changed').data
+
+    client.post('/1/delete')
+    assert b'No posts match' in client.get('/search?q=changed').data
+
+
+def test_search_pagination(client, app):
+    app.config['POSTS_PER_PAGE'] = 2
+    with app.app_context():
+        db = open_db()
+        db.executemany(
+            'INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)',
+            [('paged {}'.format(i), '') for i in range(3)]
+        )
+        db.commit()
+
+    response = client.get('/search?q=paged')
+    assert response.data.count(b'<article>') == 2
+    assert b'page=2' in response.data
+    response = client.get('/search?q=paged&page=2')
+    assert response.data.count(b'<article>') == 1
+
+
+def test_rebuild_search_index(runner, app):
+    with app.app_context():
+        db = open_db()
+        db.executemany('INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)', [('rebuilt', '')] * 3)
+        db.execute('DELETE FROM post_search')  # as if the index had been lost
+        db.commit()
+
+    result = runner.invoke(args=['rebuild-search-index', '--batch-size', '2'])
+    assert '4 posts' in result.output
+
+    with app.app_context():
+        assert open_db().execute("SELECT COUNT(*) FROM post_search WHERE post_search MATCH 'rebuilt'").fetchone()[0] == 3
+
+
+# test the results link to their post, and only the first `SEARCH_MAX_RESULTS` are paged through
+def test_search_limits(client, app):
+    assert b'href="/1"' in client.get('/search?q=body').data
+
+    app.config.update(POSTS_PER_PAGE=1, SEARCH_MAX_RESULTS=2)
+    with app.app_context():
+        db = open_db()
+        db.executemany('INSERT INTO post (title, body, author_id) VALUES (?, ?, 1)', [('capped', '')] * 3)
+        db.commit()
+    assert b'page=2' in client.get('/search?q=capped').data
+    assert b'page=3' not in client.get('/search?q=capped&page=2').data
+    assert client.get('/search?q=capped&page=3').status_code == 404
+    assert client.get('/search?q=capped&page=99999999999999999999').status_code == 404
@@ -0,0 +1,44 @@
+# unit tests focused on the prefork server [from `server.py`]
+import json
+import signal
+import subprocess
+import sys
+import urllib.request
+from awokogbon.server import rss_bytes
+
+_serve = '''
+import json, sys
+from awokogbon import create_app
+from awokogbon.server import PreforkServer
+PreforkServer(create_app(json.loads(sys.argv[1])), port=0, workers=2, max_requests=2, graceful_timeout=5).run()
+'''
+
+
+def test_rss_bytes():
+    assert rss_bytes() > 0
+    assert rss_bytes(pid=2 ** 22 + 1) is None  # above linux's largest pid
+
+
+# test the workers serve requests, are replaced after `max_requests` and stop cleanly on SIGTERM
+def test_serve(app):
+    config = {name: app.config[name] for name in ('TESTING', 'DATABASE', 'SESSION_FILE_DIR', 'TEMPLATE_BYTECODE_DIR')}
+    process = subprocess.Popen([sys.executable, '-c', _serve, json.dumps(config)], stderr=subprocess.PIPE, universal_newlines=True)
+    try:
+        output = []
+        while 'Serving on' not in ''.join(output[-1:]):
+            output.append(process.stderr.readline())
+            assert output[-1], ''.join(output)
+        url = output[-1].split('Serving on ', 1)[1].split(' ', 1)[0]
+
+        for path in ('/', '/1') * 3:
+            with urllib.request.urlopen(url + path, timeout=10) as response:
+                assert response.status == 200 and b'test title' in response.read()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        output.append(process.communicate(timeout=30)[1])
+
+    output = ''.join(output)
+    assert process.returncode == 0, output
+    assert output.count('exiting after 2 requests') >= 2  # two workers can not serve six requests without being replaced
+    assert output.count(' ready in ') >= 3  # the first two workers, and at least one replacing them
+    assert 'rss ' in output and 'Stopped.' in output
@@ -0,0 +1,108 @@
+# unit tests focused on the session backends `sessions.py`
+# - tests logging in and out works with every backend
+# - tests unmodified sessions are not written back
+# - tests sweeping expired and excess sessions, in the background
+# - tests tampered session ids are never looked up, and logging in regenerates the session id
+
+import threading
+import pytest
+from flask import session
+from awokogbon import sessions
+from awokogbon.db import open_db
+from awokogbon.sessions import FileSystemStore, ServerSideSessionInterface
+
+
+@pytest.mark.parametrize('session_type', ('filesystem', 'sqlite', 'cookie'))
+def test_session_backends(app, client, authentication, session_type):
+    app.config.update(SESSION_TYPE=session_type, SECRET_KEY='test')
+    sessions.init_app(app)  # the session backend is chosen at init time, so rebuild it like `create_app` would
+
+    authentication.login()
+    with client:
+        client.get('/')
+        assert session['user_id'] == 1
+
+    if session_type == 'sqlite':
+        with app.app_context():
+            assert open_db().execute('SELECT COUNT(*) FROM session').fetchone()[0] == 1
+
+    with client:
+        authentication.logout()
+        assert 'user_id' not in session
+
+
+# a request that only reads the session does not write it back [neither to the store nor to the cookie]
+def test_unmodified_session_not_saved(client, authentication, monkeypatch):
+    authentication.login()
+    writes = []
+    monkeypatch.setattr(FileSystemStore, 'set', lambda self, *args: writes.append(args))
+    response = client.get('/')
+    assert writes == []
+    assert 'Set-Cookie' not in response.headers
+
+
+def test_filesystem_sweep(tmpdir):
+    store = FileSystemStore(str(tmpdir))
+    store.set('aa-expired', '{}', 10)
+    store.set('bb-oldest', '{}', 30)
+    store.set('cc-newest', '{}', 40)
+
+    store.sweep(now=20, max_entries=1)
+    assert store.get('aa-expired') == (None, None)
+    assert store.get('bb-oldest') == (None, None)
+    assert store.get('cc-newest') == (None, None)  # still on disk, but expired at the real current time
+    assert [path.basename for path in tmpdir.visit(fil=lambda path: path.isfile())] == ['cc-newest']
+
+
+# a cookie that is not a session id the server made is never turned into a path [or a query], and gets a new session
+@pytest.mark.parametrize('sid', ('../../../../etc/passwd', '..', 'a' * 42, 'a' * 43 + '/'))
+def test_tampered_sid(client, sid, monkeypatch):
+    lookups = []
+    monkeypatch.setattr(FileSystemStore, 'get', lambda self, sid: lookups.append(sid) or (None, None))
+    client.set_cookie('localhost', 'session', sid)
+    with client:
+        client.get('/')
+        assert session.sid != sid
+    assert lookups == []
+
+
+# logging in stores the session under a new id, and drops the one the browser had before [e.g. planted by an attacker]
+def test_login_regenerates_sid(app, client, authentication):
+    store = app.session_interface.store
+    planted = sessions.new_sid()
+    store.set(planted, '{}', 10 ** 12)
+    client.set_cookie('localhost', 'session', planted)
+
+    response = authentication.login()
+    sid = response.headers['Set-Cookie'].split(';')[0].split('=', 1)[1]
+    assert sid != planted
+    assert store.get(planted) == (None, None)
+    assert store.get(sid)[0] is not None
+
+
+# saving a session never sweeps the store itself: a background thread does, every `SESSION_SWEEP_INTERVAL` seconds
+def test_background_sweep(app, client, monkeypatch):
+    swept = threading.Event()
+    monkeypatch.setattr(FileSystemStore, 'sweep', lambda self, now, max_entries: swept.set())
+    interface = ServerSideSessionInterface(app.session_interface.store, sweep_interval=60)
+    monkeypatch.setattr(app, 'session_interface', interface)
+    client.get('/')
+    assert not swept.is_set() and interface._sweeper.is_alive()
+
+    interface = ServerSideSessionInterface(app.session_interface.store, sweep_interval=0.01)
+    monkeypatch.setattr(app, 'session_interface', interface)
+    client.get('/')
+    assert swept.wait(5)
+
+
+# the session backend is only built by the first request, while an unknown backend still fails when the app is created
+def test_lazy_session_backend(app, client):
+    app.config['SESSION_TYPE'] = 'sqlite'
+    sessions.init_app(app)
+    assert app.session_interface._session_interface is None
+    client.get('/')
+    assert isinstance(app.session_interface._session_interface.store, sessions.SqliteStore)
+
+    app.config['SESSION_TYPE'] = 'memcached'
+    with pytest.raises(ValueError):
+        sessions.init_app(app)
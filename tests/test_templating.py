@@ -0,0 +1,53 @@
+# unit tests focused on the compiled templates and fragment cache [from `templating.py`]
+import os
+from awokogbon.db import open_db
+
+
+# test every template is compiled at startup, and kept on disk for the next worker
+def test_precompile(app):
+    assert os.listdir(app.config['TEMPLATE_BYTECODE_DIR'])
+    assert 'blog/index.html' in [name for _, name in app.jinja_env.cache.keys()]
+
+
+# test a post's article is rendered once, then reused until the post is updated
+def test_article_fragment(client, authentication, app):
+    cache = app.jinja_env.fragment_cache
+    authentication.login()  # logged in users skip the page cache, so only the fragment cache is exercised
+
+    assert b'test title' in client.get('/').data
+    assert len(cache._entries) == 1
+
+    with app.app_context():  # a stale fragment keyed by the same post version is served as is
+        key = next(iter(cache._entries))
+        cache.set(key, cache.get(key).replace('test title', 'cached title'))
+    assert b'cached title' in client.get('/').data
+
+    client.post('/1/update', data={'title': 'updated', 'body': ''})
+    response = client.get('/')
+    assert b'updated' in response.data and b'cached title' not in response.data
+    assert len(cache._entries) == 2
+
+
+# test the `Edit` link is not shared between the author and other users
+def test_article_fragment_per_author(client, authentication):
+    authentication.login()
+    assert b'href="/1/update"' in client.get('/').data
+
+    authentication.logout()
+    authentication.login('other', 'other')
+    assert b'href="/1/update"' not in client.get('/').data
+
+
+# test an excerpt re-rendered (or an author renamed) without the post's `updated` changing replaces its article
+def test_article_fragment_unversioned_changes(client, authentication, app, runner):
+    authentication.login()
+    client.get('/')
+    with app.app_context():
+        db = open_db()
+        db.execute("UPDATE post SET body = '*re-rendered*' WHERE id = 1")
+        db.execute("UPDATE user SET username = 'renamed' WHERE id = 1")
+        db.commit()
+    runner.invoke(args=['render-posts', '--all'])
+    runner.invoke(args=['rebuild-listing'])
+    data = client.get('/').data
+    assert b're-rendered' in data and b'by renamed' in data
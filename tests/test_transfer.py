@@ -0,0 +1,97 @@
+# unit tests focused on the import/export commands `transfer.py`
+# - tests `export-posts`/`export-users` in both formats
+# - tests `import-posts`/`import-users` round trip the exports, in batches
+
+import json
+import pytest
+from awokogbon.db import open_db
+
+
+def test_export_posts_ndjson(runner):
+    result = runner.invoke(args=['export-posts'])
+    post = json.loads(result.output.splitlines()[0])
+    assert post['title'] == 'test title'
+    assert post['body'] == 'test\nbody'
+    assert post['created'] == '2018-01-01 00:00:00'
+    assert 'Exported 1 post rows' in result.output
+
+
+@pytest.mark.parametrize('format', ('ndjson', 'csv'))
+def test_round_trip(runner, app, tmpdir, format):
+    with app.app_context():
+        db = open_db()
+        db.executemany('INSERT INTO post (title, body, author_id) VALUES (?, ?, 2)', [('post {}'.format(i), '') for i in range(4)])
+        db.commit()
+
+    users = str(tmpdir.join('users.' + format))
+    posts = str(tmpdir.join('posts.' + format))
+    runner.invoke(args=['export-users', users])
+    runner.invoke(args=['export-posts', posts])
+
+    with app.app_context():
+        db = open_db()
+        db.execute('DELETE FROM post')
+        db.execute('DELETE FROM user')
+        db.commit()
+
+    assert 'Imported 2 user rows' in runner.invoke(args=['import-users', users]).output
+    assert 'Imported 5 post rows' in runner.invoke(args=['import-posts', posts, '--batch-size', '2']).output
+
+    with app.app_context():
+        db = open_db()
+        assert db.execute('SELECT COUNT(*) FROM post WHERE author_id = 2').fetchone()[0] == 4
+        assert db.execute('SELECT body FROM post WHERE id = 1').fetchone()[0] == 'test\nbody'
+        assert db.execute("SELECT password FROM user WHERE username = 'test'").fetchone()[0].startswith('pbkdf2:')
+        assert db.execute("SELECT name FROM sqlite_master WHERE name = 'post_created_id'").fetchone() is not None
+        assert db.execute("SELECT COUNT(*) FROM post_search WHERE post_search MATCH 'post'").fetchone()[0] == 4
+
+
+def test_import_defaults(runner, app, tmpdir):
+    path = tmpdir.join('posts.csv')
+    path.write('title,body,author_id\nimported,,1\n')
+    runner.invoke(args=['import-posts', str(path)])
+
+    with app.app_context():
+        post = open_db().execute("SELECT * FROM post WHERE title = 'imported'").fetchone()
+        assert post['id'] == 2
+        assert post['body'] == ''
+        assert post['created'] is not None
+
+
+# test importing a user whose username belongs to another user id fails clearly, and never replaces (or orphans) that user
+def test_import_user_conflict(runner, app, tmpdir):
+    path = tmpdir.join('users.csv')
+    path.write('id,username,password\n1,test,updated\n7,imported,x\n')
+    assert 'Imported 2 user rows' in runner.invoke(args=['import-users', str(path)]).output
+
+    path.write('id,username,password\n9,test,x\n')
+    result = runner.invoke(args=['import-users', str(path)])
+    assert result.exit_code != 0 and 'conflicts with existing users' in result.output
+    with app.app_context():
+        db = open_db()
+        assert db.execute("SELECT id, password FROM user WHERE username = 'test'").fetchone()[:] == (1, 'updated')
+        assert db.execute('SELECT author_id FROM post WHERE id = 1').fetchone()[0] == 1
+
+
+# test the json api's own (`T` separated) timestamps import, and are stored so every view still reads them back
+def test_import_api_output(runner, client, app, tmpdir):
+    posts = json.loads(client.get('/api/posts').data)['posts']
+    assert 'T' in posts[0]['created']
+    path = tmpdir.join('posts.ndjson')
+    path.write(''.join(json.dumps(dict(post, id=None, title='copy')) + '\n' for post in posts))
+    assert 'Imported 1 post rows' in runner.invoke(args=['import-posts', str(path)]).output
+
+    with app.app_context():
+        assert open_db().execute("SELECT created FROM post WHERE title = 'copy'").fetchone()[0].isoformat() == posts[0]['created']
+    for url in ('/', '/feed.atom', '/api/posts'):
+        assert client.get(url).status_code == 200
+
+
+@pytest.mark.parametrize('created', ('yesterday', '2018-13-01 00:00:00', 5))
+def test_import_invalid_timestamp(runner, app, tmpdir, created):
+    path = tmpdir.join('posts.ndjson')
+    path.write(json.dumps({'title': 'bad', 'body': '', 'author_id': 1, 'created': created}) + '\n')
+    result = runner.invoke(args=['import-posts', str(path)])
+    assert result.exit_code != 0 and 'post record 1 has an invalid created timestamp' in result.output
+    with app.app_context():
+        assert open_db().execute("SELECT COUNT(*) FROM post WHERE title = 'bad'").fetchone()[0] == 0